@@ -13,4 +13,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'bookmine.settings.dev')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from store.asgi import DownloadApplication  # noqa: E402
+
+application = DownloadApplication(django_application)
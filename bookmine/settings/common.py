@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 import os
 
@@ -36,6 +37,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ReadYourWritesMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -104,6 +107,101 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# How product files are sent once a download is authorized. Use
+# 'store.delivery.XAccelRedirectDelivery' (with OPTIONS {'LOCATION': ...})
+# behind nginx or 'store.delivery.XSendfileDelivery' behind Apache.
+STORE_FILE_DELIVERY = {
+    'BACKEND': 'store.delivery.InProcessDelivery',
+}
+
+# PDFs downloaded by customers are stamped with TEXT (formatted with the
+# buyer's name and email) at the foot of every page, by appending an
+# incremental update to the stored file instead of rewriting it. The
+# updates and the page layouts they are built from are kept in a
+# per-process LRU cache of up to CACHE_SIZE bytes. Only InProcessDelivery
+# stamps files; the X-Accel and X-Sendfile backends send them as stored.
+STORE_WATERMARKS = {
+    'ENABLED': True,
+    'TEXT': 'Licensed to {name} <{email}>',
+    'CACHE_SIZE': 64 * 1024 * 1024,
+}
+
+# Download links are signed with KEYS[CURRENT_KEY] and accepted with any
+# key in KEYS (ids may not contain ":"). To rotate, add a key, make it
+# current and remove the old one MAX_AGE seconds later. Without KEYS,
+# links are signed with SECRET_KEY.
+STORE_DOWNLOAD_LINKS = {
+    'KEYS': {},
+    'CURRENT_KEY': None,
+    'MAX_AGE': 5 * 60,
+}
+
+# Resumable uploads keep partial files in this directory of the default
+# storage, which has to be a local filesystem storage.
+STORE_UPLOADS = {
+    'DIRECTORY': 'store/uploads',
+    'MAX_SIZE': 2 * 1024 ** 3,
+}
+
+# Users provisioned through the staff endpoint are hashed in the request,
+# next to logins, so it takes files of up to MAX_ROWS rows. Bigger files
+# go through the provision_users command.
+STORE_PROVISIONING = {
+    'MAX_ROWS': 100,
+}
+
+# Databases other than 'default' listed in REPLICAS serve the safe
+# requests of views using core.db.routing.ReplicaReadMixin. After a write,
+# the user's reads stay on the primary for MAX_LAG seconds, and so do the
+# responses rebuilt for the response cache.
+DATABASE_ROUTERS = ['core.db.routing.ReplicaRouter']
+
+DATABASE_REPLICATION = {
+    'REPLICAS': [],
+    'MAX_LAG': 5,
+}
+
+# Caches
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# The default cache is invalidated across workers (product ownership,
+# read-your-writes pins, link revocations), so production shares it; see
+# prod.py.
+# The response cache can point at any Django cache backend, e.g.
+# django.core.cache.backends.filebased.FileBasedCache with a directory or
+# django.core.cache.backends.redis.RedisCache with redis://host:6379.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': os.environ.get(
+            'RESPONSE_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('RESPONSE_CACHE_LOCATION', 'responses'),
+    },
+    # Token revocation markers have to outlive the refresh tokens they
+    # revoke, so this cache must never cull them; see prod.py.
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tokens',
+        'OPTIONS': {'MAX_ENTRIES': 1_000_000},
+    },
+    'throttles': {
+        'BACKEND': os.environ.get(
+            'THROTTLE_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('THROTTLE_CACHE_LOCATION', 'throttles'),
+    }
+}
+
+STORE_RESPONSE_CACHE = {
+    'ALIAS': 'responses',
+    'TIMEOUT': 60 * 60,
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
@@ -111,12 +209,93 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'core.User'
 
+AUTHENTICATION_BACKENDS = ['core.authentication.PooledModelBackend']
+
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_TO_STRING': False,
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication'
+        'core.authentication.StatelessJWTAuthentication'
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'core.throttling.RateThrottle'
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
+    'PAGE_SIZE': 20,
+    # Proxies in front of the app that append to X-Forwarded-For. With 0
+    # the header is ignored, as clients can send any value in it.
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0))
+}
+
+# Access tokens carry user_id, customer_id and is_staff so requests are
+# authenticated without a database query. Revocations are kept in the
+# 'tokens' cache, which has to be shared by all workers in production.
+# Refreshing a token loads its user, so inactive users and tokens issued
+# before a password change cannot be refreshed.
+SIMPLE_JWT = {
+    'ACCESS_TOKEN_LIFETIME': timedelta(minutes=5),
+    'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
+    'TOKEN_OBTAIN_SERIALIZER': 'core.serializers.TokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'core.serializers.TokenRefreshSerializer',
+    'TOKEN_USER_CLASS': 'core.authentication.TokenUser',
+}
+
+# Requests to the routes in RATES, named by URL name or by the view's
+# throttle_scope, are limited per principal: 'user' and 'customer' come
+# from the access token and 'ip' from REMOTE_ADDR, or from X-Forwarded-For
+# behind REST_FRAMEWORK['NUM_PROXIES'] proxies. Rates read
+# '<requests>/<period>', e.g. '20/min' or '5/10s'. Counts are kept in the
+# ALIAS cache, which has to be shared by all workers, or each one allows
+# the full rate; prod.py keeps them in Redis and `manage.py check` warns
+# about a per-process cache outside DEBUG.
+THROTTLES = {
+    'ALIAS': 'throttles',
+    'RATES': {
+        'token_obtain_pair': {'ip': '20/min'},
+        'token_refresh': {'ip': '60/min'},
+        'signup': {'ip': '20/hour'},
+        'product-files-detail': {'customer': '60/min', 'ip': '300/min'},
+        'product-files-link': {'customer': '60/min'},
+        'signed-download': {'ip': '120/min'},
+    },
+}
+
+# Passwords are hashed and checked in this many worker processes per web
+# process, or in the request thread when 0. Every web process has its own
+# pool, so keep WORKERS times the web processes of a host below its cores
+# to leave CPU for other requests during a burst of logins. Up to
+# QUEUE_SIZE more (a few hashes' worth of waiting, at about 0.3s each)
+# wait for a worker; past that, signups and logins get a 503 asking to
+# retry after RETRY_AFTER seconds.
+PASSWORD_HASHING = {
+    'WORKERS': int(os.environ.get('PASSWORD_HASHING_WORKERS', 1)),
+    'QUEUE_SIZE': int(os.environ.get('PASSWORD_HASHING_QUEUE_SIZE', 4)),
+    'RETRY_AFTER': 1,
+}
+
+# Background jobs run by `manage.py run_jobs`. A job that fails is retried
+# after RETRY_DELAY seconds, doubling each time up to MAX_RETRY_DELAY,
+# until it has run MAX_ATTEMPTS times. Jobs running for longer than LEASE
+# seconds are taken to have lost their worker and are queued again. Idle
+# workers look for due jobs every POLL_INTERVAL seconds.
+JOBS = {
+    'MAX_ATTEMPTS': 5,
+    'RETRY_DELAY': 10,
+    'MAX_RETRY_DELAY': 60 * 60,
+    'LEASE': 15 * 60,
+    'POLL_INTERVAL': 1,
+}
+
+# Upper bound for the ?page_size= query parameter on list endpoints.
+PAGINATION_MAX_PAGE_SIZE = 100
+
+METRICS = {
+    # Each worker process writes its metrics to a file here so /metrics
+    # can add them up. Without it they stay in the serving process only.
+    'DIRECTORY': os.environ.get('METRICS_DIRECTORY'),
+    'FLUSH_INTERVAL': 5,
+    # When set, /metrics requires "Authorization: Bearer <token>".
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
 }
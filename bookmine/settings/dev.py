@@ -7,11 +7,32 @@ SECRET_KEY = 'django-insecure-7oeaf8v06tpsd-)st!ifgr)vc(pt_o9jqm#67u-veor$5wtb9b
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'core.db.backends.postgresql',
         'NAME': os.environ['POSTGRES_DB'],
         'USER': os.environ['POSTGRES_USER'],
         'PASSWORD': os.environ['POSTGRES_PASSWORD'],
         'HOST': 'db',
         'PORT': '5432',
+        # Connections go back to the pool at the end of each request.
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MAX_SIZE': 10,
+            'TIMEOUT': 10,
+            'CHECK_AFTER': 30,
+            'MAX_AGE': 30 * 60,
+        },
     }
 }
+
+# A second local database can stand in for a replica, e.g. with
+# POSTGRES_REPLICA_DB=bookmine_replica.
+if 'POSTGRES_REPLICA_DB' in os.environ:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['POSTGRES_REPLICA_DB'],
+        'HOST': os.environ.get('POSTGRES_REPLICA_HOST', 'db'),
+    }
+    DATABASE_REPLICATION = {
+        **DATABASE_REPLICATION,
+        'REPLICAS': ['replica'],
+    }
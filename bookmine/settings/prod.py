@@ -5,4 +5,78 @@ DEBUG = False
 
 ALLOWED_HOSTS = []
 
-SECRET_KEY = os.environ['SECRET_KEY']
\ No newline at end of file
+SECRET_KEY = os.environ['SECRET_KEY']
+
+# Comma separated "id=key" pairs; the last one signs new download links.
+DOWNLOAD_LINK_KEYS = [
+    pair.partition('=')
+    for pair in os.environ.get('DOWNLOAD_LINK_KEYS', '').split(',') if pair
+]
+if DOWNLOAD_LINK_KEYS:
+    STORE_DOWNLOAD_LINKS = {
+        **STORE_DOWNLOAD_LINKS,
+        'KEYS': {key_id: key for (key_id, _, key) in DOWNLOAD_LINK_KEYS},
+        'CURRENT_KEY': DOWNLOAD_LINK_KEYS[-1][0],
+    }
+
+# Caches every worker has to see the same values in: the default cache
+# holds product ownership, read-your-writes pins and download link
+# revocations, which are invalidated by whichever worker made the change,
+# and rate limits only hold if all workers count in the same place.
+# Token revocations must outlive the refresh tokens they revoke, so
+# TOKEN_CACHE_URL should name a Redis server (or database) run with
+# maxmemory-policy noeviction.
+REDIS_URL = os.environ['REDIS_URL']
+CACHES = {
+    **CACHES,
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    },
+    'tokens': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('TOKEN_CACHE_URL', REDIS_URL),
+    },
+    'throttles': {
+        'BACKEND': os.environ.get(
+            'THROTTLE_CACHE_BACKEND',
+            'django.core.cache.backends.redis.RedisCache'
+        ),
+        'LOCATION': os.environ.get('THROTTLE_CACHE_LOCATION', REDIS_URL),
+    },
+}
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'core.db.backends.postgresql',
+        'NAME': os.environ['POSTGRES_DB'],
+        'USER': os.environ['POSTGRES_USER'],
+        'PASSWORD': os.environ['POSTGRES_PASSWORD'],
+        'HOST': os.environ['POSTGRES_HOST'],
+        'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+        # Connections go back to the pool at the end of each request.
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get('POSTGRES_POOL_SIZE', 10)),
+            'TIMEOUT': 10,
+            'CHECK_AFTER': 30,
+            'MAX_AGE': 30 * 60,
+        },
+    }
+}
+
+# Comma separated hosts of streaming replicas of the primary.
+REPLICA_HOSTS = [
+    host for host in os.environ.get('POSTGRES_REPLICA_HOSTS', '').split(',')
+    if host
+]
+for (number, host) in enumerate(REPLICA_HOSTS):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICATION = {
+    **DATABASE_REPLICATION,
+    'REPLICAS': [f'replica{number}' for number in range(len(REPLICA_HOSTS))],
+}
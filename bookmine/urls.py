@@ -15,8 +15,10 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from core.views import metrics
 
 urlpatterns = [
+    path('metrics', metrics, name='metrics'),
     path('auth/', include('core.urls')),
     path('admin/', admin.site.urls),
     path('store/', include('store.urls'))
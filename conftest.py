@@ -0,0 +1,68 @@
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    from store import watermark
+    for cache in [*caches.all(), watermark.cache]:
+        cache.clear()
+    yield
+    for cache in [*caches.all(), watermark.cache]:
+        cache.clear()
+
+
+@pytest.fixture
+def query_budget():
+    """
+    Asserts that `request()` stays within `max_queries` and that calling
+    `grow()` to add more rows does not change how many queries it runs.
+    """
+    def do(max_queries, request, grow):
+        with CaptureQueriesContext(connection) as before:
+            request()
+        grow()
+        with CaptureQueriesContext(connection) as after:
+            request()
+
+        queries = '\n'.join(query['sql'] for query in after.captured_queries)
+        assert len(after) <= max_queries, \
+            f'{len(after)} queries, budget is {max_queries}:\n{queries}'
+        assert len(after) == len(before), \
+            f'{len(before)} queries grew to {len(after)}:\n{queries}'
+    return do
+
+
+@pytest.fixture
+def metrics():
+    """
+    Clears the metrics registry and returns a function reading the value
+    of a metric by name and labels.
+    """
+    from core.metrics import registry
+    for metric in registry.metrics:
+        metric.values.clear()
+
+    def get(name, *labels):
+        return registry.collect()[f'bookmine_{name}'].get(labels)
+    return get
+
+
+@pytest.fixture(autouse=True)
+def read_from_primary(request, settings):
+    """
+    Keeps reads on the primary in tests that are not allowed to query the
+    replicas.
+    """
+    marker = request.node.get_closest_marker('django_db')
+    databases = marker.kwargs.get('databases', ()) if marker else ()
+    if databases != '__all__':
+        settings.DATABASE_REPLICATION = {
+            **settings.DATABASE_REPLICATION,
+            'REPLICAS': [
+                alias for alias in settings.DATABASE_REPLICATION['REPLICAS']
+                if alias in databases
+            ]
+        }
@@ -1,7 +1,14 @@
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib import admin
-from core.models import User
+from core.models import Job, User
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
-    pass
\ No newline at end of file
+    pass
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_at', 'worker']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'dedupe_key']
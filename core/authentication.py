@@ -0,0 +1,125 @@
+import time
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser as BaseTokenUser
+from rest_framework_simplejwt.settings import api_settings
+from .hashing import hash_password, verify_password
+from .models import User
+
+
+def _revocation_key(user_id):
+    return f'core:tokens-revoked:{user_id}'
+
+
+def get_revocation_cache():
+    return caches['tokens']
+
+
+def get_password_fingerprint(encoded_password):
+    """
+    Returns a digest of the user's password hash for tokens to carry, so a
+    refresh after the password changed can be told apart.
+    """
+    return salted_hmac(
+        'core.authentication.password', encoded_password).hexdigest()[:20]
+
+
+def revoke_user_tokens(user_id):
+    """
+    Rejects every token issued to the user up to now. The marker lives as
+    long as a refresh token, so it also covers tokens refreshed later.
+    """
+    def revoke():
+        get_revocation_cache().set(
+            _revocation_key(user_id),
+            time.time(),
+            int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+        )
+
+    revoke()
+    transaction.on_commit(revoke)
+
+
+def is_token_revoked(token):
+    revoked_at = get_revocation_cache().get(
+        _revocation_key(token.get(api_settings.USER_ID_CLAIM)))
+    if revoked_at is None:
+        return False
+    if 'auth_time' in token:
+        return token['auth_time'] < revoked_at
+    # `iat` only has second precision.
+    return token.get('iat', 0) <= revoked_at
+
+
+def check_token_not_revoked(token):
+    if is_token_revoked(token):
+        raise AuthenticationFailed(
+            'Token has been revoked.', code='token_revoked')
+
+
+def check_token_user(token):
+    """
+    Rejects a refresh token whose user is gone, inactive or has changed
+    password since it was issued, with one query. Unlike the revocation
+    markers, this does not depend on what the cache still holds.
+    """
+    user = User.objects.filter(
+        pk=token.get(api_settings.USER_ID_CLAIM)
+    ).values('is_active', 'password').first()
+    if user is None or not user['is_active'] or not constant_time_compare(
+            token.get('pwd', ''), get_password_fingerprint(user['password'])):
+        raise AuthenticationFailed(
+            'User is inactive or its password has changed.',
+            code='user_inactive')
+
+
+class TokenUser(BaseTokenUser):
+    """
+    The user behind a validated access token, built from its claims
+    without touching the database.
+    """
+
+    @cached_property
+    def customer_id(self):
+        return self.token.get('customer_id')
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        check_token_not_revoked(validated_token)
+        return user
+
+
+class PooledModelBackend(ModelBackend):
+    """
+    ModelBackend with passwords checked in the hashing pool instead of the
+    request thread.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # Costs as much as a wrong password, so timing does not tell
+            # which usernames exist.
+            hash_password(password)
+            return None
+
+        (correct, must_update) = verify_password(password, user.password)
+        if not correct:
+            return None
+        if must_update:
+            # What User.check_password does for a correct password.
+            user.password = hash_password(password)
+            user.save(update_fields=['password'])
+        return user if self.user_can_authenticate(user) else None
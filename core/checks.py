@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+LOCAL_BACKENDS = ['django.core.cache.backends.locmem.LocMemCache']
+
+
+def get_shared_caches():
+    """
+    Returns the cache aliases every worker has to share, with what breaks
+    when each keeps its own.
+    """
+    return {
+        'default': 'ownership and revocations only change in the worker '
+                   'that made the change',
+        'tokens': 'revoked tokens stay valid in other workers',
+        settings.THROTTLES['ALIAS']: 'rate limits are multiplied by the '
+                                     'number of workers',
+    }
+
+
+@register(Tags.caches)
+def check_shared_caches(app_configs, **kwargs):
+    if settings.DEBUG:
+        return []
+    return [
+        Warning(
+            f"The '{alias}' cache is local to each process: {problem}.",
+            hint='Use a shared backend such as '
+                 'django.core.cache.backends.redis.RedisCache.',
+            id='core.W001')
+        for (alias, problem) in get_shared_caches().items()
+        if settings.CACHES.get(alias, {}).get('BACKEND') in LOCAL_BACKENDS
+    ]
@@ -0,0 +1,43 @@
+from django.db.backends.postgresql import base, creation
+from core.db.pool import close_pools, get_pool
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Pooled connections to the test database would block the drop.
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    The PostgreSQL backend with a pool of connections per process, set
+    up with a POOL dict (MAX_SIZE, TIMEOUT, CHECK_AFTER, MAX_AGE) in the
+    database settings. Closing the connection, which Django does at the
+    end of each request with CONN_MAX_AGE = 0, gives it back to the pool.
+    """
+
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self, conn_params):
+        options = self.settings_dict.get('POOL')
+        if options is None:
+            return super().get_new_connection(conn_params)
+
+        self.pool = get_pool(
+            self.alias, conn_params,
+            lambda: super(DatabaseWrapper, self).get_new_connection(
+                conn_params),
+            options)
+        connection = self.pool.acquire()
+        if not hasattr(self, 'isolation_level'):
+            self.isolation_level = self.settings_dict['OPTIONS'].get(
+                'isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        pool = getattr(self, 'pool', None)
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            pool.release(self.connection)
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from psycopg2 import OperationalError, extensions
+
+# Pools of this process by database alias and connection parameters.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    Keeps up to `max_size` open connections to one database and hands
+    them to the threads that need one. A connection that sat idle for
+    more than `check_after` seconds is checked with a SELECT 1 before it
+    is handed out again, and one older than `max_age` seconds is closed,
+    so connections broken by a restart or failover never reach a request.
+    """
+
+    def __init__(self, connect, max_size=10, timeout=10, check_after=30,
+                 max_age=30 * 60):
+        self.connect = connect
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_age = max_age
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.lock = threading.Lock()
+        # (connection, opened at, returned at), most recently used last.
+        self.idle = []
+        self.opened_at = {}
+
+    def acquire(self):
+        if not self.slots.acquire(timeout=self.timeout):
+            raise OperationalError(
+                f'No database connection was free within {self.timeout}s.')
+        try:
+            while True:
+                with self.lock:
+                    item = self.idle.pop() if self.idle else None
+                if item is None:
+                    connection = self.connect()
+                    self.opened_at[id(connection)] = time.monotonic()
+                    return connection
+                if self.is_healthy(*item):
+                    return item[0]
+                self.discard(item[0])
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, connection):
+        try:
+            if connection.closed:
+                self.discard(connection)
+                return
+            status = connection.info.transaction_status
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    connection.rollback()
+                except Exception:
+                    self.discard(connection)
+                    return
+            opened_at = self.opened_at.get(id(connection), 0)
+            with self.lock:
+                self.idle.append((connection, opened_at, time.monotonic()))
+        finally:
+            self.slots.release()
+
+    def is_healthy(self, connection, opened_at, returned_at):
+        now = time.monotonic()
+        if connection.closed or now - opened_at > self.max_age:
+            return False
+        if now - returned_at < self.check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except Exception:
+            return False
+        return True
+
+    def discard(self, connection):
+        self.opened_at.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def close(self):
+        with self.lock:
+            (idle, self.idle) = (self.idle, [])
+        for (connection, _, _) in idle:
+            self.discard(connection)
+
+
+def get_pool(alias, conn_params, connect, options):
+    key = (os.getpid(), alias, tuple(sorted(
+        (name, str(value)) for (name, value) in conn_params.items())))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ConnectionPool(connect, **{
+                    name.lower(): value for (name, value) in options.items()
+                })
+    return pool
+
+
+def close_pools(database_name=None):
+    """
+    Closes the idle connections of every pool, or only of the pools
+    connected to `database_name`.
+    """
+    for (key, pool) in list(_pools.items()):
+        if database_name is None or ('database', database_name) in key[2]:
+            pool.close()
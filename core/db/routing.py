@@ -0,0 +1,77 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+# Where reads of the current request go; None means the primary.
+_read_database = ContextVar('read_database', default=None)
+
+
+def _pin_key(user_id):
+    return f'core:db:primary:{user_id}'
+
+
+def get_replicas():
+    return settings.DATABASE_REPLICATION['REPLICAS']
+
+
+@contextmanager
+def read_from(alias):
+    token = _read_database.set(alias)
+    try:
+        yield
+    finally:
+        _read_database.reset(token)
+
+
+def pin_to_primary(user_id):
+    """
+    Sends the reads of `user_id` to the primary until the replicas have
+    caught up with what they just wrote.
+    """
+    cache.set(_pin_key(user_id), True,
+              settings.DATABASE_REPLICATION['MAX_LAG'])
+
+
+def is_pinned(user_id):
+    return cache.get(_pin_key(user_id), False)
+
+
+class ReplicaRouter:
+    """
+    Reads go wherever `read_from` points for the current request or task,
+    the primary by default; writes always go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_database.get() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class ReplicaReadMixin:
+    """
+    Serves the safe requests of a view from a replica, unless the user
+    wrote something recently enough that a replica may not have it yet.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        with read_from(None):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        replicas = get_replicas()
+        if not replicas or request.method not in SAFE_METHODS:
+            return
+        user_id = request.user.id
+        if user_id is not None and is_pinned(user_id):
+            return
+        _read_database.set(random.choice(replicas))
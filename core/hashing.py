@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .metrics import (
+    PASSWORD_HASH_DURATION, PASSWORD_HASH_QUEUE_DEPTH, PASSWORD_HASH_REJECTED,
+    PASSWORD_HASH_WAIT, registry)
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many passwords are being checked, try again shortly.'
+    default_code = 'hashing_busy'
+
+    def __init__(self):
+        super().__init__()
+        # Sent as Retry-After.
+        self.wait = settings.PASSWORD_HASHING['RETRY_AFTER']
+
+
+class HashingPool:
+    """
+    A process pool that takes at most `workers + queue_size` jobs at a
+    time and turns any more away instead of queueing them, or has them
+    wait for a free slot.
+    """
+
+    def __init__(self, workers, queue_size):
+        # Workers set Django up themselves when they are not forked.
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=django.setup)
+        self.capacity = workers + queue_size
+        self.pending = 0
+        self.free = threading.Condition()
+        self.pid = os.getpid()
+
+    def submit(self, function, *args, wait=False):
+        """
+        Returns the future of `function(*args)` and the number of jobs
+        that were pending before it. When the pool is full, raises
+        HashingBusy, or waits for a free slot with `wait`.
+        """
+        with self.free:
+            if wait:
+                self.free.wait_for(lambda: self.pending < self.capacity)
+            elif self.pending >= self.capacity:
+                raise HashingBusy()
+            depth = self.pending
+            self.pending += 1
+        try:
+            future = self.executor.submit(function, *args)
+        except BaseException:
+            self.done(None)
+            raise
+        future.add_done_callback(self.done)
+        return (future, depth)
+
+    def done(self, future):
+        with self.free:
+            self.pending -= 1
+            self.free.notify()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Passwords sent to a worker of a batch_executor at once.
+BATCH_CHUNK_SIZE = 8
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_workers():
+    return settings.PASSWORD_HASHING['WORKERS']
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = HashingPool(
+                get_workers(), settings.PASSWORD_HASHING['QUEUE_SIZE'])
+        return _pool
+
+
+def discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown()
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    return (function(*args), time.perf_counter() - start)
+
+
+def _check_password(password, encoded):
+    updates = []
+    return (check_password(password, encoded, updates.append), bool(updates))
+
+
+def run(operation, function, *args, wait=False):
+    """
+    Runs `function(*args)` in the hashing pool and waits for the result,
+    without holding the GIL. Raises HashingBusy when the pool is full,
+    unless `wait` has it wait for a free slot.
+    """
+    registry.check_fork()
+    start = time.perf_counter()
+    if settings.PASSWORD_HASHING['WORKERS'] == 0:
+        (result, duration) = _timed(function, *args)
+    else:
+        pool = get_pool()
+        try:
+            (future, depth) = pool.submit(_timed, function, *args, wait=wait)
+        except HashingBusy:
+            PASSWORD_HASH_REJECTED.inc(operation)
+            raise
+        PASSWORD_HASH_QUEUE_DEPTH.observe(depth, operation)
+        try:
+            (result, duration) = future.result()
+        except BrokenProcessPool:
+            # A worker died; the next job starts a new pool.
+            discard_pool(pool)
+            PASSWORD_HASH_REJECTED.inc(operation)
+            raise HashingBusy()
+    PASSWORD_HASH_DURATION.observe(duration, operation)
+    PASSWORD_HASH_WAIT.observe(
+        time.perf_counter() - start - duration, operation)
+    return result
+
+
+def hash_password(password):
+    return run('hash', make_password, password)
+
+
+def verify_password(password, encoded):
+    """
+    Returns whether `password` matches `encoded`, and whether `encoded`
+    should be rehashed with the preferred hasher.
+    """
+    return run('check', _check_password, password, encoded)
+
+
+def batch_executor(workers):
+    """
+    Returns a process pool of its own for hash_passwords, apart from the
+    one logins are checked in.
+    """
+    return ProcessPoolExecutor(max_workers=workers, initializer=django.setup)
+
+
+def hash_passwords(passwords, executor=None):
+    """
+    Hashes `passwords` with make_password and returns an iterator of
+    hashes in the same order. With an `executor` from batch_executor, the
+    whole batch is hashed there and the work starts right away, so the
+    caller can do something else while it runs. Otherwise the passwords go
+    through the hashing pool one at a time as they are read, each waiting
+    for a free slot, so a batch holds at most one of the slots logins and
+    signups are checked in and they still get turned away when it is full.
+    """
+    passwords = list(passwords)
+    if executor is not None:
+        return executor.map(
+            make_password, passwords, chunksize=BATCH_CHUNK_SIZE)
+    return (
+        run('hash', make_password, password, wait=True)
+        for password in passwords
+    )
@@ -0,0 +1,244 @@
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import timedelta
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+from .metrics import (
+    JOB_DURATION, JOB_LATENCY, JOBS_ENQUEUED, JOBS_PROCESSED, Gauge,
+    registry)
+from .models import Job
+
+TASKS = {}
+PENDING = [Job.QUEUED, Job.RUNNING]
+
+
+def task(name, max_attempts=None):
+    """
+    Registers the decorated function as the task `name`. Tasks take JSON
+    serializable keyword arguments and can run more than once (after a
+    worker dies, for one), so they have to be idempotent.
+    """
+    def register(function):
+        TASKS[name] = (function, max_attempts)
+        return function
+    return register
+
+
+def get_max_attempts(name):
+    if name not in TASKS:
+        raise KeyError(f'Unknown task: {name}')
+    return TASKS[name][1] or settings.JOBS['MAX_ATTEMPTS']
+
+
+def enqueue(name, kwargs=None, dedupe_key=None, delay=0):
+    """
+    Adds a job running task `name` with `kwargs` in `delay` seconds. While
+    a job with the same `dedupe_key` is queued or running, returns that
+    one instead.
+    """
+    job = Job(
+        name=name,
+        kwargs=kwargs or {},
+        dedupe_key=dedupe_key,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=get_max_attempts(name)
+    )
+    if dedupe_key is None:
+        job.save()
+    else:
+        try:
+            with transaction.atomic():
+                job.save()
+        except IntegrityError:
+            existing = Job.objects.filter(
+                dedupe_key=dedupe_key, status__in=PENDING).first()
+            if existing is not None:
+                return existing
+            # It finished in between.
+            job.save()
+    JOBS_ENQUEUED.inc(name)
+    return job
+
+
+def enqueue_many(name, kwargs_list, dedupe_keys=None):
+    """
+    Adds a job for each of `kwargs_list` in one insert, skipping those
+    whose dedupe key is taken. Returns how many were offered.
+    """
+    now = timezone.now()
+    max_attempts = get_max_attempts(name)
+    dedupe_keys = dedupe_keys or [None] * len(kwargs_list)
+    Job.objects.bulk_create(
+        [
+            Job(name=name, kwargs=kwargs, dedupe_key=dedupe_key, run_at=now,
+                max_attempts=max_attempts)
+            for (kwargs, dedupe_key) in zip(kwargs_list, dedupe_keys)
+        ],
+        ignore_conflicts=any(dedupe_keys)
+    )
+    JOBS_ENQUEUED.inc(name, amount=len(kwargs_list))
+    return len(kwargs_list)
+
+
+def claim(worker, limit=1):
+    """
+    Marks up to `limit` due jobs as running on `worker` and returns them,
+    oldest first. Concurrent workers never get the same job.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(
+        status=Job.QUEUED, run_at__lte=now).order_by('run_at', 'id')
+    taken = {'status': Job.RUNNING, 'worker': worker, 'locked_at': now,
+             'attempts': F('attempts') + 1}
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            jobs = list(due.select_for_update(skip_locked=True)[:limit])
+            Job.objects.filter(id__in=[job.id for job in jobs]).update(**taken)
+    else:
+        # Without row locks (SQLite), a job is ours if it is still queued
+        # when we take it; SQLite runs one write at a time.
+        jobs = [
+            job for job in due[:limit]
+            if Job.objects.filter(id=job.id, status=Job.QUEUED).update(**taken)
+        ]
+
+    for job in jobs:
+        (job.status, job.worker, job.locked_at) = (Job.RUNNING, worker, now)
+        job.attempts += 1
+    return jobs
+
+
+def release(jobs):
+    """
+    Puts claimed jobs that were not run back in the queue.
+    """
+    Job.objects.filter(
+        id__in=[job.id for job in jobs], status=Job.RUNNING
+    ).update(status=Job.QUEUED, worker='', locked_at=None,
+             attempts=F('attempts') - 1)
+
+
+def requeue_stale():
+    """
+    Queues again the jobs that have been running longer than the lease,
+    whose worker is taken to have died, or fails them when they are out
+    of attempts.
+    """
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=timezone.now() - timedelta(
+            seconds=settings.JOBS['LEASE'])
+    )
+    error = 'Worker lost.'
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, last_error=error)
+    requeued = stale.update(
+        status=Job.QUEUED, worker='', locked_at=None, last_error=error)
+    return failed + requeued
+
+
+def get_retry_delay(attempts):
+    config = settings.JOBS
+    delay = min(config['RETRY_DELAY'] * 2 ** (attempts - 1),
+                config['MAX_RETRY_DELAY'])
+    # Jitter, so jobs that failed together do not all retry together.
+    return delay * random.uniform(0.5, 1)
+
+
+def run_job(job):
+    """
+    Runs a claimed job, then deletes it, schedules a retry or marks it
+    failed. Returns the outcome.
+    """
+    registry.check_fork()
+    JOB_LATENCY.observe(
+        max((timezone.now() - job.run_at).total_seconds(), 0), job.name)
+    start = time.perf_counter()
+    try:
+        (function, _) = TASKS[job.name]
+        function(**job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            outcome = 'retry'
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.QUEUED, worker='', locked_at=None,
+                last_error=error,
+                run_at=timezone.now() + timedelta(
+                    seconds=get_retry_delay(job.attempts)))
+        else:
+            outcome = 'failed'
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.FAILED, last_error=error)
+    else:
+        outcome = 'done'
+        Job.objects.filter(pk=job.pk).delete()
+    JOB_DURATION.observe(time.perf_counter() - start, job.name)
+    JOBS_PROCESSED.inc(job.name, outcome)
+    return outcome
+
+
+class Worker:
+    def __init__(self, batch_size=1, poll_interval=None):
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval or settings.JOBS['POLL_INTERVAL']
+        self.stopping = False
+        self.processed = 0
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def run(self, burst=False, max_jobs=None):
+        """
+        Runs jobs until stopped, until `max_jobs` have run, or until none
+        is due with `burst`. Returns how many ran.
+        """
+        registry.check_fork()
+        checked_at = 0
+        while not self.stopping and (
+                max_jobs is None or self.processed < max_jobs):
+            if time.monotonic() - checked_at >= self.poll_interval * 10:
+                checked_at = time.monotonic()
+                requeue_stale()
+            limit = self.batch_size
+            if max_jobs is not None:
+                limit = min(limit, max_jobs - self.processed)
+            jobs = claim(self.name, limit)
+            if not jobs:
+                registry.maybe_flush()
+                if burst:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            for (index, job) in enumerate(jobs):
+                if self.stopping:
+                    release(jobs[index:])
+                    break
+                run_job(job)
+                self.processed += 1
+            registry.maybe_flush()
+        return self.processed
+
+
+def count_jobs():
+    return {
+        (name, status): count
+        for (name, status, count) in (
+            Job.objects
+            .values_list('name', 'status')
+            .annotate(count=Count('id'))
+            .order_by()
+        )
+    }
+
+
+JOBS = registry.register(Gauge(
+    'jobs', 'Background jobs waiting, running or failed, by task.',
+    ['name', 'status'], count_jobs))
@@ -0,0 +1,107 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.utils import timezone
+from core.jobs import Worker, enqueue, enqueue_many, task
+from core.models import Job
+
+
+@task('core.benchmark')
+def benchmark_job(seconds=0):
+    if seconds:
+        time.sleep(seconds)
+
+
+def work(batch_size):
+    Worker(batch_size).run(burst=True)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Reports how many background jobs per second a throwaway '
+            'database takes one at a time and in bulk, and how many it '
+            'runs with growing numbers of worker processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=2000,
+                            help='Jobs enqueued and run per measurement.')
+        parser.add_argument('--processes', type=int, nargs='+',
+                            default=[1, 2, 4])
+        parser.add_argument('--batch-size', type=int, default=10,
+                            help='Jobs each worker claims at a time.')
+        parser.add_argument('--job-time', type=float, default=0,
+                            help='Seconds each job sleeps for.')
+        parser.add_argument('--save', help='Writes the results to this file.')
+
+    def handle(self, *args, **options):
+        results = {
+            'database': connection.vendor,
+            'jobs': options['jobs'],
+            'started_at': timezone.now().isoformat(),
+            'results': {}
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == 'sqlite':
+                # Worker processes cannot share an in-memory database.
+                connection.settings_dict['TEST']['NAME'] = os.path.join(
+                    directory, 'benchmark_jobs.sqlite3')
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True)
+            try:
+                results['results'] = self.run(options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['save']:
+            with open(options['save'], 'w') as file_handle:
+                json.dump(results, file_handle, indent=2)
+
+    def run(self, options):
+        total = options['jobs']
+        kwargs = {'seconds': options['job_time']}
+        results = {}
+
+        start = time.perf_counter()
+        for _ in range(total):
+            enqueue('core.benchmark', kwargs)
+        results['enqueue'] = self.report(
+            'enqueue', total, time.perf_counter() - start)
+        Job.objects.all().delete()
+
+        start = time.perf_counter()
+        enqueue_many('core.benchmark', [kwargs] * total)
+        results['enqueue_many'] = self.report(
+            'enqueue_many', total, time.perf_counter() - start)
+
+        for processes in options['processes']:
+            if processes != options['processes'][0]:
+                enqueue_many('core.benchmark', [kwargs] * total)
+            connections.close_all()
+            context = multiprocessing.get_context('fork')
+            children = [
+                context.Process(target=work, args=(options['batch_size'],))
+                for _ in range(processes)
+            ]
+            start = time.perf_counter()
+            for child in children:
+                child.start()
+            for child in children:
+                child.join()
+            elapsed = time.perf_counter() - start
+            left = Job.objects.count()
+            results[f'process_{processes}'] = self.report(
+                f'process with {processes} workers', total - left, elapsed)
+            if left:
+                self.stderr.write(f'{left} jobs were not run.')
+                Job.objects.all().delete()
+        return results
+
+    def report(self, name, total, elapsed):
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(
+            f'{name:<28} {total:>7} jobs {elapsed:8.2f}s {rate:10.0f}/s')
+        return {'jobs': total, 'seconds': elapsed, 'rate': rate}
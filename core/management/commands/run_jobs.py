@@ -0,0 +1,58 @@
+import multiprocessing
+import signal
+from django.core.management.base import BaseCommand
+from django.db import connections
+from core.jobs import Worker
+
+
+def work(batch_size, burst, max_jobs):
+    worker = Worker(batch_size)
+    # Jobs already claimed are finished or put back before exiting.
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    return worker.run(burst=burst, max_jobs=max_jobs)
+
+
+def work_in_child(*arguments):
+    work(*arguments)
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ('Runs queued background jobs until stopped with SIGTERM or '
+            'SIGINT, in one or more worker processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=1,
+                            help='Jobs each worker claims at a time.')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exits once no job is due.')
+        parser.add_argument('--max-jobs', type=int,
+                            help='Jobs each worker runs before exiting.')
+
+    def handle(self, *args, **options):
+        arguments = (options['batch_size'], options['burst'],
+                     options['max_jobs'])
+        if options['processes'] == 1:
+            processed = work(*arguments)
+            self.stdout.write(f'Ran {processed} jobs.')
+            return
+
+        # Children must not share the parent's database connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        children = [context.Process(target=work_in_child, args=arguments)
+                    for _ in range(options['processes'])]
+        for child in children:
+            child.start()
+
+        def stop(signum, frame):
+            for child in children:
+                if child.is_alive():
+                    child.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for child in children:
+            child.join()
@@ -0,0 +1,318 @@
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from uuid import uuid4
+from django.conf import settings
+
+NAMESPACE = 'bookmine'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 16777216)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\')
+                         .replace('"', r'\"').replace('\n', r'\n'))
+        for (name, value) in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = f'{NAMESPACE}_{name}'
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def merge(self, values, other):
+        for (labels, value) in other:
+            labels = tuple(labels)
+            values[labels] = values.get(labels, 0) + value
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(labels), value]
+                    for (labels, value) in self.values.items()]
+
+    def samples(self, values):
+        for (labels, value) in sorted(values.items()):
+            yield (self.name, _format_labels(self.labelnames, labels), value)
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=LATENCY_BUCKETS):
+        self.name = f'{NAMESPACE}_{name}'
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self.lock:
+            # One count per bucket, then the sum of the observations.
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [0] * (len(self.buckets) + 1)
+            for (index, bound) in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            counts[-1] += value
+
+    def merge(self, values, other):
+        for (labels, counts) in other:
+            labels = tuple(labels)
+            current = values.get(labels)
+            if current is None:
+                values[labels] = list(counts)
+            else:
+                values[labels] = [a + b for (a, b) in zip(current, counts)]
+
+    def snapshot(self):
+        with self.lock:
+            return [[list(labels), list(counts)]
+                    for (labels, counts) in self.values.items()]
+
+    def samples(self, values):
+        for (labels, counts) in sorted(values.items()):
+            cumulative = 0
+            for (bound, count) in zip(self.buckets, counts):
+                cumulative += count
+                yield (f'{self.name}_bucket', _format_labels(
+                    self.labelnames, labels, [('le', _format_value(bound))]),
+                    cumulative)
+            label_text = _format_labels(self.labelnames, labels)
+            yield (f'{self.name}_sum', label_text, counts[-1])
+            yield (f'{self.name}_count', label_text, cumulative)
+
+
+class Gauge:
+    """
+    A value read when the metrics are rendered instead of recorded, from
+    `read()`, which returns a {labels: value} dict. Every process reads
+    the same value, so it is not written to the metrics files.
+    """
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames, read):
+        self.name = f'{NAMESPACE}_{name}'
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.read = read
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def merge(self, values, other):
+        pass
+
+    def snapshot(self):
+        return []
+
+    samples = Counter.samples
+
+
+class Registry:
+    """
+    Holds the metrics of this process. With a METRICS['DIRECTORY'], each
+    process writes its values to a file of its own there every
+    FLUSH_INTERVAL seconds, and `render()` adds up the files of every
+    process, including those that have exited, so counters only go up.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.pid = None
+        self.filename = None
+        self.flushed_at = 0
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    @property
+    def directory(self):
+        return settings.METRICS['DIRECTORY']
+
+    def check_fork(self):
+        if self.pid == os.getpid() or self.directory is None:
+            return
+        if self.pid is not None:
+            # A forked worker starts from zero; its parent's values are
+            # in the parent's file.
+            for metric in self.metrics:
+                with metric.lock:
+                    metric.values.clear()
+        self.pid = os.getpid()
+        # Unique even when the pid of an exited worker is reused.
+        self.filename = f'{self.pid}-{uuid4().hex[:8]}.json'
+
+    def maybe_flush(self):
+        if self.directory is None:
+            return
+        now = time.monotonic()
+        if now - self.flushed_at >= settings.METRICS['FLUSH_INTERVAL']:
+            self.flushed_at = now
+            self.flush()
+
+    def flush(self):
+        self.check_fork()
+        os.makedirs(self.directory, exist_ok=True)
+        # A temp file per writer, as threads of a process flush at once.
+        (fd, temp_path) = tempfile.mkstemp(
+            dir=self.directory, prefix=f'{self.filename}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file_handle:
+                json.dump(self.snapshot(), file_handle)
+            os.replace(temp_path, os.path.join(self.directory, self.filename))
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def collect(self):
+        values = {metric.name: {} for metric in self.metrics}
+        if self.directory is None:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            snapshots = []
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                try:
+                    with open(path) as file_handle:
+                        snapshots.append(json.load(file_handle))
+                except (OSError, ValueError):
+                    continue
+        for snapshot in snapshots:
+            for metric in self.metrics:
+                metric.merge(values[metric.name], snapshot.get(metric.name, []))
+        return values
+
+    def snapshot(self):
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def render(self):
+        values = self.collect()
+        for metric in self.metrics:
+            if isinstance(metric, Gauge):
+                values[metric.name] = metric.read()
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            for (name, labels, value) in metric.samples(values[metric.name]):
+                lines.append(f'{name}{labels} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+@atexit.register
+def _flush_on_exit():
+    if registry.pid is not None and registry.directory is not None:
+        registry.flush()
+
+
+REQUESTS = registry.register(Counter(
+    'http_requests_total', 'Requests handled, by route.',
+    ['route', 'method', 'status']))
+REQUEST_DURATION = registry.register(Histogram(
+    'http_request_duration_seconds', 'Time spent handling requests.',
+    ['route']))
+RESPONSE_SIZE = registry.register(Histogram(
+    'http_response_size_bytes', 'Size of response bodies.',
+    ['route'], buckets=SIZE_BUCKETS))
+DB_QUERIES = registry.register(Histogram(
+    'http_db_queries', 'Database queries run per request.',
+    ['route'], buckets=QUERY_BUCKETS))
+DB_QUERY_DURATION = registry.register(Counter(
+    'http_db_query_seconds_total', 'Time spent in database queries.',
+    ['route']))
+PASSWORD_HASH_DURATION = registry.register(Histogram(
+    'password_hash_seconds', 'Time workers spend hashing a password.',
+    ['operation']))
+PASSWORD_HASH_WAIT = registry.register(Histogram(
+    'password_hash_wait_seconds',
+    'Time a password waits for a hashing worker.', ['operation']))
+PASSWORD_HASH_QUEUE_DEPTH = registry.register(Histogram(
+    'password_hash_queue_depth',
+    'Hashing jobs already pending when one is submitted.', ['operation'],
+    buckets=DEPTH_BUCKETS))
+PASSWORD_HASH_REJECTED = registry.register(Counter(
+    'password_hash_rejected_total',
+    'Passwords turned away because the hashing pool was full.',
+    ['operation']))
+THROTTLED_REQUESTS = registry.register(Counter(
+    'throttled_requests_total',
+    'Requests turned away by rate limits, by route and principal.',
+    ['route', 'principal']))
+
+JOBS_ENQUEUED = registry.register(Counter(
+    'jobs_enqueued_total', 'Background jobs enqueued, by task.', ['name']))
+JOBS_PROCESSED = registry.register(Counter(
+    'jobs_processed_total',
+    'Background job runs, by task and outcome (done, retry or failed).',
+    ['name', 'outcome']))
+JOB_DURATION = registry.register(Histogram(
+    'job_duration_seconds', 'Time spent running background jobs.',
+    ['name']))
+JOB_LATENCY = registry.register(Histogram(
+    'job_latency_seconds',
+    'Time background jobs wait between being due and starting.', ['name'],
+    buckets=LATENCY_BUCKETS + (30, 60, 300, 900)))
+
+
+class QueryTimer:
+    """
+    A database execute wrapper counting the queries of one request and
+    the time they take.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def record_request(route, method, status, duration, queries, size=None):
+    registry.check_fork()
+    REQUESTS.inc(route, method, str(status))
+    REQUEST_DURATION.observe(duration, route)
+    DB_QUERIES.observe(queries.count, route)
+    DB_QUERY_DURATION.inc(route, amount=queries.duration)
+    if size is not None:
+        RESPONSE_SIZE.observe(size, route)
+    registry.maybe_flush()
@@ -0,0 +1,66 @@
+import time
+from contextlib import ExitStack
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+from .db.routing import get_replicas, pin_to_primary
+from .metrics import QueryTimer, record_request
+
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+def get_route(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None or match.url_name is None:
+        # Keeps unknown paths from each getting a series of their own.
+        return UNMATCHED_ROUTE
+    return match.url_name
+
+
+def get_response_size(response):
+    if response.streaming:
+        size = response.get('Content-Length')
+        return None if size is None else int(size)
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    """
+    Records the count, latency, database queries and response size of
+    each request by its resolved route name, e.g. `products-list`.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryTimer()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        record_request(
+            get_route(request), request.method, response.status_code,
+            time.perf_counter() - start, queries,
+            get_response_size(response))
+        return response
+
+
+class ReadYourWritesMiddleware:
+    """
+    Keeps the reads of a user who just wrote something on the primary, so
+    they see their own change while the replicas catch up.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS and \
+                response.status_code < 400 and get_replicas():
+            # Set by DRF once the request is authenticated.
+            user_id = getattr(getattr(request, 'user', None), 'id', None)
+            if user_id is not None:
+                pin_to_primary(user_id)
+        return response
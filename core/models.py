@@ -1,6 +1,54 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 
 class User(AbstractUser):
     email = models.EmailField(unique=True)
+
+
+class Job(models.Model):
+    """
+    A call of a task registered with core.jobs.task, run by a
+    `run_jobs` worker. Jobs that succeed are deleted.
+    """
+    QUEUED = 'Q'
+    RUNNING = 'R'
+    FAILED = 'F'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed')
+    ]
+    name = models.CharField(max_length=255)
+    kwargs = models.JSONField(default=dict)
+    # At most one queued or running job has a given key.
+    dedupe_key = models.CharField(max_length=255, null=True, blank=True)
+    status = models.CharField(
+        max_length=1, choices=STATUS_CHOICES, default=QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField()
+    worker = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_at', 'id'],
+                         condition=models.Q(status='Q'),
+                         name='core_job_queued_idx'),
+            models.Index(fields=['locked_at'],
+                         condition=models.Q(status='R'),
+                         name='core_job_running_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedupe_key'],
+                condition=models.Q(status__in=['Q', 'R']),
+                name='core_job_pending_dedupe_key'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.name} #{self.pk}'
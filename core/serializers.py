@@ -1,5 +1,10 @@
-from django.contrib.auth.hashers import make_password
+import time
+from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import check_token_not_revoked, check_token_user, get_password_fingerprint
+from .hashing import hash_password
 from .models import User
 
 
@@ -15,7 +20,7 @@ class CreateUserSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(read_only=True)
 
     def save(self, **kwargs):
-        self.validated_data['password'] = make_password(
+        self.validated_data['password'] = hash_password(
             self.validated_data['password'])
         return super().save(**kwargs)
 
@@ -29,3 +34,25 @@ class UpdateUserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['first_name', 'last_name', 'email']
+
+
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['auth_time'] = time.time()
+        try:
+            token['customer_id'] = user.customer.id
+        except ObjectDoesNotExist:
+            token['customer_id'] = None
+        token['is_staff'] = user.is_staff
+        token['pwd'] = get_password_fingerprint(user.password)
+        return token
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    def validate(self, attrs):
+        token = RefreshToken(attrs['refresh'])
+        check_token_not_revoked(token)
+        check_token_user(token)
+        return super().validate(attrs)
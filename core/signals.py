@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.dispatch import receiver
+from django.db.models.signals import post_delete, pre_save
+from .authentication import revoke_user_tokens
+
+TOKEN_CLAIM_FIELDS = ['is_active', 'is_staff', 'password']
+
+
+@receiver(pre_save, sender=settings.AUTH_USER_MODEL)
+def revoke_tokens_on_user_change(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    previous = sender.objects.filter(
+        pk=instance.pk).values(*TOKEN_CLAIM_FIELDS).first()
+    if previous is None:
+        return
+    if any(previous[field] != getattr(instance, field) for field in TOKEN_CLAIM_FIELDS):
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def revoke_tokens_on_user_delete(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
@@ -0,0 +1,174 @@
+from django.conf import settings
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext
+from psycopg2 import OperationalError, connect, extensions
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from core.db.pool import ConnectionPool
+from core.models import User
+from model_bakery import baker
+from store.models import Product
+import pytest
+
+postgres_only = pytest.mark.skipif(
+    connection.vendor != 'postgresql', reason='pools Postgres connections')
+with_replica = pytest.mark.skipif(
+    'replica' not in settings.DATABASES,
+    reason='set POSTGRES_REPLICA_DB to test with a replica')
+
+
+@pytest.fixture
+def make_pool(django_db_setup):
+    pools = []
+
+    def do(**options):
+        params = connection.get_connection_params()
+        pool = ConnectionPool(lambda: connect(**params), **options)
+        pools.append(pool)
+        return pool
+    yield do
+    for pool in pools:
+        pool.close()
+
+
+@pytest.fixture
+def count_queries():
+    def do(request):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = request()
+        return (response, len(primary), len(replica))
+    return do
+
+
+@postgres_only
+class TestConnectionPool:
+    def test_reuses_connections(self, make_pool):
+        pool = make_pool()
+        first = pool.acquire()
+        pool.release(first)
+
+        assert pool.acquire() is first
+
+    def test_replaces_closed_connections(self, make_pool):
+        pool = make_pool()
+        first = pool.acquire()
+        pool.release(first)
+        first.close()
+
+        second = pool.acquire()
+
+        assert second is not first
+        assert not second.closed
+
+    def test_checks_idle_connections(self, make_pool):
+        pool = make_pool(check_after=0)
+        first = pool.acquire()
+        pool.release(first)
+        with connect(**connection.get_connection_params()) as other:
+            with other.cursor() as cursor:
+                cursor.execute('SELECT pg_terminate_backend(%s)',
+                               [first.get_backend_pid()])
+        other.close()
+
+        second = pool.acquire()
+        with second.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+        assert second is not first
+
+    def test_closes_connections_past_max_age(self, make_pool):
+        pool = make_pool(max_age=0)
+        first = pool.acquire()
+        pool.release(first)
+
+        assert pool.acquire() is not first
+        assert first.closed
+
+    def test_rolls_back_on_release(self, make_pool):
+        pool = make_pool()
+        first = pool.acquire()
+        with first.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        pool.release(first)
+
+        assert first.info.transaction_status == \
+            extensions.TRANSACTION_STATUS_IDLE
+
+    def test_raises_when_no_connection_is_free(self, make_pool):
+        pool = make_pool(max_size=1, timeout=0.01)
+        pool.acquire()
+
+        with pytest.raises(OperationalError):
+            pool.acquire()
+
+
+@postgres_only
+@pytest.mark.django_db(transaction=True)
+def test_closing_returns_connection_to_pool():
+    connection.ensure_connection()
+    raw_connection = connection.connection
+    connection.close()
+    connection.ensure_connection()
+
+    assert connection.connection is raw_connection
+
+
+@with_replica
+@pytest.mark.django_db(transaction=True, databases=['default', 'replica'])
+class TestReplicaRouting:
+    def test_reads_catalog_from_replica(self, api_client, count_queries):
+        (response, primary, replica) = count_queries(
+            lambda: api_client.get('/store/products/'))
+
+        assert response.status_code == status.HTTP_200_OK
+        assert primary == 0
+        assert replica > 0
+
+    def test_reads_own_writes_from_primary(self, api_client, count_queries):
+        api_client.force_authenticate(baker.make(User, is_staff=True))
+        response = api_client.post('/store/categories/', {'title': 'New'})
+        assert response.status_code == status.HTTP_201_CREATED
+
+        (response, primary, replica) = count_queries(
+            lambda: api_client.get('/store/categories/'))
+
+        assert [category['title'] for category in response.data['results']] \
+            == ['New']
+        assert replica == 0
+
+    def test_rebuilds_cached_responses_from_primary_after_writes(self, api_client, count_queries):
+        baker.make(Product)
+
+        (response, primary, replica) = count_queries(
+            lambda: api_client.get('/store/products/'))
+
+        assert len(response.data['results']) == 1
+        assert replica == 0
+
+    def test_keeps_checkout_on_primary(self, api_client, count_queries):
+        user = baker.make(User)
+        token = AccessToken.for_user(user)
+        token['customer_id'] = user.customer.id
+        api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        product = baker.make(Product)
+
+        (response, primary, replica) = count_queries(
+            lambda: api_client.post(
+                '/store/orders/',
+                {'items': [{'product': product.id, 'quantity': 1}]},
+                format='json'))
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert replica == 0
+
+    def test_keeps_signup_on_primary(self, api_client, count_queries):
+        (response, primary, replica) = count_queries(
+            lambda: api_client.post('/auth/users/', {
+                'username': 'reader',
+                'password': 'AbCdEfGhI123456789',
+                'email': 'reader@example.com'
+            }))
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert replica == 0
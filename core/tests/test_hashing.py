@@ -0,0 +1,158 @@
+import threading
+import time
+from django.contrib.auth.hashers import check_password, make_password
+from rest_framework import status
+from core import hashing
+from core.hashing import (
+    HashingBusy, HashingPool, hash_password, hash_passwords, verify_password)
+from core.models import User
+from model_bakery import baker
+import pytest
+
+PASSWORD = 'AbCdEfGhI123456789'
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """
+    Puts a pool of one worker and no queue in place, with its worker kept
+    busy until the test ends.
+    """
+    pool = HashingPool(1, 0)
+    monkeypatch.setattr(hashing, '_pool', pool)
+    (future, depth) = pool.submit(time.sleep, 2)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture
+def user():
+    return baker.make(User, username='reader', password=make_password(PASSWORD))
+
+
+@pytest.fixture
+def obtain_tokens(api_client):
+    def do(username='reader', password=PASSWORD):
+        return api_client.post(
+            '/auth/token/', {'username': username, 'password': password})
+    return do
+
+
+class TestHashingPool:
+    def test_hashes_in_worker_processes(self, metrics):
+        encoded = hash_password(PASSWORD)
+
+        assert verify_password(PASSWORD, encoded) == (True, False)
+        assert verify_password('wrong', encoded) == (False, False)
+        assert encoded.startswith('pbkdf2_sha256$')
+        (*buckets, total) = metrics('password_hash_seconds', 'check')
+        assert sum(buckets) == 2
+        assert total > 0
+        assert sum(metrics('password_hash_queue_depth', 'hash')[:-1]) == 1
+
+    def test_turns_jobs_away_when_full(self, pool, metrics):
+        with pytest.raises(HashingBusy):
+            hash_password(PASSWORD)
+
+        assert metrics('password_hash_rejected_total', 'hash') == 1
+
+    def test_batches_take_one_slot_and_wait_for_it(self, monkeypatch):
+        pool = HashingPool(1, 1)
+        monkeypatch.setattr(hashing, '_pool', pool)
+        try:
+            pool.submit(time.sleep, 1)
+            hashes = []
+            batch = threading.Thread(target=lambda: hashes.extend(
+                hash_passwords(['first', 'second', 'third'])))
+            batch.start()
+            while pool.pending < 2:
+                time.sleep(0.01)
+
+            # The batch waits for its slot; a login is turned away.
+            with pytest.raises(HashingBusy):
+                hash_password(PASSWORD)
+            batch.join()
+        finally:
+            pool.shutdown()
+
+        assert pool.pending == 0
+        assert [check_password(password, encoded) for (password, encoded)
+                in zip(['first', 'second', 'third'], hashes)] == [True] * 3
+
+    def test_hashes_in_process_without_workers(self, settings, monkeypatch):
+        settings.PASSWORD_HASHING = {**settings.PASSWORD_HASHING, 'WORKERS': 0}
+        monkeypatch.setattr(hashing, 'get_pool', None)
+
+        assert verify_password(PASSWORD, hash_password(PASSWORD)) == (
+            True, False)
+
+    def test_sizes_pool_from_settings_only(self, settings, monkeypatch):
+        settings.PASSWORD_HASHING = {
+            **settings.PASSWORD_HASHING, 'WORKERS': 2, 'QUEUE_SIZE': 3}
+        monkeypatch.setattr(hashing.os, 'cpu_count', lambda: 64)
+        monkeypatch.setattr(hashing, '_pool', None)
+
+        pool = hashing.get_pool()
+        try:
+            assert pool.executor._max_workers == 2
+            assert pool.capacity == 5
+        finally:
+            hashing.discard_pool(pool)
+
+
+@pytest.mark.django_db
+class TestBackpressure:
+    def test_signup_returns_503_with_retry_after(self, api_client, pool):
+        response = api_client.post('/auth/users/', {
+            'username': 'reader',
+            'password': PASSWORD,
+            'email': 'reader@example.com'
+        })
+
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response['Retry-After'] == '1'
+        assert not User.objects.exists()
+
+    def test_login_returns_503_with_retry_after(self, obtain_tokens, user, pool):
+        response = obtain_tokens()
+
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response['Retry-After'] == '1'
+
+
+@pytest.mark.django_db
+class TestPooledModelBackend:
+    def test_logs_in(self, obtain_tokens, user):
+        response = obtain_tokens()
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_hashes_for_unknown_usernames(self, obtain_tokens, metrics):
+        response = obtain_tokens(username='nobody')
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+        assert sum(metrics('password_hash_seconds', 'hash')[:-1]) == 1
+
+    def test_rejects_inactive_users(self, obtain_tokens, user):
+        user.is_active = False
+        user.save()
+
+        response = obtain_tokens()
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_upgrades_outdated_hashes(self, obtain_tokens, settings):
+        settings.PASSWORD_HASHING = {**settings.PASSWORD_HASHING, 'WORKERS': 0}
+        settings.PASSWORD_HASHERS = [
+            'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+            'django.contrib.auth.hashers.MD5PasswordHasher',
+        ]
+        user = baker.make(User, username='reader',
+                          password=make_password(PASSWORD, hasher='md5'))
+
+        response = obtain_tokens()
+        user.refresh_from_db()
+
+        assert response.status_code == status.HTTP_200_OK
+        assert user.password.startswith('pbkdf2_sha256$')
+        assert user.check_password(PASSWORD)
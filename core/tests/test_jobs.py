@@ -0,0 +1,198 @@
+import threading
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.db import connection, connections
+from django.utils import timezone
+from core import jobs
+from core.jobs import (
+    Worker, claim, enqueue, enqueue_many, requeue_stale, run_job, task)
+from core.metrics import registry
+from core.models import Job
+import pytest
+
+calls = []
+
+
+@task('tests.record')
+def record(value):
+    calls.append(value)
+
+
+@task('tests.fail', max_attempts=2)
+def fail():
+    raise ValueError('Broken.')
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    calls.clear()
+
+
+@pytest.mark.django_db
+class TestEnqueue:
+    def test_runs_jobs_and_deletes_them(self, metrics):
+        enqueue('tests.record', {'value': 1})
+        enqueue('tests.record', {'value': 2})
+
+        processed = Worker(batch_size=5).run(burst=True)
+
+        assert processed == 2
+        assert calls == [1, 2]
+        assert not Job.objects.exists()
+        assert metrics('jobs_enqueued_total', 'tests.record') == 2
+        assert metrics('jobs_processed_total', 'tests.record', 'done') == 2
+
+    def test_rejects_unknown_tasks(self):
+        with pytest.raises(KeyError):
+            enqueue('tests.missing')
+
+    def test_returns_pending_job_with_same_dedupe_key(self):
+        first = enqueue('tests.record', {'value': 1}, dedupe_key='a')
+        second = enqueue('tests.record', {'value': 2}, dedupe_key='a')
+
+        assert second.pk == first.pk
+        assert Job.objects.count() == 1
+
+    def test_dedupes_again_once_job_has_run(self):
+        enqueue('tests.record', {'value': 1}, dedupe_key='a')
+        Worker().run(burst=True)
+
+        enqueue('tests.record', {'value': 2}, dedupe_key='a')
+
+        assert Job.objects.count() == 1
+
+    def test_enqueues_many_skipping_taken_dedupe_keys(self):
+        enqueue('tests.record', {'value': 1}, dedupe_key='a')
+
+        enqueue_many('tests.record', [{'value': 1}, {'value': 2}],
+                     dedupe_keys=['a', 'b'])
+
+        assert sorted(Job.objects.values_list('dedupe_key', flat=True)) == [
+            'a', 'b']
+
+    def test_does_not_run_delayed_jobs_early(self):
+        enqueue('tests.record', {'value': 1}, delay=60)
+
+        assert Worker().run(burst=True) == 0
+        assert calls == []
+
+
+@pytest.mark.django_db
+class TestClaim:
+    def test_claims_oldest_due_jobs(self):
+        jobs = [enqueue('tests.record', {'value': value}) for value in range(3)]
+
+        claimed = claim('worker', limit=2)
+
+        assert [job.pk for job in claimed] == [job.pk for job in jobs[:2]]
+        assert [job.attempts for job in claimed] == [1, 1]
+        assert Job.objects.filter(status=Job.RUNNING, worker='worker').count() == 2
+        assert claim('other', limit=5)[0].pk == jobs[2].pk
+
+    def test_claims_without_skip_locked(self, monkeypatch):
+        monkeypatch.setattr(
+            connection.features, 'has_select_for_update_skip_locked', False)
+        enqueue('tests.record', {'value': 1})
+
+        assert len(claim('worker', limit=2)) == 1
+        assert claim('other') == []
+
+
+@pytest.mark.skipif(
+    not connection.features.has_select_for_update_skip_locked,
+    reason='Needs SELECT ... FOR UPDATE SKIP LOCKED.')
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_workers_claim_each_job_once():
+    enqueue_many('tests.record', [{'value': value} for value in range(40)])
+    claimed = []
+
+    def take():
+        try:
+            while batch := claim(threading.current_thread().name, limit=3):
+                claimed.extend(job.pk for job in batch)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=take) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(claimed) == 40
+    assert len(set(claimed)) == 40
+
+
+@pytest.mark.django_db
+class TestRetries:
+    def test_retries_with_backoff_then_fails(self, settings, metrics):
+        settings.JOBS = {**settings.JOBS, 'RETRY_DELAY': 10}
+        job = enqueue('tests.fail')
+
+        assert run_job(claim('worker')[0]) == 'retry'
+        job.refresh_from_db()
+        delay = (job.run_at - timezone.now()).total_seconds()
+        assert job.status == Job.QUEUED
+        assert 4 < delay <= 10
+        assert 'ValueError: Broken.' in job.last_error
+
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        assert run_job(claim('worker')[0]) == 'failed'
+        job.refresh_from_db()
+        assert (job.status, job.attempts) == (Job.FAILED, 2)
+        assert metrics('jobs_processed_total', 'tests.fail', 'retry') == 1
+        assert metrics('jobs_processed_total', 'tests.fail', 'failed') == 1
+
+    def test_caps_retry_delay(self, settings):
+        settings.JOBS = {**settings.JOBS, 'RETRY_DELAY': 10,
+                         'MAX_RETRY_DELAY': 15}
+
+        assert jobs.get_retry_delay(1) <= 10
+        assert 7.5 <= jobs.get_retry_delay(5) <= 15
+
+    def test_requeues_jobs_of_lost_workers(self, settings):
+        settings.JOBS = {**settings.JOBS, 'LEASE': 60}
+        (stale, exhausted, fresh) = [
+            enqueue('tests.fail') for _ in range(3)]
+        claim('worker', limit=3)
+        Job.objects.filter(pk__in=[stale.pk, exhausted.pk]).update(
+            locked_at=timezone.now() - timedelta(minutes=2))
+        Job.objects.filter(pk=exhausted.pk).update(attempts=2)
+
+        assert requeue_stale() == 2
+        statuses = dict(Job.objects.values_list('pk', 'status'))
+        assert statuses == {stale.pk: Job.QUEUED, exhausted.pk: Job.FAILED,
+                            fresh.pk: Job.RUNNING}
+
+
+@pytest.mark.django_db
+class TestWorker:
+    def test_puts_back_unrun_jobs_when_stopped(self, monkeypatch):
+        for value in range(3):
+            enqueue('tests.record', {'value': value})
+        worker = Worker(batch_size=3)
+        monkeypatch.setattr(jobs, 'TASKS', {
+            **jobs.TASKS, 'tests.record': (lambda value: worker.stop(), None)})
+
+        assert worker.run() == 1
+        assert Job.objects.filter(status=Job.QUEUED, attempts=0).count() == 2
+
+    def test_command_runs_due_jobs(self):
+        enqueue('tests.record', {'value': 1})
+        output = StringIO()
+
+        call_command('run_jobs', '--burst', stdout=output)
+
+        assert calls == [1]
+        assert 'Ran 1 jobs.' in output.getvalue()
+
+    def test_renders_queue_sizes(self):
+        enqueue('tests.record', {'value': 1})
+        enqueue('tests.fail')
+        claim('worker', limit=1)
+
+        text = registry.render()
+
+        assert 'bookmine_jobs{name="tests.record",status="R"} 1\n' in text
+        assert 'bookmine_jobs{name="tests.fail",status="Q"} 1\n' in text
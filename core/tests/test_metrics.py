@@ -0,0 +1,117 @@
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor
+from rest_framework import status
+from core.metrics import REQUESTS, Histogram, registry
+from model_bakery import baker
+from store.models import Category
+import pytest
+
+
+@pytest.fixture
+def metrics_directory(tmp_path, settings):
+    settings.METRICS = {**settings.METRICS, 'DIRECTORY': str(tmp_path)}
+    yield tmp_path
+    registry.pid = None
+
+
+def record_in_child():
+    registry.check_fork()
+    REQUESTS.inc('categories-list', 'GET', '200', amount=2)
+    registry.flush()
+
+
+@pytest.mark.django_db
+class TestMetricsMiddleware:
+    def test_records_requests_by_route(self, api_client, metrics):
+        baker.make(Category, 2)
+
+        api_client.get('/store/categories/')
+
+        assert metrics('http_requests_total',
+                       'categories-list', 'GET', '200') == 1
+        (*buckets, total) = metrics(
+            'http_request_duration_seconds', 'categories-list')
+        assert sum(buckets) == 1
+        assert total > 0
+
+    def test_records_queries_and_response_size(self, api_client, metrics):
+        response = api_client.get('/store/categories/')
+
+        queries = metrics('http_db_queries', 'categories-list')
+        sizes = metrics('http_response_size_bytes', 'categories-list')
+        assert queries[-1] == 1
+        assert sizes[-1] == len(response.content)
+
+    def test_groups_unknown_paths(self, api_client, metrics):
+        api_client.get('/no/such/path/')
+        api_client.get('/another/path/')
+
+        assert metrics('http_requests_total',
+                       '<unmatched>', 'GET', '404') == 2
+
+
+@pytest.mark.django_db
+class TestMetricsEndpoint:
+    def test_renders_prometheus_text(self, client, api_client, metrics):
+        api_client.get('/store/categories/')
+
+        response = client.get('/metrics')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+        text = response.content.decode()
+        assert '# TYPE bookmine_http_requests_total counter' in text
+        assert 'bookmine_http_requests_total{route="categories-list",' \
+            'method="GET",status="200"} 1\n' in text
+        assert 'bookmine_http_request_duration_seconds_bucket{' \
+            'route="categories-list",le="+Inf"} 1\n' in text
+
+    def test_returns_401_without_token(self, client, settings):
+        settings.METRICS = {**settings.METRICS, 'TOKEN': 'secret'}
+
+        response = client.get('/metrics')
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_returns_200_with_token(self, client, settings):
+        settings.METRICS = {**settings.METRICS, 'TOKEN': 'secret'}
+
+        response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+
+        assert response.status_code == status.HTTP_200_OK
+
+
+class TestAggregation:
+    def test_adds_up_worker_processes(self, metrics, metrics_directory):
+        registry.check_fork()
+        REQUESTS.inc('categories-list', 'GET', '200')
+
+        context = multiprocessing.get_context('fork')
+        for _ in range(2):
+            child = context.Process(target=record_in_child)
+            child.start()
+            child.join()
+
+        assert metrics('http_requests_total',
+                       'categories-list', 'GET', '200') == 5
+        assert len(list(metrics_directory.glob('*.json'))) == 3
+
+    def test_flushes_from_several_threads(self, metrics_directory):
+        registry.check_fork()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: registry.flush(), range(200)))
+
+        assert os.listdir(metrics_directory) == [registry.filename]
+
+    def test_merges_histograms(self):
+        histogram = Histogram('test_seconds', 'Test.', buckets=(1, 2))
+        values = {}
+
+        histogram.merge(values, [[[], [1, 0, 0, 0.5]]])
+        histogram.merge(values, [[[], [0, 1, 1, 4.5]]])
+
+        assert values == {(): [1, 1, 1, 5.0]}
+        assert [sample[2] for sample in histogram.samples(values)] == \
+            [1, 2, 3, 5.0, 3]
@@ -0,0 +1,207 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from core import throttling
+from core.checks import check_shared_caches
+from core.models import User
+from core.throttling import RateThrottle, parse_rate
+from model_bakery import baker
+import pytest
+
+PASSWORD = 'AbCdEfGhI123456789'
+
+
+@pytest.fixture
+def rates(settings):
+    def do(**rates):
+        settings.THROTTLES = {**settings.THROTTLES, 'RATES': rates}
+    return do
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # The start of a day, so windows of any period start together.
+    now = [864000.0]
+    monkeypatch.setattr(throttling.time, 'time', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def obtain_tokens(api_client):
+    def do(ip='10.0.0.1'):
+        return api_client.post(
+            '/auth/token/', {'username': 'reader', 'password': 'wrong'},
+            REMOTE_ADDR=ip)
+    return do
+
+
+class TestParseRate:
+    def test_reads_requests_and_period(self):
+        assert parse_rate('20/min') == (20, 60)
+        assert parse_rate('5/10s') == (5, 10)
+        assert parse_rate('100/day') == (100, 86400)
+
+    def test_rejects_unknown_periods(self):
+        with pytest.raises(ValueError):
+            parse_rate('5/week')
+
+
+@pytest.mark.django_db
+class TestRateThrottle:
+    def test_returns_429_past_the_rate_per_ip(self, obtain_tokens, rates, clock):
+        rates(token_obtain_pair={'ip': '2/min'})
+
+        assert [obtain_tokens().status_code for _ in range(2)] == [401, 401]
+        response = obtain_tokens()
+        other_ip = obtain_tokens(ip='10.0.0.2')
+
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert response['Retry-After'] == '60'
+        assert other_ip.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_ignores_forwarded_for_without_proxies(self, api_client, rates, clock):
+        rates(token_obtain_pair={'ip': '2/min'})
+
+        responses = [
+            api_client.post(
+                '/auth/token/', {'username': 'reader', 'password': 'wrong'},
+                REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=f'192.0.2.{i}')
+            for i in range(3)
+        ]
+
+        assert [response.status_code for response in responses] == [
+            401, 401, 429]
+
+    def test_reads_forwarded_for_behind_proxies(self, api_client, rates, clock, settings):
+        settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}
+        rates(token_obtain_pair={'ip': '1/min'})
+
+        responses = [
+            api_client.post(
+                '/auth/token/', {'username': 'reader', 'password': 'wrong'},
+                REMOTE_ADDR='10.0.0.1',
+                HTTP_X_FORWARDED_FOR=f'203.0.113.9, 192.0.2.{i}')
+            for i in range(2)
+        ]
+
+        assert [response.status_code for response in responses] == [401, 401]
+
+    def test_weighs_the_previous_window(self, obtain_tokens, rates, clock):
+        rates(token_obtain_pair={'ip': '2/min'})
+        obtain_tokens()
+        obtain_tokens()
+
+        # Half of the previous window still counts: 1 of its 2 requests.
+        clock[0] += 90
+        allowed = obtain_tokens()
+        response = obtain_tokens()
+
+        assert allowed.status_code == status.HTTP_401_UNAUTHORIZED
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert response['Retry-After'] == '30'
+
+    def test_does_not_count_throttled_requests(self, obtain_tokens, rates, clock):
+        rates(token_obtain_pair={'ip': '1/min'})
+        obtain_tokens()
+        for _ in range(5):
+            obtain_tokens()
+
+        clock[0] += 120
+
+        assert obtain_tokens().status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_limits_signups_but_not_reads_of_users(self, api_client, rates, clock):
+        rates(signup={'ip': '1/hour'}, **{'users-list': {'ip': '0/hour'}})
+
+        first = api_client.post('/auth/users/', {
+            'username': 'reader', 'email': 'reader@example.com',
+            'password': PASSWORD})
+        second = api_client.post('/auth/users/', {
+            'username': 'writer', 'email': 'writer@example.com',
+            'password': PASSWORD})
+
+        assert first.status_code == status.HTTP_201_CREATED
+        assert second.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert second['Retry-After'] == '3600'
+        assert User.objects.count() == 1
+
+    def test_limits_each_customer_without_queries(self, api_client, rates, clock, django_assert_num_queries):
+        rates(**{'users-detail': {'customer': '1/min', 'ip': '100/min'}})
+        user = baker.make(User)
+        token = AccessToken.for_user(user)
+        token['customer_id'] = user.customer.id
+        api_client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        api_client.get(f'/auth/users/{user.id}/')
+
+        with django_assert_num_queries(0):
+            response = api_client.get(f'/auth/users/{user.id}/')
+        api_client.force_authenticate(user=baker.make(User))
+        other_user = api_client.get(f'/auth/users/{user.id}/')
+
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert other_user.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_lets_only_the_limit_through_at_once(self, rates, clock, monkeypatch):
+        rates(test={'ip': '5/min'})
+        cache = throttling.get_throttle_cache()
+        get_many = cache.get_many
+        barrier = threading.Barrier(16)
+
+        def read_together(keys):
+            # Every worker reads the counts before any of them goes on.
+            counts = get_many(keys)
+            barrier.wait()
+            return counts
+
+        monkeypatch.setattr(cache, 'get_many', read_together)
+        monkeypatch.setattr(throttling, 'get_throttle_cache', lambda: cache)
+        request = SimpleNamespace(META={'REMOTE_ADDR': '10.0.0.1'}, user=None)
+        view = SimpleNamespace(throttle_scope='test')
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            allowed = list(executor.map(
+                lambda _: RateThrottle().allow_request(request, view),
+                range(16)))
+
+        assert allowed.count(True) == 5
+        window = int(clock[0] // 60)
+        assert cache.get(f'core:throttle:test:ip:10.0.0.1:{window}') == 5
+
+    def test_records_metrics(self, obtain_tokens, rates, clock, metrics):
+        rates(token_obtain_pair={'ip': '1/min'})
+        obtain_tokens()
+        obtain_tokens()
+
+        assert metrics(
+            'throttled_requests_total', 'token_obtain_pair', 'ip') == 1
+        assert metrics(
+            'http_requests_total', 'token_obtain_pair', 'POST', '429') == 1
+
+
+class TestSharedCacheCheck:
+    def test_warns_about_per_process_caches_outside_debug(self, settings):
+        settings.DEBUG = False
+
+        warnings = check_shared_caches(None)
+
+        assert {warning.id for warning in warnings} == {'core.W001'}
+        assert any("'throttles'" in warning.msg for warning in warnings)
+
+    def test_passes_with_shared_caches(self, settings, tmp_path):
+        settings.DEBUG = False
+        settings.CACHES = {
+            alias: {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                'LOCATION': str(tmp_path / alias),
+            }
+            for alias in settings.CACHES
+        }
+
+        assert check_shared_caches(None) == []
+
+    def test_passes_in_debug(self, settings):
+        settings.DEBUG = True
+
+        assert check_shared_caches(None) == []
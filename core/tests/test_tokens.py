@@ -0,0 +1,144 @@
+from django.contrib.auth.hashers import make_password
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from core.models import User
+from model_bakery import baker
+import pytest
+
+PASSWORD = 'AbCdEfGhI123456789'
+
+
+@pytest.fixture
+def user():
+    user = baker.make(User, username='reader')
+    user.set_password(PASSWORD)
+    user.save()
+    return user
+
+
+@pytest.fixture
+def obtain_tokens(api_client):
+    def do(username='reader', password=PASSWORD):
+        return api_client.post(
+            '/auth/token/', {'username': username, 'password': password})
+    return do
+
+
+@pytest.fixture
+def refresh_token(api_client):
+    def do(refresh):
+        return api_client.post('/auth/token/refresh/', {'refresh': refresh})
+    return do
+
+
+@pytest.mark.django_db
+class TestObtainToken:
+    def test_returns_401_if_password_is_wrong(self, obtain_tokens, user):
+        response = obtain_tokens(password='wrong')
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_puts_user_claims_in_access_token(self, obtain_tokens, user):
+        response = obtain_tokens()
+        token = AccessToken(response.data['access'])
+
+        assert response.status_code == status.HTTP_200_OK
+        assert token['user_id'] == user.id
+        assert token['customer_id'] == user.customer.id
+        assert token['is_staff'] is False
+
+    def test_refreshed_access_token_keeps_claims(self, obtain_tokens, refresh_token, user):
+        refresh = obtain_tokens().data['refresh']
+
+        response = refresh_token(refresh)
+        token = AccessToken(response.data['access'])
+
+        assert response.status_code == status.HTTP_200_OK
+        assert token['customer_id'] == user.customer.id
+
+
+@pytest.mark.django_db
+class TestStatelessAuthentication:
+    def test_authenticates_without_queries(self, api_client, obtain_tokens, user):
+        api_client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {obtain_tokens().data["access"]}')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = api_client.get(f'/auth/users/{user.id}/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert len(queries) == 1
+        assert 'core_user' in queries[0]['sql']
+
+    def test_staff_claim_grants_admin_access(self, api_client, obtain_tokens, user):
+        user.is_staff = True
+        user.save()
+        api_client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {obtain_tokens().data["access"]}')
+
+        response = api_client.post('/store/categories/', {'title': 'a'})
+
+        assert response.status_code == status.HTTP_201_CREATED
+
+
+@pytest.mark.django_db
+class TestTokenRevocation:
+    def test_rejects_access_token_of_deactivated_user(self, api_client, obtain_tokens, user):
+        api_client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {obtain_tokens().data["access"]}')
+        user.is_active = False
+        user.save()
+
+        response = api_client.get(f'/auth/users/{user.id}/')
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_rejects_refresh_after_password_change(self, obtain_tokens, refresh_token, user):
+        refresh = obtain_tokens().data['refresh']
+        user.set_password('Another123456789')
+        user.save()
+
+        response = refresh_token(refresh)
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_keeps_tokens_if_profile_changes(self, api_client, obtain_tokens, user):
+        api_client.credentials(
+            HTTP_AUTHORIZATION=f'Bearer {obtain_tokens().data["access"]}')
+        user.first_name = 'Changed'
+        user.save()
+
+        response = api_client.get(f'/auth/users/{user.id}/')
+
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_rejects_refresh_of_deactivated_user_without_marker(self, obtain_tokens, refresh_token, user):
+        refresh = obtain_tokens().data['refresh']
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        caches['tokens'].clear()
+
+        response = refresh_token(refresh)
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_rejects_refresh_after_password_change_without_marker(self, obtain_tokens, refresh_token, user):
+        refresh = obtain_tokens().data['refresh']
+        User.objects.filter(pk=user.pk).update(
+            password=make_password('Another123456789'))
+        caches['tokens'].clear()
+
+        response = refresh_token(refresh)
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_rejects_refresh_of_deleted_user(self, obtain_tokens, refresh_token, user):
+        refresh = obtain_tokens().data['refresh']
+        user.delete()
+        caches['tokens'].clear()
+
+        response = refresh_token(refresh)
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
@@ -52,3 +52,51 @@ class TestCreateUser:
         }
 
 
+@pytest.mark.django_db
+class TestListUsers:
+    def test_returns_401_if_anonymous(self, get_users):
+        response = get_users()
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_returns_paginated_users_if_admin(self, api_client, get_users):
+        users = baker.make(User, 3, is_staff=True)
+        api_client.force_authenticate(user=users[0])
+
+        response = get_users()
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['next'] is None
+        assert response.data['results'] == [
+            {
+                'id': user.id,
+                'username': user.username,
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+                'email': user.email
+            }
+            for user in users
+        ]
+
+
+@pytest.mark.django_db
+class TestUsersQueryBudget:
+    def test_list(self, api_client, get_users, query_budget):
+        user = baker.make(User, is_staff=True)
+        api_client.force_authenticate(user=user)
+
+        query_budget(
+            1,
+            lambda: get_users(),
+            lambda: baker.make(User, 10)
+        )
+
+    def test_retrieve(self, api_client, get_users, query_budget):
+        user = baker.make(User)
+        api_client.force_authenticate(user=user)
+
+        query_budget(
+            1,
+            lambda: get_users(user.id),
+            lambda: baker.make(User, 10)
+        )
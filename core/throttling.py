@@ -0,0 +1,119 @@
+import re
+import time
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+from .metrics import THROTTLED_REQUESTS
+from .middleware import get_route
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+PERIOD_PATTERN = re.compile(r'(\d*)([smhd])')
+
+
+def get_throttle_cache():
+    return caches[settings.THROTTLES['ALIAS']]
+
+
+def parse_rate(rate):
+    """
+    Returns the (requests, seconds) of a rate such as '20/min' or '5/10s'.
+    """
+    (requests, period) = rate.split('/')
+    match = PERIOD_PATTERN.match(period)
+    if match is None:
+        raise ValueError(f'Invalid rate: {rate}')
+    return (int(requests), int(match[1] or 1) * PERIODS[match[2]])
+
+
+def _incr(cache, key, timeout):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout)
+        return cache.incr(key)
+
+
+def _decr(cache, key):
+    try:
+        cache.decr(key)
+    except ValueError:
+        # Expired in between; there is nothing left to take back.
+        pass
+
+
+class RateThrottle(BaseThrottle):
+    """
+    Limits the requests to a route in THROTTLES['RATES'] for each of its
+    principals, over a sliding window: the count of the current fixed
+    window plus the count of the previous one, weighted by how much of it
+    the sliding window still covers. Each request is counted with an incr
+    before the check, so workers sharing the cache cannot all read the
+    same count and let the same last slot through; a throttled request is
+    taken back with a decr. That is one get_many for the previous windows
+    and one incr per principal, whatever the rate, and principals are read
+    from the request without database queries.
+    """
+
+    def allow_request(self, request, view):
+        self.duration = None
+        route = getattr(view, 'throttle_scope', None) or get_route(request)
+        rates = settings.THROTTLES['RATES'].get(route)
+        if not rates:
+            return True
+
+        now = time.time()
+        windows = []
+        for (principal, rate) in rates.items():
+            ident = self.get_principal(request, principal)
+            if ident is None:
+                continue
+            (limit, period) = parse_rate(rate)
+            window = int(now // period)
+            prefix = f'core:throttle:{route}:{principal}:{ident}'
+            windows.append((principal, limit, period, now - window * period,
+                            f'{prefix}:{window}', f'{prefix}:{window - 1}'))
+
+        cache = get_throttle_cache()
+        counts = cache.get_many([window[-1] for window in windows])
+        durations = []
+        for (principal, limit, period, elapsed, key, previous_key) in windows:
+            # Kept while it is the current or the previous window. The
+            # count before this request is the one the limit applies to.
+            current = _incr(cache, key, 2 * period) - 1
+            previous = counts.get(previous_key, 0)
+            if previous * (1 - elapsed / period) + current < limit:
+                continue
+            THROTTLED_REQUESTS.inc(route, principal)
+            if current >= limit:
+                durations.append(period - elapsed)
+            else:
+                # When the previous window's weight lets one more through.
+                durations.append(
+                    period * (1 - (limit - 1 - current) / previous) - elapsed)
+        if durations:
+            for window in windows:
+                _decr(cache, window[-2])
+            self.duration = max(durations)
+            return False
+        return True
+
+    def get_principal(self, request, principal):
+        if principal == 'ip':
+            return self.get_ident(request)
+        user = request.user
+        if user is None or not user.is_authenticated:
+            return None
+        if principal == 'customer':
+            # Tokens carry the customer id. Other logins would need a
+            # query for it, and customers have one user, so they are
+            # counted by user instead.
+            customer_id = getattr(user, 'customer_id', None)
+            if customer_id is not None:
+                return customer_id
+            return f'user-{user.pk}'
+        if principal == 'user':
+            return user.pk
+        raise ValueError(f'Unknown principal: {principal}')
+
+    def wait(self):
+        return self.duration
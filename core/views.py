@@ -1,17 +1,27 @@
+import hmac
+from django.conf import settings
+from django.http import HttpResponse
 from rest_framework.viewsets import ModelViewSet
 from rest_framework import permissions
 from core.serializers import CreateUserSerializer, UpdateUserSerializer, UserSerializer
+from .metrics import registry
 from .models import User
 
 
 class UserViewSet(ModelViewSet):
     http_method_names = ['get', 'post', 'patch']
+    ordering = ('id',)
 
     def get_queryset(self):
         if self.request.user.is_staff:
             return User.objects.all()
         return User.objects.filter(pk=self.request.user.id)
 
+    @property
+    def throttle_scope(self):
+        # Signups are limited on their own, apart from users-list reads.
+        return 'signup' if self.action == 'create' else None
+
     def get_permissions(self):
         if self.request.method == 'POST':
             return [permissions.AllowAny()]
@@ -23,3 +33,12 @@ class UserViewSet(ModelViewSet):
         elif self.request.method == 'PATCH':
             return UpdateUserSerializer
         return UserSerializer
+
+
+def metrics(request):
+    token = settings.METRICS['TOKEN']
+    if token is not None and not hmac.compare_digest(
+            request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=401)
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -1,18 +1,61 @@
+import json
 from django.contrib.admin import ModelAdmin
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
 from django.utils.http import urlencode
 from django.utils.html import format_html
 from django.urls import reverse
-from django.db.models import Count
+from django.db import connections, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .analytics import apply_orders
+from .entitlements import sync_owned_products
 from . import models
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts changelist rows from the Postgres planner's estimate once it is
+    over `exact_count_threshold`, so paging a huge table skips COUNT(*).
+    Smaller results, and other databases, are counted exactly.
+    """
+
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = self.estimate_count()
+        if estimate is None or estimate < self.exact_count_threshold:
+            return super().count
+        return estimate
+
+    def estimate_count(self):
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        (sql, params) = self.object_list.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class ScalableModelAdmin(ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 @admin.register(models.Customer)
-class CustomerAdmin(ModelAdmin):
+class CustomerAdmin(ScalableModelAdmin):
     autocomplete_fields = ['user']
     fields = ['user', 'phone']
     list_display = ['user', 'phone', 'email']
     list_per_page = 10
+    list_select_related = ['user']
+    search_fields = ['user__username', 'user__email']
 
     @admin.display(ordering='user__email')
     def email(self, customer):
@@ -20,7 +63,7 @@ class CustomerAdmin(ModelAdmin):
 
 
 @admin.register(models.Category)
-class CategoryAdmin(ModelAdmin):
+class CategoryAdmin(ScalableModelAdmin):
     list_display = ['title', 'added_at', 'products_count']
     list_per_page = 10
     search_fields = ['title']
@@ -38,7 +81,18 @@ class CategoryAdmin(ModelAdmin):
         )
 
     def get_queryset(self, request):
-        return super().get_queryset(request).annotate(products_count=Count('product'))
+        # A correlated subquery only counts the products of the categories
+        # on the page, where a join with Count would group every product.
+        products_count = (
+            models.Product.objects
+            .filter(category=OuterRef('pk'))
+            .order_by()
+            .values('category')
+            .annotate(count=Count('id'))
+            .values('count')
+        )
+        return super().get_queryset(request).annotate(
+            products_count=Coalesce(Subquery(products_count), 0))
 
 
 class ProductFileInline(admin.TabularInline):
@@ -49,13 +103,16 @@ class ProductFileInline(admin.TabularInline):
 
 
 @admin.register(models.Product)
-class ProductAdmin(ModelAdmin):
+class ProductAdmin(ScalableModelAdmin):
     autocomplete_fields = ['category']
     inlines = [ProductFileInline]
     list_display = ['title', 'unit_price', 'category']
+    list_select_related = ['category']
+    search_fields = ['title']
 
 
 class OrderItemInline(admin.StackedInline):
+    autocomplete_fields = ['product']
     model = models.OrderItem
     min_num = 1
     max_num = 10
@@ -63,8 +120,52 @@ class OrderItemInline(admin.StackedInline):
 
 
 @admin.register(models.Order)
-class OrderAdmin(ModelAdmin):
+class OrderAdmin(ScalableModelAdmin):
+    actions = ['mark_completed', 'mark_canceled', 'mark_pending']
+    autocomplete_fields = ['customer']
+    date_hierarchy = 'placed_at'
     fields = ['customer', 'placed_at', 'order_status']
     readonly_fields = ['placed_at']
     inlines = [OrderItemInline]
-    list_display = ['id', 'customer', 'order_status']
+    list_display = ['id', 'customer', 'order_status', 'placed_at']
+    list_filter = ['order_status']
+    list_select_related = ['customer__user']
+    ordering = ['-placed_at', '-id']
+
+    @admin.action(description='Mark selected orders as completed')
+    def mark_completed(self, request, queryset):
+        self.set_status(request, queryset, models.Order.COMPLETED_ORDER)
+
+    @admin.action(description='Mark selected orders as canceled')
+    def mark_canceled(self, request, queryset):
+        self.set_status(request, queryset, models.Order.CANCELED_ORDER)
+
+    @admin.action(description='Mark selected orders as pending')
+    def mark_pending(self, request, queryset):
+        self.set_status(request, queryset, models.Order.PENDING_ORDER)
+
+    def set_status(self, request, queryset, order_status):
+        """
+        Changes the status with a single UPDATE, which sends no signals,
+        so owned products and sales summaries are brought up to date here
+        from the orders that move into or out of completed.
+        """
+        completed = models.Order.COMPLETED_ORDER
+        changing = queryset.exclude(order_status=order_status)
+        if order_status == completed:
+            (moving, sign) = (changing, 1)
+        else:
+            (moving, sign) = (changing.filter(order_status=completed), -1)
+
+        with transaction.atomic():
+            customer_ids = list(
+                moving.order_by().values_list('customer_id', flat=True)
+                .distinct()
+            )
+            apply_orders(moving, sign)
+            updated = changing.update(order_status=order_status)
+            for start in range(0, len(customer_ids), 500):
+                sync_owned_products(customer_ids[start:start + 500])
+
+        self.message_user(
+            request, f'{updated} orders updated.', messages.SUCCESS)
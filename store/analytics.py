@@ -0,0 +1,132 @@
+from datetime import datetime, time, timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Count, DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import CategorySales, DailySales, Order, OrderItem, Product, ProductSales
+
+REVENUE = Sum(
+    F('quantity') * F('unit_price'),
+    output_field=DecimalField(max_digits=14, decimal_places=2)
+)
+
+# Summary model, the key it is grouped by and where items keep that key.
+SUMMARIES = [
+    (DailySales, None, None),
+    (ProductSales, 'product_id', 'product_id'),
+    (CategorySales, 'category_id', 'product__category_id'),
+]
+
+
+def add_sales(model, day, revenue, units, orders, **key):
+    changes = {
+        'revenue': F('revenue') + revenue,
+        'units': F('units') + units,
+        'orders': F('orders') + orders
+    }
+    if model.objects.filter(day=day, **key).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(
+                day=day, revenue=revenue, units=units, orders=orders, **key)
+    except IntegrityError:
+        # Another transaction created the row first.
+        model.objects.filter(day=day, **key).update(**changes)
+
+
+def apply_orders(orders, sign):
+    """
+    Adds (sign=1) or removes (sign=-1) the sales of `orders` (a queryset)
+    to the summaries, with one grouped query per summary and one update
+    per summary row touched.
+    """
+    items = OrderItem.objects.filter(order__in=orders)
+    for (model, field, source) in SUMMARIES:
+        fields = [] if field is None else [source]
+        rows = (
+            items
+            .values(*fields, day=TruncDate('order__placed_at'))
+            .annotate(
+                revenue=REVENUE,
+                units=Sum('quantity'),
+                orders=Count('order_id', distinct=True)
+            )
+            # A stable order keeps concurrent updates from deadlocking.
+            .order_by(*fields, 'day')
+        )
+        for row in rows:
+            key = {field: row[source]} if field else {}
+            add_sales(model, row['day'], sign * row['revenue'],
+                      sign * row['units'], sign * row['orders'], **key)
+
+
+def apply_order(order_id, sign):
+    apply_orders(Order.objects.filter(pk=order_id), sign)
+
+
+def day_range(start, end):
+    timezone_ = timezone.get_current_timezone()
+    bounds = {}
+    if start is not None:
+        bounds['order__placed_at__gte'] = timezone.make_aware(
+            datetime.combine(start, time.min), timezone_)
+    if end is not None:
+        bounds['order__placed_at__lt'] = timezone.make_aware(
+            datetime.combine(end + timedelta(days=1), time.min), timezone_)
+    return bounds
+
+
+def rebuild_sales(start=None, end=None, product_ids=None):
+    """
+    Recomputes the summaries from completed orders for the days from
+    `start` to `end` (inclusive, open-ended if None). With `product_ids`,
+    only the rows of those products and their categories are rebuilt,
+    along with the daily totals.
+    """
+    items = OrderItem.objects.filter(
+        order__order_status=Order.COMPLETED_ORDER, **day_range(start, end))
+    days = {}
+    if start is not None:
+        days['day__gte'] = start
+    if end is not None:
+        days['day__lte'] = end
+
+    keys = {}
+    if product_ids is not None:
+        keys['product_id'] = list(product_ids)
+        keys['category_id'] = list(
+            Product.objects
+            .filter(pk__in=keys['product_id'])
+            .values_list('category_id', flat=True)
+            .distinct()
+        )
+
+    with transaction.atomic():
+        for (model, field, source) in SUMMARIES:
+            rows = model.objects.filter(**days)
+            grouped = items
+            if field in keys:
+                rows = rows.filter(**{f'{field}__in': keys[field]})
+                grouped = grouped.filter(**{f'{source}__in': keys[field]})
+            rows.delete()
+
+            fields = [] if field is None else [source]
+            model.objects.bulk_create(
+                [
+                    model(**{
+                        field if name == source else name: value
+                        for (name, value) in row.items()
+                    })
+                    for row in
+                    grouped
+                    .values(*fields, day=TruncDate('order__placed_at'))
+                    .annotate(
+                        revenue=REVENUE,
+                        units=Sum('quantity'),
+                        orders=Count('order_id', distinct=True)
+                    )
+                    .order_by()
+                ],
+                batch_size=1000
+            )
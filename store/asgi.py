@@ -0,0 +1,201 @@
+import asyncio
+import time
+from contextlib import ExitStack
+from io import BytesIO
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core import signals
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.response import Response
+from core.metrics import QueryTimer, record_request
+from store.delivery import CHUNK_SIZE, InProcessDelivery, get_delivery_backend
+from store.download_links import verify_download_link
+from store.views import (
+    ProductFileViewSet, SignedDownloadView, get_customer_id, prepere_files)
+from store.watermark import Stamp
+
+
+def plan_view(view, http_request, kwargs, get_productfile):
+    """
+    Runs the checks of `view` and `get_productfile(view)`, which returns
+    the file to send and its stamp or a response, and returns the file (or
+    None) with the (status, headers, body) plan of the response.
+    """
+    view.headers = view.default_response_headers
+    request = view.initialize_request(http_request, **kwargs)
+    view.request = request
+
+    try:
+        view.initial(request)
+        result = get_productfile(view)
+        if isinstance(result, tuple):
+            (productfile, stamp) = result
+            return (productfile, *get_delivery_backend().plan(
+                request, productfile, stamp))
+        response = result
+    except Exception as exc:
+        response = view.handle_exception(exc)
+
+    response = view.finalize_response(request, response)
+    response.render()
+    return (None, response.status_code, dict(response.items()),
+            [response.content])
+
+
+def plan_download(http_request, kwargs):
+    """
+    Plans a download with the checks of ProductFileViewSet.retrieve.
+    """
+    def get_productfile(view):
+        if prepere_files(view):
+            return (view.get_object(),
+                    Stamp(get_customer_id(view.request), None))
+        return Response(
+            {
+                'message': "You don't have this product in your owned products."
+            },
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    view = ProductFileViewSet(
+        action='retrieve', action_map={'get': 'retrieve'},
+        args=(), kwargs=kwargs, format_kwarg=None)
+    return plan_view(view, http_request, kwargs, get_productfile)
+
+
+def plan_signed_download(http_request, kwargs):
+    """
+    Plans a download with the checks of SignedDownloadView.
+    """
+    view = SignedDownloadView(args=(), kwargs=kwargs, format_kwarg=None)
+    return plan_view(view, http_request, kwargs,
+                     lambda view: verify_download_link(kwargs['token']))
+
+
+DOWNLOAD_VIEWS = {
+    'product-files-detail': plan_download,
+    'signed-download': plan_signed_download,
+}
+
+
+def checked_download(scope, match, queries):
+    signals.request_started.send(sender=DownloadApplication, scope=scope)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            http_request = ASGIRequest(scope, BytesIO())
+            # Names the route for throttling, as Django's handler does.
+            http_request.resolver_match = match
+            return DOWNLOAD_VIEWS[match.url_name](http_request, match.kwargs)
+    finally:
+        # Gives the database connection back before the long part starts.
+        signals.request_finished.send(sender=DownloadApplication)
+
+
+class DownloadApplication:
+    """
+    Serves product file downloads without tying up a thread per client.
+
+    Django 4.0 iterates streaming responses synchronously inside the event
+    loop, so a slow client downloading a large file stalls every other
+    request on the worker. This application wraps Django's and takes over
+    GET requests to the product file detail and signed download routes
+    while the in-process delivery backend is used. The checks run in a
+    worker thread through the same view code as the synchronous views,
+    then the file is read
+    chunk by chunk in the default executor and each chunk is awaited onto
+    the connection, so the server's flow control paces slow clients.
+    Django middleware does not run for these requests; their metrics are
+    recorded here, timed up to the start of the response as the
+    synchronous view's are.
+    """
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        match = self.match(scope)
+        if match is None:
+            return await self.application(scope, receive, send)
+        # Like Django's handler, gives each request its own worker thread
+        # so the checks of concurrent downloads do not queue on one thread.
+        async with ThreadSensitiveContext():
+            await self.download(scope, receive, send, match)
+
+    def match(self, scope):
+        if scope['type'] != 'http' or scope['method'] != 'GET':
+            return None
+        if not isinstance(get_delivery_backend(), InProcessDelivery):
+            return None
+        try:
+            match = resolve(scope['path'])
+        except Resolver404:
+            return None
+        if match.url_name not in DOWNLOAD_VIEWS or 'format' in match.kwargs:
+            return None
+        return match
+
+    async def download(self, scope, receive, send, match):
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        try:
+            queries = QueryTimer()
+            start = time.perf_counter()
+            (productfile, status_code, headers, body) = \
+                await sync_to_async(checked_download)(scope, match, queries)
+            await send({
+                'type': 'http.response.start',
+                'status': status_code,
+                'headers': [
+                    (name.encode('ascii'), str(value).encode('latin1'))
+                    for (name, value) in headers.items()
+                ]
+            })
+            size = headers.get('Content-Length')
+            if productfile is None:
+                size = sum(len(part) for part in body)
+            record_request(
+                match.url_name, 'GET', status_code,
+                time.perf_counter() - start, queries,
+                None if size is None else int(size))
+            if productfile is None:
+                for part in body:
+                    await send({'type': 'http.response.body', 'body': part,
+                                'more_body': True})
+            elif body:
+                await self.send_file(productfile, body, send, disconnected)
+            if not disconnected.done():
+                await send({'type': 'http.response.body'})
+        finally:
+            disconnected.cancel()
+
+    async def send_file(self, productfile, body, send, disconnected):
+        loop = asyncio.get_running_loop()
+        file_handle = await loop.run_in_executor(
+            None, productfile.file.storage.open, productfile.file.name, 'rb')
+        try:
+            for part in body:
+                if isinstance(part, bytes):
+                    await send({'type': 'http.response.body', 'body': part,
+                                'more_body': True})
+                    continue
+
+                (start, end) = part
+                await loop.run_in_executor(None, file_handle.seek, start)
+                remaining = end - start + 1
+                while remaining > 0 and not disconnected.done():
+                    chunk = await loop.run_in_executor(
+                        None, file_handle.read, min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({'type': 'http.response.body', 'body': chunk,
+                                'more_body': True})
+        finally:
+            await loop.run_in_executor(None, file_handle.close)
+
+    async def wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
@@ -0,0 +1,120 @@
+from hashlib import sha1
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rest_framework import status
+from rest_framework.response import Response
+from core.db.routing import get_replicas, read_from
+
+HITS_KEY = 'store:responses:hits'
+MISSES_KEY = 'store:responses:misses'
+
+
+def get_response_cache():
+    return caches[settings.STORE_RESPONSE_CACHE['ALIAS']]
+
+
+def _version_key(namespace):
+    return f'store:responses:version:{namespace}'
+
+
+def _written_key(namespace):
+    return f'store:responses:written:{namespace}'
+
+
+def _incr(cache, key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        return cache.incr(key)
+
+
+def invalidate(*namespaces):
+    """
+    Bumps the version of each namespace so every cached response built
+    from it is skipped. Runs again on commit so a response cached from
+    data read before the commit is not served afterwards.
+    """
+    def bump():
+        cache = get_response_cache()
+        for namespace in namespaces:
+            _incr(cache, _version_key(namespace))
+        if get_replicas():
+            # Replicas may not have the change yet; see get_cached_response.
+            cache.set_many(
+                {_written_key(namespace): True for namespace in namespaces},
+                settings.DATABASE_REPLICATION['MAX_LAG'])
+
+    bump()
+    transaction.on_commit(bump)
+
+
+def get_stats():
+    cache = get_response_cache()
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits = counters.get(HITS_KEY, 0)
+    misses = counters.get(MISSES_KEY, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / (hits + misses) if hits + misses else 0
+    }
+
+
+class CachedResponseMixin:
+    """
+    Caches list and retrieve responses of a viewset whose representation
+    is the same for every caller. Responses are keyed on the versions of
+    `cache_namespace` (and `<cache_namespace>:<pk>` for retrieve), the
+    path, the query string and the Accept header.
+    """
+
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            [self.cache_namespace],
+            lambda: super(CachedResponseMixin, self).list(
+                request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.get_cached_response(
+            [f'{self.cache_namespace}:{pk}'],
+            lambda: super(CachedResponseMixin, self).retrieve(
+                request, *args, **kwargs)
+        )
+
+    def get_cached_response(self, namespaces, build_response):
+        cache = get_response_cache()
+        version_keys = [_version_key(namespace) for namespace in namespaces]
+        written_keys = [_written_key(namespace) for namespace in namespaces] \
+            if get_replicas() else []
+        versions = cache.get_many(version_keys + written_keys)
+        fingerprint = '|'.join([
+            self.request.get_host(),
+            self.request.get_full_path(),
+            self.request.headers.get('Accept', ''),
+            *(str(versions.get(key, 0)) for key in version_keys)
+        ])
+        key = 'store:responses:' + sha1(fingerprint.encode()).hexdigest()
+
+        data = cache.get(key)
+        if data is not None:
+            _incr(cache, HITS_KEY)
+            return Response(data)
+
+        _incr(cache, MISSES_KEY)
+        if any(key in versions for key in written_keys):
+            # A response cached from a lagging replica would outlive the
+            # lag, so it is built from the primary.
+            with read_from(DEFAULT_DB_ALIAS):
+                response = build_response()
+        else:
+            response = build_response()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data,
+                      settings.STORE_RESPONSE_CACHE['TIMEOUT'])
+        return response
@@ -0,0 +1,220 @@
+import csv
+import json
+import os
+from django.db import transaction
+from .cache import invalidate
+from .models import Category, Product
+from .serializers import CatalogRowSerializer
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+FORMATS = {
+    'text/csv': CSV,
+    'application/x-ndjson': NDJSON,
+    'application/jsonl': NDJSON,
+    '.csv': CSV,
+    '.ndjson': NDJSON,
+    '.jsonl': NDJSON,
+}
+FIELDS = ['isbn', 'title', 'description', 'unit_price', 'category']
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+class CatalogImportError(Exception):
+    pass
+
+
+def get_format(content_type='', filename=''):
+    content_type = content_type.split(';')[0].strip().lower()
+    extension = os.path.splitext(filename)[1].lower()
+    return FORMATS.get(content_type) or FORMATS.get(extension)
+
+
+class DecodedLines:
+    """
+    Iterates over the lines of a binary stream as text, counting them in
+    `line_num`. Lines that are not UTF-8 come out as a replacement
+    character, not blank lines the csv module would skip, and their numbers
+    are kept in `bad_lines`.
+    """
+
+    def __init__(self, stream):
+        self.stream = iter(stream)
+        self.line_num = 0
+        self.bad_lines = set()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = next(self.stream)
+        self.line_num += 1
+        try:
+            return line.decode('utf-8')
+        except UnicodeDecodeError:
+            self.bad_lines.add(self.line_num)
+            return '\ufffd\n'
+
+
+def read_rows(stream, file_format):
+    """
+    Yields (line number, row dict or None) pairs from a binary stream
+    without reading it all into memory. None marks a line that is not
+    UTF-8 or that does not parse, so one bad line does not stop the rest.
+    """
+    lines = DecodedLines(stream)
+    if file_format == CSV:
+        reader = csv.DictReader(lines)
+        first_line = 1
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                return
+            except csv.Error:
+                row = None
+            # A quoted field can span lines; the row is bad if any is.
+            if not lines.bad_lines.isdisjoint(
+                    range(first_line, lines.line_num + 1)):
+                row = None
+            first_line = lines.line_num + 1
+            yield (lines.line_num, row)
+
+    for line in lines:
+        if lines.line_num in lines.bad_lines:
+            yield (lines.line_num, None)
+            continue
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield (lines.line_num, row if isinstance(row, dict) else None)
+
+
+class CatalogImporter:
+    def __init__(self, batch_size=BATCH_SIZE):
+        self.batch_size = batch_size
+        self.category_ids = {}
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def run(self, stream, file_format):
+        if file_format not in (CSV, NDJSON):
+            raise CatalogImportError(f'Unsupported format: {file_format}')
+
+        batch = {}
+        for (line, row) in read_rows(stream, file_format):
+            if row is None:
+                self.add_error(line, {'non_field_errors': ['Invalid line.']})
+                continue
+            serializer = CatalogRowSerializer(data=row)
+            if not serializer.is_valid():
+                self.add_error(line, serializer.errors)
+                continue
+            data = serializer.validated_data
+            batch[data['isbn']] = data
+            if len(batch) >= self.batch_size:
+                self.save_batch(list(batch.values()))
+                batch = {}
+        if batch:
+            self.save_batch(list(batch.values()))
+
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'error_count': self.error_count,
+            'errors': self.errors
+        }
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def resolve_categories(self, titles):
+        missing = set(titles) - self.category_ids.keys()
+        if not missing:
+            return
+
+        for (category_id, title) in (
+            Category.objects
+            .filter(title__in=missing)
+            .order_by('id')
+            .values_list('id', 'title')
+        ):
+            self.category_ids.setdefault(title, category_id)
+
+        missing -= self.category_ids.keys()
+        if missing:
+            Category.objects.bulk_create(
+                [Category(title=title) for title in missing])
+            for (category_id, title) in (
+                Category.objects
+                .filter(title__in=missing)
+                .values_list('id', 'title')
+            ):
+                self.category_ids[title] = category_id
+            invalidate('categories')
+
+    def save_batch(self, rows):
+        with transaction.atomic():
+            self.resolve_categories(row['category'] for row in rows)
+            existing = Product.objects.only('id', 'isbn').in_bulk(
+                [row['isbn'] for row in rows], field_name='isbn')
+
+            to_create = []
+            to_update = []
+            for row in rows:
+                product = existing.get(row['isbn']) or \
+                    Product(isbn=row['isbn'])
+                product.title = row['title']
+                product.description = row['description']
+                product.unit_price = row['unit_price']
+                product.category_id = self.category_ids[row['category']]
+                (to_update if product.pk else to_create).append(product)
+
+            Product.objects.bulk_create(to_create)
+            Product.objects.bulk_update(
+                to_update,
+                ['title', 'description', 'unit_price', 'category'])
+
+        self.created += len(to_create)
+        self.updated += len(to_update)
+        invalidate('products', *(
+            f'products:{product.pk}' for product in to_update))
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def export_catalog(file_format, chunk_size=2000):
+    """
+    Yields the whole catalog as CSV or NDJSON lines, reading products with
+    a server-side cursor where the database supports it.
+    """
+    rows = (
+        Product.objects
+        .order_by('id')
+        .values_list('isbn', 'title', 'description', 'unit_price',
+                     'category__title')
+        .iterator(chunk_size=chunk_size)
+    )
+
+    if file_format == CSV:
+        writer = csv.writer(_Echo())
+        yield writer.writerow(FIELDS)
+        for row in rows:
+            yield writer.writerow(row)
+        return
+
+    for row in rows:
+        row = dict(zip(FIELDS, row))
+        row['unit_price'] = str(row['unit_price'])
+        yield json.dumps(row) + '\n'
@@ -0,0 +1,254 @@
+import hashlib
+from abc import ABC, abstractmethod
+from uuid import uuid4
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from django.utils.module_loading import import_string
+from .watermark import get_watermark
+
+CHUNK_SIZE = 64 * 1024
+MAX_RANGES = 16
+CONTENT_TYPE = 'application/pdf'
+
+
+def get_delivery_backend():
+    config = settings.STORE_FILE_DELIVERY
+    backend_class = import_string(config['BACKEND'])
+    return backend_class(**config.get('OPTIONS', {}))
+
+
+def parse_range_header(header, size):
+    """
+    Returns a list of inclusive (start, end) byte ranges, an empty list if
+    none of the ranges can be satisfied, or None if the header should be
+    ignored and the whole file served.
+    """
+    if not header or not header.startswith('bytes='):
+        return None
+
+    ranges = []
+    for spec in header[len('bytes='):].split(','):
+        start, sep, end = spec.strip().partition('-')
+        if not sep:
+            return None
+        try:
+            if start:
+                start = int(start)
+                end = int(end) if end else size - 1
+            elif end:
+                start = max(size - int(end), 0)
+                end = size - 1
+            else:
+                return None
+        except ValueError:
+            return None
+        if start > end:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def read_range(file_handle, start, end):
+    file_handle.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = file_handle.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+class FileDelivery(ABC):
+    def __init__(self, **options):
+        self.options = options
+
+    @abstractmethod
+    def serve(self, request, productfile, stamp=None):
+        pass
+
+    def get_disposition(self):
+        return f'attachment; filename="{uuid4()}.pdf"'
+
+    def get_content_type(self, productfile):
+        return productfile.content_type or CONTENT_TYPE
+
+    def set_disposition(self, response):
+        response['Content-Disposition'] = self.get_disposition()
+        return response
+
+
+class InProcessDelivery(FileDelivery):
+    def get_validators(self, productfile):
+        if productfile.size is not None:
+            return (productfile.size, f'"{productfile.sha256}"',
+                    http_date(productfile.modified_at.timestamp()))
+
+        # Not backfilled yet, so asks the storage.
+        storage = productfile.file.storage
+        size = productfile.file.size
+        modified_at = storage.get_modified_time(productfile.file.name)
+        etag = f'"{int(modified_at.timestamp()):x}-{size:x}"'
+        return (size, etag, http_date(modified_at.timestamp()))
+
+    def plan(self, request, productfile, stamp=None):
+        """
+        Works out the status, headers and body of a download without
+        reading the file. The body is a list of byte strings and inclusive
+        (start, end) ranges of the file, to be sent in order. With a
+        `stamp`, PDFs are sent with its watermark appended.
+        """
+        (size, etag, last_modified) = self.get_validators(productfile)
+        watermark = get_watermark(productfile, stamp) if stamp else b''
+        if watermark:
+            (file_size, size) = (size, size + len(watermark))
+            etag = f'{etag[:-1]}-{hashlib.sha256(watermark).hexdigest()[:16]}"'
+        content_type = self.get_content_type(productfile)
+        headers = {
+            'Content-Type': content_type,
+            'Accept-Ranges': 'bytes',
+            'ETag': etag,
+            'Last-Modified': last_modified,
+            'Content-Disposition': self.get_disposition()
+        }
+
+        if self.if_none_match_matches(request, etag):
+            del headers['Content-Type']
+            return (304, headers, [])
+
+        ranges = None
+        if self.if_range_matches(request, etag, last_modified):
+            ranges = parse_range_header(request.headers.get('Range'), size)
+
+        if ranges == []:
+            headers['Content-Range'] = f'bytes */{size}'
+            headers['Content-Length'] = '0'
+            return (416, headers, [])
+
+        if ranges is None:
+            headers['Content-Length'] = str(size)
+            body = [(0, size - 1)] if size else []
+            return (200, headers, self.append_watermark(
+                body, file_size, watermark) if watermark else body)
+
+        if len(ranges) == 1:
+            (start, end) = ranges[0]
+            headers['Content-Length'] = str(end - start + 1)
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+            return (206, headers, self.append_watermark(
+                ranges, file_size, watermark) if watermark else ranges)
+
+        boundary = uuid4().hex
+        body = []
+        for (start, end) in ranges:
+            body.append((
+                f'--{boundary}\r\n'
+                f'Content-Type: {content_type}\r\n'
+                f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+            ).encode())
+            body.append((start, end))
+            body.append(b'\r\n')
+        body.append(f'--{boundary}--\r\n'.encode())
+        headers['Content-Type'] = f'multipart/byteranges; boundary={boundary}'
+        headers['Content-Length'] = str(sum(
+            len(part) if isinstance(part, bytes) else part[1] - part[0] + 1
+            for part in body
+        ))
+        return (206, headers, self.append_watermark(
+            body, file_size, watermark) if watermark else body)
+
+    def append_watermark(self, body, file_size, watermark):
+        """
+        Maps the ranges of `body`, which cover the file followed by the
+        watermark, to ranges of the file and slices of the watermark.
+        """
+        parts = []
+        for part in body:
+            if isinstance(part, bytes):
+                parts.append(part)
+                continue
+            (start, end) = part
+            if start < file_size:
+                parts.append((start, min(end, file_size - 1)))
+            if end >= file_size:
+                parts.append(
+                    watermark[max(start - file_size, 0):end - file_size + 1])
+        return parts
+
+    def serve(self, request, productfile, stamp=None):
+        (status, headers, body) = self.plan(request, productfile, stamp)
+        if status in (304, 416):
+            response = HttpResponse(status=status)
+        elif status == 200 and len(body) <= 1:
+            response = FileResponse(productfile.file.open('rb'))
+        else:
+            response = StreamingHttpResponse(
+                self.stream(productfile.file.open('rb'), body),
+                status=status)
+        for (name, value) in headers.items():
+            response[name] = value
+        return response
+
+    def if_none_match_matches(self, request, etag):
+        if_none_match = request.headers.get('If-None-Match')
+        if not if_none_match:
+            return False
+        # Weak comparison, as RFC 9110 asks for If-None-Match.
+        tags = {tag.removeprefix('W/') for tag in parse_etags(if_none_match)}
+        return '*' in tags or etag in tags
+
+    def if_range_matches(self, request, etag, last_modified):
+        if_range = request.headers.get('If-Range')
+        if not if_range:
+            return True
+        if if_range.startswith('"'):
+            return if_range == etag
+        if_range_date = parse_http_date_safe(if_range)
+        return (if_range_date is not None and
+                if_range_date == parse_http_date_safe(last_modified))
+
+    def stream(self, file_handle, body):
+        with file_handle:
+            for part in body:
+                if isinstance(part, bytes):
+                    yield part
+                else:
+                    yield from read_range(file_handle, *part)
+
+
+class XAccelRedirectDelivery(FileDelivery):
+    """
+    Lets nginx send the file from an `internal` location that maps to
+    MEDIA_ROOT. nginx handles Range and If-Range on its own.
+    """
+
+    def serve(self, request, productfile, stamp=None):
+        location = self.options.get('LOCATION', '/protected/')
+        response = HttpResponse(
+            content_type=self.get_content_type(productfile))
+        response['X-Accel-Redirect'] = location + productfile.file.name
+        return self.set_disposition(response)
+
+
+class XSendfileDelivery(FileDelivery):
+    """
+    Lets Apache (mod_xsendfile) or lighttpd send the file from disk.
+    """
+
+    def serve(self, request, productfile, stamp=None):
+        response = HttpResponse(
+            content_type=self.get_content_type(productfile))
+        response['X-Sendfile'] = productfile.file.path
+        return self.set_disposition(response)
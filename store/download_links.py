@@ -0,0 +1,110 @@
+import time
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.exceptions import PermissionDenied
+from .models import ProductFile
+from .watermark import Stamp
+
+SALT = 'store.download_links'
+# Names SECRET_KEY when no KEYS are configured.
+SECRET_KEY_ID = '0'
+
+
+class InvalidDownloadLink(PermissionDenied):
+    default_detail = 'Download link is invalid.'
+    default_code = 'invalid_download_link'
+
+
+def _revocation_key(customer_id):
+    return f'store:download-links-revoked:{customer_id}'
+
+
+def get_keys():
+    config = settings.STORE_DOWNLOAD_LINKS
+    if not config['KEYS']:
+        return ({SECRET_KEY_ID: settings.SECRET_KEY}, SECRET_KEY_ID)
+    return (config['KEYS'], config['CURRENT_KEY'])
+
+
+def sign_download_link(productfile, customer_id):
+    """
+    Returns a token that lets `customer_id` download `productfile` until
+    it expires, and when that is. The token carries everything needed to
+    send the file, so checking it takes no query. It is signed but not
+    encrypted, so it names the customer only by id; the watermark text is
+    looked up when the file is sent.
+    """
+    (keys, key_id) = get_keys()
+    issued_at = time.time()
+    expires_at = int(issued_at) + settings.STORE_DOWNLOAD_LINKS['MAX_AGE']
+    modified_at = productfile.modified_at
+    payload = {
+        'c': customer_id,
+        'p': productfile.product_id,
+        'f': productfile.id,
+        'n': productfile.file.name,
+        's': productfile.size,
+        'h': productfile.sha256,
+        't': productfile.content_type,
+        'm': modified_at.timestamp() if modified_at else None,
+        'i': issued_at,
+        'e': expires_at,
+    }
+    signed = signing.Signer(key=keys[key_id], salt=SALT).sign_object(
+        payload, compress=True)
+    return (f'{key_id}:{signed}',
+            datetime.fromtimestamp(expires_at, timezone.utc))
+
+
+def verify_download_link(token):
+    """
+    Returns the (unsaved) product file a token from `sign_download_link`
+    names and the stamp to watermark it with, checking its signature, its
+    expiry and the revocations of its customer only.
+    """
+    (keys, _) = get_keys()
+    (key_id, _, signed) = token.partition(':')
+    if key_id not in keys:
+        raise InvalidDownloadLink()
+    try:
+        payload = signing.Signer(key=keys[key_id], salt=SALT).unsign_object(
+            signed)
+    except signing.BadSignature:
+        raise InvalidDownloadLink()
+
+    if payload['e'] <= time.time():
+        raise InvalidDownloadLink('Download link has expired.')
+    revoked_at = cache.get(_revocation_key(payload['c']))
+    if revoked_at is not None and payload['i'] <= revoked_at:
+        raise InvalidDownloadLink('Download link has been revoked.')
+
+    productfile = ProductFile(
+        id=payload['f'],
+        product_id=payload['p'],
+        file=payload['n'],
+        size=payload['s'],
+        sha256=payload['h'],
+        content_type=payload['t'],
+        modified_at=None if payload['m'] is None else datetime.fromtimestamp(
+            payload['m'], timezone.utc)
+    )
+    return (productfile, Stamp(payload['c'], None))
+
+
+def revoke_download_links(customer_id):
+    """
+    Rejects every download link issued to the customer up to now. Links
+    expire within MAX_AGE, so the marker does not have to outlive them.
+    """
+    def revoke():
+        cache.set(
+            _revocation_key(customer_id),
+            time.time(),
+            settings.STORE_DOWNLOAD_LINKS['MAX_AGE']
+        )
+
+    revoke()
+    transaction.on_commit(revoke)
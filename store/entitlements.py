@@ -0,0 +1,92 @@
+from uuid import uuid4
+from django.core.cache import cache
+from django.db import transaction
+from .download_links import revoke_download_links
+from .models import Order, OrderItem, OwnedProduct
+
+CACHE_TIMEOUT = 60 * 60
+
+
+def _cache_key(customer_id, product_id):
+    return f'store:owns:{customer_id}:{product_id}'
+
+
+def _version_key(customer_id):
+    return f'store:owns-version:{customer_id}'
+
+
+def owns_product(customer_id, product_id):
+    """
+    Entries carry the customer's version as it was before the lookup, so a
+    fill that races a sync is ignored once the sync bumps the version.
+    """
+    version_key = _version_key(customer_id)
+    key = _cache_key(customer_id, product_id)
+    cached = cache.get_many([version_key, key])
+    version = cached.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid4().hex, None)
+        version = cache.get(version_key)
+
+    entry = cached.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
+
+    owned = OwnedProduct.objects.filter(
+        customer_id=customer_id, product_id=product_id).exists()
+    cache.set(key, (version, owned), CACHE_TIMEOUT)
+    return owned
+
+
+def sync_owned_products(customer_ids):
+    customer_ids = list(customer_ids)
+    if not customer_ids:
+        return
+
+    expected = set(
+        OrderItem.objects
+        .filter(order__customer_id__in=customer_ids,
+                order__order_status=Order.COMPLETED_ORDER)
+        .values_list('order__customer_id', 'product_id')
+        .distinct()
+    )
+    current = set(
+        OwnedProduct.objects
+        .filter(customer_id__in=customer_ids)
+        .values_list('customer_id', 'product_id')
+    )
+    revoked = current - expected
+    granted = expected - current
+
+    with transaction.atomic():
+        revoked_by_customer = {}
+        for customer_id, product_id in revoked:
+            revoked_by_customer.setdefault(customer_id, []).append(product_id)
+        for customer_id, product_ids in revoked_by_customer.items():
+            OwnedProduct.objects.filter(
+                customer_id=customer_id, product_id__in=product_ids).delete()
+        OwnedProduct.objects.bulk_create(
+            [
+                OwnedProduct(customer_id=customer_id, product_id=product_id)
+                for customer_id, product_id in granted
+            ],
+            ignore_conflicts=True
+        )
+
+    for customer_id in revoked_by_customer:
+        # Links to files of products they no longer own stop working.
+        revoke_download_links(customer_id)
+
+    changed = {customer_id for customer_id, _ in revoked | granted}
+    if changed:
+        # Retire the cached entries now for this request and again once the
+        # surrounding transaction is visible to everyone else.
+        def bump():
+            cache.set_many(
+                {_version_key(customer_id): uuid4().hex
+                 for customer_id in changed},
+                None
+            )
+
+        bump()
+        transaction.on_commit(bump)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from store.entitlements import sync_owned_products
+from store.models import Customer, Order
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the owned products table from completed orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        customer_ids = (
+            Customer.objects
+            .filter(
+                Q(orders__order_status=Order.COMPLETED_ORDER) |
+                Q(owned_products__isnull=False)
+            )
+            .values_list('id', flat=True)
+            .distinct()
+            .order_by('id')
+        )
+
+        synced = 0
+        batch = []
+        for customer_id in customer_ids.iterator(chunk_size=batch_size):
+            batch.append(customer_id)
+            if len(batch) == batch_size:
+                sync_owned_products(batch)
+                synced += len(batch)
+                batch = []
+        sync_owned_products(batch)
+        synced += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Synced owned products for {synced} customers.'))
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from core.jobs import enqueue_many
+from store.models import ProductFile
+from store.tasks import fill_product_file_metadata
+
+
+class Command(BaseCommand):
+    help = ('Fills in the size, digest, page count, content type and '
+            'modification time of product files stored without them, and '
+            'the names of files uploaded without one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Reads every file again, not only those '
+                                 'missing metadata.')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queues a background job per file for '
+                                 'run_jobs workers instead of reading them '
+                                 'here.')
+
+    def handle(self, *args, **options):
+        storage = ProductFile._meta.get_field('file').storage
+        rows = ProductFile.objects.exclude(file='')
+        if not options['all']:
+            rows = rows.filter(Q(size__isnull=True) | Q(filename=''))
+        names = list(
+            rows.order_by('file').values_list('file', flat=True).distinct())
+
+        if options['enqueue']:
+            # A file already waiting for a worker is not queued twice.
+            enqueue_many(
+                'store.fill_product_file_metadata',
+                [{'name': name} for name in names],
+                dedupe_keys=[f'store.fill_product_file_metadata:{name}'
+                             for name in names]
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'Queued {len(names)} files.'))
+            return
+
+        (filled, missing) = (0, 0)
+        # Rows sharing a blob share its metadata, so each file is read once.
+        for name in names:
+            if not storage.exists(name):
+                missing += 1
+                self.stderr.write(f'Missing file: {name}')
+                continue
+            filled += fill_product_file_metadata(name)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Filled in {filled} product files, {missing} files missing.'))
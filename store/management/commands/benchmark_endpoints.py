@@ -0,0 +1,324 @@
+import json
+import random
+import statistics
+import tempfile
+import time
+from itertools import count
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment)
+from django.utils import timezone
+from rest_framework.test import APIClient
+from core.models import User
+from core.serializers import TokenObtainPairSerializer
+from store.entitlements import sync_owned_products
+from store.metadata import METADATA_FIELDS
+from store.models import (
+    Category, Customer, Order, OrderItem, Product, ProductFile)
+from .loadtest_downloads import percentile
+
+BATCH_SIZE = 5000
+PASSWORD = 'BenchMark-123456'
+ENDPOINTS = ['products', 'categories', 'customers', 'files', 'download',
+             'signup', 'token']
+LOCAL_CACHES = {
+    alias: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': f'benchmark_endpoints_{alias}'
+    }
+    for alias in settings.CACHES
+}
+
+
+def compare_results(baseline, current, threshold, min_delta=1.0):
+    """
+    Returns a line for each endpoint of `current` whose p50 or p95 grew by
+    more than `threshold` (a fraction) and `min_delta` milliseconds over
+    `baseline`, or that runs more queries per request.
+    """
+    regressions = []
+    for (scale, endpoints) in current['results'].items():
+        for (name, metrics) in endpoints.items():
+            before = baseline['results'].get(scale, {}).get(name)
+            if before is None:
+                continue
+            for key in ('p50', 'p95'):
+                if metrics[key] > max(before[key] * (1 + threshold),
+                                      before[key] + min_delta):
+                    regressions.append(
+                        f'{name} at {scale}: {key} {before[key]:.2f}ms -> '
+                        f'{metrics[key]:.2f}ms')
+            if metrics['queries'] > before['queries']:
+                regressions.append(
+                    f'{name} at {scale}: queries {before["queries"]:g} -> '
+                    f'{metrics["queries"]:g}')
+    return regressions
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway database at growing scales and reports the '
+            'latency, throughput and queries per request of the store and '
+            'auth endpoints, optionally comparing them with a saved run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', type=int, nargs='+',
+                            default=[1_000, 10_000],
+                            help='Numbers of products to seed.')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Timed requests per endpoint and scale.')
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS,
+                            default=ENDPOINTS)
+        parser.add_argument('--file-size', type=int, default=1024 * 1024)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--save', help='Writes the results to this file.')
+        parser.add_argument('--compare',
+                            help='Compares with results saved by --save.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Latency growth counted as a regression.')
+        parser.add_argument('--min-delta', type=float, default=1.0,
+                            help='Milliseconds of growth below which '
+                                 'latency changes are ignored.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file_handle:
+                baseline = json.load(file_handle)
+
+        self.rng = random.Random(options['seed'])
+        self.signups = count()
+        results = {
+            'database': connection.vendor,
+            'requests': options['requests'],
+            'started_at': timezone.now().isoformat(),
+            'results': {}
+        }
+
+        # Keeps the rate limit checks in the timings without turning the
+        # benchmark's requests away.
+        throttles = {
+            **settings.THROTTLES,
+            'RATES': {
+                route: {principal: f'{10 ** 9}/s' for principal in rates}
+                for (route, rates) in settings.THROTTLES['RATES'].items()
+            }
+        }
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True)
+        setup_test_environment()
+        try:
+            with tempfile.TemporaryDirectory() as media_root, \
+                    override_settings(
+                        CACHES=LOCAL_CACHES, MEDIA_ROOT=media_root,
+                        THROTTLES=throttles):
+                self.setup_clients(options['file_size'])
+                for scale in sorted(options['scales']):
+                    self.seed(scale)
+                    results['results'][str(scale)] = self.run(
+                        scale, options)
+        finally:
+            teardown_test_environment()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        if options['save']:
+            with open(options['save'], 'w') as file_handle:
+                json.dump(results, file_handle, indent=2)
+        if baseline is not None:
+            if baseline['database'] != results['database']:
+                self.stderr.write(
+                    f'Baseline ran on {baseline["database"]}, this run on '
+                    f'{results["database"]}.')
+            regressions = compare_results(
+                baseline, results, options['threshold'],
+                options['min_delta'])
+            if regressions:
+                raise CommandError(
+                    f'{len(regressions)} regressions:\n'
+                    + '\n'.join(regressions))
+            self.stdout.write('No regressions.')
+
+    def setup_clients(self, file_size):
+        user = User.objects.create_user(
+            username='bench', email='bench@example.com', password=PASSWORD)
+        self.customer = Customer.objects.get(user=user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer {}'.format(
+            TokenObtainPairSerializer.get_token(user).access_token))
+        self.anonymous = APIClient()
+
+        # Every product file shares one blob, as identical uploads do.
+        productfile = ProductFile(
+            product=Product.objects.create(
+                title='Bench', description='', unit_price=10,
+                category=Category.objects.create(title='Bench')),
+            filename='bench.pdf')
+        productfile.file.save(
+            'bench.pdf', ContentFile(b'%PDF-' + b'0' * (file_size - 5)))
+        self.blob = productfile.file.name
+        self.metadata = {
+            field: getattr(productfile, field) for field in METADATA_FIELDS}
+        self.owned = []
+
+    def seed(self, scale):
+        """
+        Grows the catalog to `scale` products, with a customer and three
+        orders for every ten products.
+        """
+        products = Product.objects.count()
+        if products >= scale:
+            return
+        rng = self.rng
+        Category.objects.bulk_create([
+            Category(title=f'Category {i}')
+            for i in range(max((scale - products) // 200, 1))
+        ])
+        category_ids = list(Category.objects.values_list('id', flat=True))
+        self.create(Product, scale - products, lambda i: Product(
+            title=f'Product {products + i}',
+            description='',
+            unit_price=rng.randint(100, 9999) / 100,
+            category_id=rng.choice(category_ids)
+        ))
+        new_products = list(
+            Product.objects.order_by('-id')
+            .values_list('id', flat=True)[:scale - products])
+        self.create(ProductFile, len(new_products), lambda i: ProductFile(
+            product_id=new_products[i], file=self.blob,
+            filename='bench.pdf', **self.metadata))
+
+        # Logging in works for seeded users too, at the same hashing cost.
+        password = make_password(PASSWORD)
+        customers = (scale - products) // 10
+        first_user = User.objects.count()
+        self.create(User, customers, lambda i: User(
+            username=f'user{first_user + i}',
+            email=f'user{first_user + i}@example.com',
+            password=password))
+        user_ids = list(
+            User.objects.filter(customer__isnull=True)
+            .values_list('id', flat=True))
+        self.create(Customer, len(user_ids), lambda i: Customer(
+            user_id=user_ids[i], phone=''))
+        customer_ids = list(
+            Customer.objects.filter(user_id__in=user_ids)
+            .values_list('id', flat=True)) + [self.customer.id]
+        self.create(Order, len(customer_ids) * 3, lambda i: Order(
+            customer_id=customer_ids[i // 3],
+            order_status=Order.COMPLETED_ORDER))
+        order_ids = list(
+            Order.objects.filter(customer_id__in=customer_ids)
+            .values_list('id', flat=True))
+        self.create(OrderItem, len(order_ids), lambda i: OrderItem(
+            order_id=order_ids[i], product_id=rng.choice(new_products),
+            quantity=1, unit_price=10))
+        for start in range(0, len(customer_ids), 500):
+            sync_owned_products(customer_ids[start:start + 500])
+
+        self.owned = list(
+            ProductFile.objects
+            .filter(product__in=self.customer.owned_products.values(
+                'product_id'))
+            .values_list('product_id', 'id'))
+        self.category_ids = category_ids
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def create(self, model, total, make):
+        for start in range(0, total, BATCH_SIZE):
+            model.objects.bulk_create([
+                make(i) for i in range(start, min(start + BATCH_SIZE, total))
+            ])
+
+    def endpoints(self):
+        rng = self.rng
+        client = self.client
+        anonymous = self.anonymous
+
+        def signup():
+            number = next(self.signups)
+            return anonymous.post('/auth/users/', {
+                'username': f'signup{number}',
+                'email': f'signup{number}@example.com',
+                'password': PASSWORD
+            })
+
+        def download():
+            (product_id, file_id) = rng.choice(self.owned)
+            response = client.get(
+                f'/store/products/{product_id}/files/{file_id}/')
+            # Reads the body, as a client would.
+            for _ in response.streaming_content:
+                pass
+            response.close()
+            return response
+
+        return {
+            'products': lambda: client.get(
+                f'/store/products/?category={rng.choice(self.category_ids)}'),
+            'categories': lambda: client.get('/store/categories/'),
+            'customers': lambda: client.get('/store/customers/'),
+            'files': lambda: client.get(
+                f'/store/products/{rng.choice(self.owned)[0]}/files/'),
+            'download': download,
+            'signup': signup,
+            'token': lambda: anonymous.post('/auth/token/', {
+                'username': 'bench', 'password': PASSWORD}),
+        }
+
+    def run(self, scale, options):
+        self.stdout.write(
+            f'scale={scale} database={connection.vendor} '
+            f'requests={options["requests"]}')
+        self.stdout.write(
+            f'{"endpoint":<12} {"p50":>9} {"p95":>9} {"p99":>9} '
+            f'{"req/s":>8} {"queries":>8}')
+        endpoints = self.endpoints()
+        results = {}
+        for name in options['endpoints']:
+            request = endpoints[name]
+            for _ in range(options['warmup']):
+                self.send(name, request)
+            results[name] = self.measure(name, request, options['requests'])
+            metrics = results[name]
+            self.stdout.write(
+                f'{name:<12} {metrics["p50"]:>7.2f}ms '
+                f'{metrics["p95"]:>7.2f}ms {metrics["p99"]:>7.2f}ms '
+                f'{metrics["throughput"]:>8.1f} {metrics["queries"]:>8.1f}')
+        return results
+
+    def send(self, name, request):
+        response = request()
+        if response.status_code >= 400:
+            raise CommandError(
+                f'{name} returned {response.status_code}: '
+                f'{getattr(response, "data", "")}')
+
+    def measure(self, name, request, total):
+        latencies = []
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_queries):
+            for _ in range(total):
+                request_start = time.perf_counter()
+                self.send(name, request)
+                latencies.append(
+                    (time.perf_counter() - request_start) * 1000)
+        elapsed = time.perf_counter() - start
+        return {
+            'p50': statistics.median(latencies),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'throughput': total / elapsed,
+            'queries': queries[0] / total,
+        }
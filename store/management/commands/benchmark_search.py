@@ -0,0 +1,130 @@
+import random
+import statistics
+import time
+from itertools import accumulate
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max, Q
+from store.models import Category, Product
+from store.search import search_products
+
+BATCH_SIZE = 5000
+
+
+def make_vocabulary(rng, size):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(letters)
+                  for _ in range(rng.randint(4, 10))))
+    return sorted(words)
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway database with growing product catalogs and '
+            'reports product search latency for each size.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--vocabulary', type=int, default=50_000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        vocabulary = make_vocabulary(rng, options['vocabulary'])
+        # Zipf-like weights so that, as in a real catalog, a few words are
+        # common and most are rare.
+        weights = list(accumulate(
+            1 / rank for rank in range(1, len(vocabulary) + 1)))
+
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            self.stdout.write(
+                f'database={connection.vendor} '
+                f'vocabulary={len(vocabulary)} queries={options["queries"]}')
+            self.stdout.write(
+                f'{"products":>10} {"search p50":>12} {"search p95":>12} '
+                f'{"substring p50":>14}')
+
+            category_ids = [
+                category.id for category in Category.objects.bulk_create(
+                    [Category(title=f'Category {i}') for i in range(50)])
+            ]
+            seeded = 0
+            previous = None
+            for size in sorted(options['sizes']):
+                self.seed(rng, vocabulary, weights,
+                          category_ids, size - seeded)
+                seeded = size
+                queries = self.sample_queries(
+                    rng, vocabulary, options['queries'])
+
+                search = self.measure(queries, self.run_search)
+                substring = self.measure(queries[:5], self.run_substring)
+                self.stdout.write(
+                    f'{size:>10} {search[0]:>10.2f}ms {search[1]:>10.2f}ms '
+                    f'{substring[0]:>12.2f}ms')
+
+                if previous is not None:
+                    (previous_size, previous_p50) = previous
+                    self.stdout.write(
+                        f'{"":>10} size x{size / previous_size:.1f}, '
+                        f'search p50 x{search[0] / previous_p50:.2f}')
+                previous = (size, search[0])
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb'])
+
+    def seed(self, rng, vocabulary, weights, category_ids, count):
+        while count > 0:
+            batch = min(BATCH_SIZE, count)
+            Product.objects.bulk_create([
+                Product(
+                    title=' '.join(
+                        rng.choices(vocabulary, cum_weights=weights, k=4)),
+                    description=' '.join(
+                        rng.choices(vocabulary, cum_weights=weights, k=40)),
+                    unit_price=rng.randint(100, 9999) / 100,
+                    category_id=rng.choice(category_ids)
+                )
+                for _ in range(batch)
+            ])
+            count -= batch
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE store_product')
+
+    def sample_queries(self, rng, vocabulary, count):
+        max_id = Product.objects.aggregate(max_id=Max('id'))['max_id']
+        titles = Product.objects.filter(
+            pk__in=[rng.randint(1, max_id) for _ in range(count)]
+        ).values_list('title', flat=True)
+        queries = [' '.join(title.split()[:2]) for title in titles]
+        return queries or rng.sample(vocabulary, count)
+
+    def measure(self, queries, run):
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            run(query)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        return (statistics.median(timings), p95)
+
+    def run_search(self, query):
+        queryset = search_products(
+            Product.objects.defer('search_vector'), query)
+        return list(queryset.order_by('-rank', 'id')[:20])
+
+    def run_substring(self, query):
+        terms = query.split()
+        queryset = Product.objects.defer('search_vector')
+        for term in terms:
+            queryset = queryset.filter(
+                Q(title__icontains=term) | Q(description__icontains=term))
+        return list(queryset.order_by('id')[:20])
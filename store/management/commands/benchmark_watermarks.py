@@ -0,0 +1,194 @@
+import json
+import tempfile
+import time
+import zlib
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+from store import watermark
+from store.delivery import InProcessDelivery
+from store.metadata import read_metadata
+from store.models import ProductFile
+from store.watermark import Stamp, build_template, render
+
+TEXT = 'Licensed to Benchmark Reader <reader@example.com>'
+LINE = b'BT /F1 11 Tf 72 700 Td (The quick brown fox jumps over the lazy dog.) Tj ET\n'
+
+
+def build_pdf(pages, page_size=1024, xref_stream=False):
+    """
+    Returns a PDF of `pages` pages of text, each with a content stream of
+    about `page_size` bytes. With `xref_stream`, the pages are kept in an
+    object stream and indexed by a compressed xref stream, as PDF 1.5
+    writers do.
+    """
+    lines = (LINE * (page_size // len(LINE) + 1))[:page_size]
+    # 1 catalog, 2 page tree, 3 resources, then a content stream and a
+    # page for each page.
+    first_page = 4 + pages
+    objects = {
+        1: b'<< /Type /Catalog /Pages 2 0 R >>',
+        2: b'<< /Type /Pages /MediaBox [0 0 612 792] /Count %d /Kids [%s] >>' % (
+            pages, b' '.join(b'%d 0 R' % (first_page + page)
+                             for page in range(pages))),
+        3: b'<< /Font << /F1 << /Type /Font /Subtype /Type1 '
+           b'/BaseFont /Times-Roman >> >> >>',
+    }
+    for page in range(pages):
+        objects[4 + page] = b'<< /Length %d >>\nstream\n%s\nendstream' % (
+            len(lines), lines)
+        objects[first_page + page] = (
+            b'<< /Type /Page /Parent 2 0 R /Resources 3 0 R '
+            b'/Contents %d 0 R >>' % (4 + page))
+
+    output = bytearray(b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n')
+    offsets = {}
+    packed = {}
+    if xref_stream:
+        (header, data) = (b'', b'')
+        for (index, num) in enumerate(range(first_page, first_page + pages)):
+            header += b'%d %d ' % (num, len(data))
+            data += objects.pop(num) + b'\n'
+            packed[num] = index
+        object_stream = zlib.compress(header + data)
+        objects[first_page + pages] = (
+            b'<< /Type /ObjStm /N %d /First %d /Filter /FlateDecode '
+            b'/Length %d >>\nstream\n%s\nendstream' % (
+                pages, len(header), len(object_stream), object_stream))
+
+    for (num, body) in sorted(objects.items()):
+        offsets[num] = len(output)
+        output += b'%d 0 obj\n%s\nendobj\n' % (num, body)
+
+    size = max(list(offsets) + list(packed)) + 1
+    if not xref_stream:
+        xref_offset = len(output)
+        output += b'xref\n0 %d\n0000000000 65535 f\r\n' % size
+        for num in range(1, size):
+            output += b'%010d 00000 n\r\n' % offsets[num]
+        output += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (
+            size, xref_offset)
+        return bytes(output)
+
+    xref_num = size
+    xref_offset = len(output)
+    offsets[xref_num] = xref_offset
+    rows = [b'\x00\x00\x00\x00\x00\xff\xff']
+    for num in range(1, xref_num + 1):
+        if num in packed:
+            rows.append(b'\x02' + (first_page + pages).to_bytes(4, 'big') +
+                        packed[num].to_bytes(2, 'big'))
+        else:
+            rows.append(b'\x01' + offsets[num].to_bytes(4, 'big') + b'\x00\x00')
+    # PNG "up" predictor, as most writers use for xref streams.
+    previous = bytes(7)
+    predicted = b''
+    for row in rows:
+        predicted += b'\x02' + bytes(
+            (byte - above) & 0xff for (byte, above) in zip(row, previous))
+        previous = row
+    stream = zlib.compress(predicted)
+    output += (
+        b'%d 0 obj\n<< /Type /XRef /Size %d /W [1 4 2] /Root 1 0 R '
+        b'/Filter /FlateDecode /DecodeParms << /Predictor 12 /Columns 7 >> '
+        b'/Length %d >>\nstream\n%s\nendstream\nendobj\n'
+        b'startxref\n%d\n%%%%EOF\n' % (
+            xref_num, xref_num + 1, len(stream), stream, xref_offset))
+    return bytes(output)
+
+
+class Command(BaseCommand):
+    help = ('Builds PDFs of growing page counts and reports how long '
+            'parsing their page layout and stamping them takes, and the '
+            'download throughput of the stamped and plain files.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, nargs='+',
+                            default=[100, 500, 2000])
+        parser.add_argument('--page-size', type=int, default=16 * 1024,
+                            help='Bytes of page content per page.')
+        parser.add_argument('--xref-stream', action='store_true',
+                            help='Builds PDF 1.5 files with object and '
+                                 'xref streams.')
+        parser.add_argument('--downloads', type=int, default=5,
+                            help='Timed downloads per file.')
+        parser.add_argument('--save', help='Writes the results to this file.')
+
+    def handle(self, *args, **options):
+        results = {
+            'page_size': options['page_size'],
+            'xref_stream': options['xref_stream'],
+            'started_at': timezone.now().isoformat(),
+            'results': {}
+        }
+        with tempfile.TemporaryDirectory() as media_root, \
+                override_settings(MEDIA_ROOT=media_root):
+            for pages in sorted(options['pages']):
+                results['results'][str(pages)] = self.run(pages, options)
+
+        if options['save']:
+            with open(options['save'], 'w') as file_handle:
+                json.dump(results, file_handle, indent=2)
+
+    def run(self, pages, options):
+        storage = ProductFile._meta.get_field('file').storage
+        content = build_pdf(pages, options['page_size'],
+                            options['xref_stream'])
+        name = storage.save(f'store/products/files/{pages}.pdf',
+                            ContentFile(content))
+        productfile = ProductFile(id=pages, file=name,
+                                  **read_metadata(storage, name))
+        size = len(content)
+
+        start = time.perf_counter()
+        with storage.open(name, 'rb') as file_handle:
+            template = build_template(file_handle, size)
+        parse_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        suffix = render(template, TEXT)
+        render_seconds = time.perf_counter() - start
+
+        watermark.cache.clear()
+        delivery = InProcessDelivery()
+        request = RequestFactory().get('/')
+        plain = [self.download(delivery, request, productfile, None)
+                 for _ in range(options['downloads'])]
+        cold = []
+        for customer_id in range(options['downloads']):
+            watermark.cache.clear()
+            cold.append(self.download(
+                delivery, request, productfile, Stamp(customer_id, TEXT)))
+        warm = [
+            self.download(delivery, request, productfile, Stamp(0, TEXT))
+            for _ in range(options['downloads'])
+        ]
+
+        result = {
+            'pages': pages,
+            'file_bytes': size,
+            'watermark_bytes': len(suffix),
+            'parse_ms': parse_seconds * 1000,
+            'render_ms': render_seconds * 1000,
+            'plain_mib_s': size / 2 ** 20 / min(plain),
+            'cold_mib_s': (size + len(suffix)) / 2 ** 20 / min(cold),
+            'warm_mib_s': (size + len(suffix)) / 2 ** 20 / min(warm),
+        }
+        self.stdout.write(
+            f'pages={pages} size={size / 2 ** 20:.1f}MiB '
+            f'watermark={len(suffix) / 1024:.1f}KiB '
+            f'parse={result["parse_ms"]:.1f}ms '
+            f'render={result["render_ms"]:.2f}ms')
+        self.stdout.write(
+            f'  download plain={result["plain_mib_s"]:.0f}MiB/s '
+            f'stamped cold={result["cold_mib_s"]:.0f}MiB/s '
+            f'warm={result["warm_mib_s"]:.0f}MiB/s')
+        return result
+
+    def download(self, delivery, request, productfile, stamp):
+        start = time.perf_counter()
+        response = delivery.serve(request, productfile, stamp)
+        for _ in response:
+            pass
+        response.close()
+        return time.perf_counter() - start
@@ -0,0 +1,213 @@
+import random
+import string
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment,
+    teardown_test_environment)
+from rest_framework.test import APIClient
+from core.models import User
+from core.serializers import TokenObtainPairSerializer
+from store.entitlements import sync_owned_products
+from store.models import (
+    Category, Customer, Order, OrderItem, Product, ProductFile)
+from store.query_plans import explain, seq_scans, used_indexes
+
+BATCH_SIZE = 5000
+# Private caches, emptied before each request so every query reaches the
+# database.
+LOCAL_CACHES = {
+    alias: {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': f'check_query_plans_{alias}'
+    }
+    for alias in settings.CACHES
+}
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway database, runs the queries behind each hot '
+            'endpoint under EXPLAIN ANALYZE and fails if any of them reads '
+            'a large table with a sequential scan.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50_000)
+        parser.add_argument('--customers', type=int, default=5_000)
+        parser.add_argument('--orders-per-customer', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Query plans are only checked on PostgreSQL.')
+
+        rng = random.Random(options['seed'])
+        self.words = [
+            ''.join(rng.choices(string.ascii_lowercase, k=8))
+            for _ in range(5000)
+        ]
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        setup_test_environment()
+        try:
+            with override_settings(CACHES=LOCAL_CACHES):
+                self.seed(rng, options)
+                failures = self.check_plans(self.endpoints())
+        finally:
+            teardown_test_environment()
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb'])
+
+        if failures:
+            raise CommandError(
+                f'{len(failures)} queries scan a hot table sequentially:\n'
+                + '\n'.join(failures))
+        self.stdout.write('No hot query uses a sequential scan.')
+
+    def seed(self, rng, options):
+        if Product.objects.exists():
+            # Kept from an earlier run with --keepdb.
+            return
+
+        categories = Category.objects.bulk_create(
+            [Category(title=f'Category {i}') for i in range(200)])
+        self.create(Product, options['products'], lambda i: Product(
+            title=' '.join(rng.sample(self.words, 3)),
+            description=' '.join(rng.choices(self.words, k=20)),
+            unit_price=rng.randint(100, 9999) / 100,
+            category=rng.choice(categories)
+        ))
+        product_ids = list(Product.objects.values_list('id', flat=True))
+        self.create(ProductFile, len(product_ids), lambda i: ProductFile(
+            product_id=product_ids[i],
+            file=f'store/products/files/{i}.pdf',
+            filename=f'{i}.pdf'
+        ))
+
+        self.create(User, options['customers'], lambda i: User(
+            username=f'customer{i}', email=f'customer{i}@example.com',
+            password='!'))
+        user_ids = list(
+            User.objects.order_by('id').values_list('id', flat=True))
+        self.create(Customer, len(user_ids), lambda i: Customer(
+            user_id=user_ids[i], phone=''))
+        customer_ids = list(Customer.objects.values_list('id', flat=True))
+
+        statuses = [Order.COMPLETED_ORDER] * 8 + [
+            Order.PENDING_ORDER, Order.CANCELED_ORDER]
+        self.create(
+            Order, len(customer_ids) * options['orders_per_customer'],
+            lambda i: Order(
+                customer_id=customer_ids[i % len(customer_ids)],
+                order_status=rng.choice(statuses)
+            ))
+        order_ids = list(Order.objects.values_list('id', flat=True))
+        self.create(OrderItem, len(order_ids) * 3, lambda i: OrderItem(
+            order_id=order_ids[i // 3],
+            product_id=rng.choice(product_ids),
+            quantity=rng.randint(1, 3),
+            unit_price=10
+        ))
+        for start in range(0, len(customer_ids), 500):
+            sync_owned_products(customer_ids[start:start + 500])
+
+        with connection.cursor() as cursor:
+            # placed_at is set on insert, so spread the orders over a year.
+            cursor.execute(
+                "UPDATE store_order SET placed_at = "
+                "placed_at - random() * interval '365 days'")
+            cursor.execute('ANALYZE')
+
+    def create(self, model, count, make):
+        for start in range(0, count, BATCH_SIZE):
+            model.objects.bulk_create([
+                make(i) for i in range(start, min(start + BATCH_SIZE, count))
+            ])
+
+    def endpoints(self):
+        """
+        Returns (name, client, method, path, data) for each request to
+        check, or (name, callable) for code that runs outside a view.
+        """
+        owner = (
+            Customer.objects
+            .filter(owned_products__isnull=False)
+            .select_related('user')
+            .order_by('?')
+            .first()
+        )
+        product = Product.objects.get(
+            pk=owner.owned_products.values_list(
+                'product_id', flat=True).first())
+        order_id = owner.orders.values_list('id', flat=True).first()
+
+        customer = APIClient()
+        customer.credentials(HTTP_AUTHORIZATION='Bearer {}'.format(
+            TokenObtainPairSerializer.get_token(owner.user).access_token))
+        staff = APIClient()
+        staff.force_authenticate(
+            User.objects.create(
+                username='staff', email='staff@example.com', is_staff=True))
+
+        return [
+            ('product list', customer, 'get', '/store/products/', None),
+            ('product list by category', customer, 'get',
+             f'/store/products/?category={product.category_id}', None),
+            ('product list by price', customer, 'get',
+             '/store/products/?min_price=10&max_price=20', None),
+            ('product search', customer, 'get',
+             f'/store/products/?search={product.title.split()[0]}', None),
+            ('product detail', customer, 'get',
+             f'/store/products/{product.id}/', None),
+            ('category list', customer, 'get', '/store/categories/', None),
+            ('product files', customer, 'get',
+             f'/store/products/{product.id}/files/', None),
+            ('customer profile', customer, 'get', '/store/customers/', None),
+            ('customer list', staff, 'get', '/store/customers/', None),
+            ('order list', customer, 'get', '/store/orders/', None),
+            ('order detail', customer, 'get',
+             f'/store/orders/{order_id}/', None),
+            ('checkout', customer, 'post', '/store/orders/',
+             {'items': [{'product': product.id, 'quantity': 1}]}),
+            ('product sales', staff, 'get',
+             f'/store/analytics/products/?product={product.id}', None),
+            ('entitlement sync',
+             lambda: sync_owned_products([owner.id])),
+        ]
+
+    def check_plans(self, endpoints):
+        failures = []
+        for (name, *request) in endpoints:
+            for cache in caches.all():
+                cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                if len(request) == 1:
+                    request[0]()
+                else:
+                    (client, method, path, data) = request
+                    response = getattr(client, method)(
+                        path, data, format='json' if data else None)
+                    if response.status_code >= 400:
+                        raise CommandError(
+                            f'{name}: {method.upper()} {path} returned '
+                            f'{response.status_code}.')
+
+            selects = [
+                query['sql'] for query in queries.captured_queries
+                if query['sql'].startswith('SELECT')
+            ]
+            self.stdout.write(f'{name} ({len(selects)} queries)')
+            for sql in selects:
+                plan = explain(sql)
+                scanned = seq_scans(plan)
+                indexes = ', '.join(used_indexes(plan)) or '-'
+                self.stdout.write(
+                    f'  {plan["Execution Time"]:8.2f}ms '
+                    f'{"SEQ SCAN " + ", ".join(scanned) if scanned else "ok"}'
+                    f' [{indexes}]')
+                if scanned:
+                    failures.append(
+                        f'{name}: {", ".join(scanned)}\n    {sql}')
+        return failures
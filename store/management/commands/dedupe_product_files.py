@@ -0,0 +1,51 @@
+import hashlib
+import os
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from store.models import ProductFile
+
+
+class Command(BaseCommand):
+    help = ('Moves product files stored before content addressing into '
+            'blobs, so identical files are stored once.')
+
+    def handle(self, *args, **options):
+        storage = ProductFile._meta.get_field('file').storage
+        names = (
+            ProductFile.objects
+            .order_by('file')
+            .values_list('file', flat=True)
+            .distinct()
+        )
+
+        (moved, reused, freed, missing) = (0, 0, 0, 0)
+        for name in list(names.iterator()):
+            if storage.is_blob(name):
+                continue
+            if not storage.exists(name):
+                missing += 1
+                self.stderr.write(f'Missing file: {name}')
+                continue
+
+            hasher = hashlib.sha256()
+            with storage.open(name, 'rb') as file_handle:
+                content = File(file_handle)
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+                content.sha256 = hasher.hexdigest()
+                if storage.exists(storage.blob_name(name, content.sha256)):
+                    reused += 1
+                    freed += content.size
+                blob = storage.save(name, content)
+
+            with transaction.atomic():
+                ProductFile.objects.filter(file=name, filename='').update(
+                    filename=os.path.basename(name))
+                ProductFile.objects.filter(file=name).update(file=blob)
+            storage.delete(name)
+            moved += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {moved} files into blobs, {reused} of them were '
+            f'duplicates ({freed} bytes freed), {missing} missing.'))
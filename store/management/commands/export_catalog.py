@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from store.catalog import CSV, NDJSON, export_catalog
+
+
+class Command(BaseCommand):
+    help = 'Streams the whole product catalog as CSV or NDJSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=[CSV, NDJSON], default=CSV)
+        parser.add_argument('--output', help='Defaults to stdout.')
+
+    def handle(self, *args, **options):
+        lines = export_catalog(options['format'])
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        with open(options['output'], 'w', newline='') as output:
+            for line in lines:
+                output.write(line)
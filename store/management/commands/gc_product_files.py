@@ -0,0 +1,62 @@
+import os
+import time
+from django.core.management.base import BaseCommand
+from store.models import PRODUCT_FILES_DIRECTORY, ProductFile
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = ('Deletes product file blobs that no product file references '
+            'and leftovers of interrupted saves.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help='Keeps files touched more recently than this, in case a '
+                 'save is about to reference them.')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        storage = ProductFile._meta.get_field('file').storage
+        root = storage.path(PRODUCT_FILES_DIRECTORY)
+        cutoff = time.time() - options['grace_hours'] * 60 * 60
+
+        self.deleted = 0
+        self.freed = 0
+        batch = []
+        for (directory, _, filenames) in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, storage.location).replace(
+                    os.sep, '/')
+                if os.stat(path).st_mtime > cutoff:
+                    continue
+                if filename.endswith('.tmp'):
+                    self.delete(path, options['dry_run'])
+                elif storage.is_blob(name):
+                    batch.append((name, path))
+                if len(batch) == BATCH_SIZE:
+                    self.collect(batch, options['dry_run'])
+                    batch = []
+        self.collect(batch, options['dry_run'])
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {self.deleted} files ({self.freed} bytes).'))
+
+    def collect(self, batch, dry_run):
+        referenced = set(
+            ProductFile.objects
+            .filter(file__in=[name for (name, _) in batch])
+            .values_list('file', flat=True)
+        )
+        for (name, path) in batch:
+            if name not in referenced:
+                self.delete(path, dry_run)
+
+    def delete(self, path, dry_run):
+        self.deleted += 1
+        self.freed += os.path.getsize(path)
+        if not dry_run:
+            os.remove(path)
@@ -0,0 +1,28 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from store.catalog import BATCH_SIZE, CSV, NDJSON, CatalogImporter, get_format
+
+
+class Command(BaseCommand):
+    help = 'Imports products from a CSV or NDJSON file, keyed on ISBN.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=[CSV, NDJSON])
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or get_format(filename=options['path'])
+        if file_format is None:
+            raise CommandError('Could not tell the format, pass --format.')
+
+        with open(options['path'], 'rb') as stream:
+            report = CatalogImporter(options['batch_size']).run(
+                stream, file_format)
+
+        for error in report['errors']:
+            self.stderr.write(
+                f'line {error["line"]}: {json.dumps(error["errors"])}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {report["created"]}, updated {report["updated"]}, '
+            f'{report["error_count"]} rows with errors.'))
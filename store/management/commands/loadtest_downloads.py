@@ -0,0 +1,147 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Command(BaseCommand):
+    help = ('Opens many concurrent downloads that read at a slow, fixed '
+            'rate against a running server, while timing a small request '
+            'alongside them to show whether the worker stays responsive.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='URL of a product file download.')
+        parser.add_argument('--token', help='Access token to send.')
+        parser.add_argument('--clients', type=int, default=2000)
+        parser.add_argument('--rate', type=int, default=64 * 1024,
+                            help='Bytes per second each client reads.')
+        parser.add_argument('--ramp', type=float, default=5,
+                            help='Seconds over which clients connect.')
+        parser.add_argument('--probe-interval', type=float, default=0.25)
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Only http:// URLs are supported.')
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.path = url.path + (f'?{url.query}' if url.query else '')
+        self.token = options['token']
+        self.open_connections = 0
+        self.peak_connections = 0
+
+        results = asyncio.run(self.run(options))
+        (downloads, probes, elapsed) = results
+        completed = [result for result in downloads if result[0]]
+        received = sum(result[2] for result in downloads)
+        first_bytes = [result[1] * 1000 for result in completed]
+        probe_latencies = [latency * 1000 for latency in probes]
+
+        self.stdout.write(
+            f'clients={options["clients"]} completed={len(completed)} '
+            f'failed={len(downloads) - len(completed)} '
+            f'peak_open={self.peak_connections}')
+        self.stdout.write(
+            f'elapsed={elapsed:.1f}s received={received / 2 ** 20:.1f}MiB '
+            f'throughput={received / 2 ** 20 / elapsed:.1f}MiB/s')
+        if first_bytes:
+            self.stdout.write(
+                f'time to first byte p50={statistics.median(first_bytes):.1f}ms '
+                f'p95={percentile(first_bytes, 0.95):.1f}ms '
+                f'p99={percentile(first_bytes, 0.99):.1f}ms')
+        if probe_latencies:
+            self.stdout.write(
+                f'probe during load ({len(probe_latencies)} requests) '
+                f'p50={statistics.median(probe_latencies):.1f}ms '
+                f'p99={percentile(probe_latencies, 0.99):.1f}ms '
+                f'max={max(probe_latencies):.1f}ms')
+
+    async def run(self, options):
+        start = time.perf_counter()
+        clients = options['clients']
+        delay = options['ramp'] / clients if clients else 0
+        downloads = [
+            asyncio.create_task(self.download(
+                options['rate'], delay * number))
+            for number in range(clients)
+        ]
+        done = asyncio.Event()
+        probes = asyncio.create_task(
+            self.probe(options['probe_interval'], done))
+        results = await asyncio.gather(*downloads)
+        done.set()
+        return (results, await probes, time.perf_counter() - start)
+
+    async def connect(self, headers=''):
+        (reader, writer) = await asyncio.open_connection(self.host, self.port)
+        authorization = (
+            f'Authorization: Bearer {self.token}\r\n' if self.token else '')
+        writer.write((
+            f'GET {self.path} HTTP/1.1\r\n'
+            f'Host: {self.host}\r\n'
+            f'{authorization}{headers}'
+            'Connection: close\r\n\r\n'
+        ).encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        if not status_line.startswith(b'HTTP/1.1 2'):
+            writer.close()
+            raise ConnectionError(status_line.decode().strip())
+        while (await reader.readline()) not in (b'\r\n', b''):
+            pass
+        return (reader, writer)
+
+    async def download(self, rate, delay):
+        """
+        Returns (completed, seconds to first byte, bytes received).
+        """
+        await asyncio.sleep(delay)
+        received = 0
+        start = time.perf_counter()
+        try:
+            (reader, writer) = await self.connect()
+        except (OSError, ConnectionError):
+            return (False, 0, 0)
+
+        self.open_connections += 1
+        self.peak_connections = max(
+            self.peak_connections, self.open_connections)
+        first_byte = time.perf_counter() - start
+        read_size = max(rate // 10, 1)
+        try:
+            while True:
+                chunk = await reader.read(read_size)
+                if not chunk:
+                    return (True, first_byte, received)
+                received += len(chunk)
+                # Sleeps until the client is back under its rate.
+                ahead = received / rate - (time.perf_counter() - start)
+                if ahead > 0:
+                    await asyncio.sleep(ahead)
+        except OSError:
+            return (False, first_byte, received)
+        finally:
+            self.open_connections -= 1
+            writer.close()
+
+    async def probe(self, interval, done):
+        latencies = []
+        while not done.is_set():
+            start = time.perf_counter()
+            try:
+                (reader, writer) = await self.connect('Range: bytes=0-0\r\n')
+                await reader.read()
+                writer.close()
+                latencies.append(time.perf_counter() - start)
+            except (OSError, ConnectionError):
+                pass
+            await asyncio.sleep(interval)
+        return latencies
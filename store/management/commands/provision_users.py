@@ -0,0 +1,36 @@
+import json
+import os
+from django.core.management.base import BaseCommand, CommandError
+from store.catalog import CSV, NDJSON, get_format
+from store.provisioning import BATCH_SIZE, UserProvisioner
+
+
+class Command(BaseCommand):
+    help = ('Creates users and their customers from a CSV or NDJSON file '
+            'with username, password, first_name, last_name and email.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=[CSV, NDJSON])
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes hashing passwords. The command '
+                                 'runs on its own, so it defaults to one '
+                                 'per CPU.')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or get_format(filename=options['path'])
+        if file_format is None:
+            raise CommandError('Could not tell the format, pass --format.')
+
+        with open(options['path'], 'rb') as stream:
+            report = UserProvisioner(
+                options['batch_size'], options['workers']
+            ).run(stream, file_format)
+
+        for error in report['errors']:
+            self.stderr.write(
+                f'line {error["line"]}: {json.dumps(error["errors"])}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {report["created"]} users, '
+            f'{report["error_count"]} rows with errors.'))
@@ -0,0 +1,17 @@
+from datetime import date
+from django.core.management.base import BaseCommand
+from store.analytics import rebuild_sales
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the sales summary tables from completed orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=date.fromisoformat,
+                            help='First day to rebuild (YYYY-MM-DD).')
+        parser.add_argument('--end', type=date.fromisoformat,
+                            help='Last day to rebuild (YYYY-MM-DD).')
+
+    def handle(self, *args, **options):
+        rebuild_sales(options['start'], options['end'])
+        self.stdout.write(self.style.SUCCESS('Rebuilt sales summaries.'))
@@ -0,0 +1,57 @@
+import hashlib
+import mimetypes
+import re
+
+CHUNK_SIZE = 64 * 1024
+PDF_HEADER = b'%PDF-'
+PDF_CONTENT_TYPE = 'application/pdf'
+# Page objects, not the /Pages tree nodes above them.
+PAGE_PATTERN = re.compile(rb'/Type\s*/Page\b')
+# Longer than any match, so one split across two chunks is still found.
+OVERLAP = 32
+METADATA_FIELDS = [
+    'size', 'sha256', 'page_count', 'content_type', 'modified_at']
+
+
+def read_metadata(storage, name):
+    """
+    Reads a stored file once, in chunks, and returns the ProductFile
+    metadata fields for it. The page count is the number of page objects
+    written out in the file; pages kept in compressed object streams are
+    not seen, and a file without any gets None.
+    """
+    digest = storage.digest(name) if hasattr(storage, 'digest') else None
+    hasher = hashlib.sha256() if digest is None else None
+    size = 0
+    pages = 0
+    head = b''
+    tail = b''
+    with storage.open(name, 'rb') as file_handle:
+        while True:
+            chunk = file_handle.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if hasher is not None:
+                hasher.update(chunk)
+            if len(head) < len(PDF_HEADER):
+                head += chunk[:len(PDF_HEADER) - len(head)]
+            size += len(chunk)
+            window = tail + chunk
+            # Matches that end inside the tail were counted already.
+            pages += sum(
+                1 for match in PAGE_PATTERN.finditer(window)
+                if match.end() > len(tail))
+            tail = window[-OVERLAP:]
+
+    if head == PDF_HEADER:
+        content_type = PDF_CONTENT_TYPE
+    else:
+        content_type = mimetypes.guess_type(name)[0] or \
+            'application/octet-stream'
+    return {
+        'size': size,
+        'sha256': digest or hasher.hexdigest(),
+        'page_count': pages or None,
+        'content_type': content_type,
+        'modified_at': storage.get_modified_time(name),
+    }
@@ -0,0 +1,46 @@
+# Generated by Django 4.0.6 on 2026-10-18 09:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+import store.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0005_remove_customer_email_remove_customer_first_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='category',
+            options={'verbose_name_plural': 'categories'},
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='customer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='orders', to='store.customer'),
+        ),
+        migrations.AlterField(
+            model_name='orderitem',
+            name='order',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='store.order'),
+        ),
+        migrations.AlterField(
+            model_name='productfile',
+            name='file',
+            field=models.FileField(upload_to='store/products/files', validators=[store.validators.validate_file_type]),
+        ),
+        migrations.CreateModel(
+            name='OwnedProduct',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='owned_products', to='store.customer')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='ownedproduct',
+            constraint=models.UniqueConstraint(fields=('customer', 'product'), name='unique_owned_product'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.6 on 2026-10-18 09:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_ownedproduct'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['added_at', 'id'], name='store_categ_added_a_defe70_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['added_at', 'id'], name='store_produ_added_a_a35a55_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.0.6 on 2026-10-18 09:44
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+CREATE_SEARCH_INDEX = """
+CREATE FUNCTION store_product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('pg_catalog.english', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER store_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description ON store_product
+    FOR EACH ROW EXECUTE FUNCTION store_product_search_vector_update();
+
+UPDATE store_product SET title = title;
+
+CREATE INDEX store_product_search_vector_idx
+    ON store_product USING gin (search_vector);
+"""
+
+DROP_SEARCH_INDEX = """
+DROP INDEX IF EXISTS store_product_search_vector_idx;
+DROP TRIGGER IF EXISTS store_product_search_vector_trigger ON store_product;
+DROP FUNCTION IF EXISTS store_product_search_vector_update();
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH_INDEX)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0007_add_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
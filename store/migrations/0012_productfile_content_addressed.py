@@ -0,0 +1,36 @@
+# Generated by Django 4.0.6 on 2026-10-18 10:24
+
+import os
+from django.db import migrations, models
+import store.models
+import store.storage
+import store.validators
+
+
+def fill_filenames(apps, schema_editor):
+    ProductFile = apps.get_model('store', 'ProductFile')
+    rows = ProductFile.objects.filter(filename='').only('id', 'file')
+    for row in rows.iterator():
+        row.filename = os.path.basename(row.file.name)
+        row.save(update_fields=['filename'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_fileupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productfile',
+            name='filename',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='productfile',
+            name='file',
+            field=models.FileField(db_index=True, storage=store.storage.ContentAddressedStorage(), upload_to=store.models.product_file_path, validators=[store.validators.validate_file_type]),
+        ),
+        migrations.RunPython(fill_filenames, migrations.RunPython.noop),
+    ]
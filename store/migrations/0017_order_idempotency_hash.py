@@ -0,0 +1,18 @@
+# Generated by Django 4.0.6 on 2026-10-18 11:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_product_file_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='idempotency_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -1,5 +1,10 @@
+import os
+from uuid import uuid4
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.conf import settings
+from .metadata import read_metadata
+from .storage import ContentAddressedStorage
 from .validators import validate_file_type
 
 
@@ -15,6 +20,9 @@ class Customer(models.Model):
 class Category(models.Model):
     class Meta:
         verbose_name_plural = 'categories'
+        indexes = [
+            models.Index(fields=['added_at', 'id'])
+        ]
 
     title = models.CharField(max_length=255)
     added_at = models.DateField(auto_now_add=True)
@@ -24,23 +32,84 @@ class Category(models.Model):
 
 
 class Product(models.Model):
+    isbn = models.CharField(max_length=13, unique=True, null=True, blank=True)
     title = models.CharField(max_length=255)
     description = models.TextField()
     unit_price = models.DecimalField(max_digits=6, decimal_places=2)
     added_at = models.DateField(auto_now_add=True)
-    category = models.ForeignKey(Category, on_delete=models.CASCADE)
+    # Indexed by (category, added_at, id) below.
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, db_index=False)
+    # Maintained by a database trigger on Postgres, see migration 0008.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['added_at', 'id']),
+            models.Index(fields=['category', 'added_at', 'id'])
+        ]
 
     def __str__(self) -> str:
         return str(self.title)
 
 
+PRODUCT_FILES_DIRECTORY = 'store/products/files'
+
+
+def product_file_path(productfile, filename):
+    # Blobs are named by content, so the uploaded name is kept on the row.
+    if not productfile.filename:
+        productfile.filename = os.path.basename(filename)
+    return f'{PRODUCT_FILES_DIRECTORY}/{filename}'
+
+
 class ProductFile(models.Model):
     product = models.ForeignKey(
         Product, on_delete=models.CASCADE, related_name='files')
     file = models.FileField(
-        upload_to='store/products/files',
-        validators=[validate_file_type]
+        upload_to=product_file_path,
+        storage=ContentAddressedStorage(),
+        validators=[validate_file_type],
+        db_index=True
     )
+    filename = models.CharField(max_length=255, blank=True)
+    # Read from the file when it is stored, so listing and sending files
+    # needs no storage calls. Rows stored before these columns are filled
+    # in by `backfill_product_files`.
+    size = models.PositiveBigIntegerField(null=True, editable=False)
+    sha256 = models.CharField(max_length=64, blank=True, editable=False)
+    page_count = models.PositiveIntegerField(null=True, editable=False)
+    content_type = models.CharField(
+        max_length=255, blank=True, editable=False)
+    modified_at = models.DateTimeField(null=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        if self.file and not self.file._committed:
+            # Stores the file first, so its metadata goes in with the row.
+            self.file.save(self.file.name, self.file.file, save=False)
+        if self.file:
+            digest = self.file.storage.digest(self.file.name)
+            if digest is not None and digest != self.sha256:
+                self.fill_metadata()
+        super().save(*args, **kwargs)
+
+    def fill_metadata(self):
+        for (field, value) in read_metadata(
+                self.file.storage, self.file.name).items():
+            setattr(self, field, value)
+
+
+class FileUpload(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid4, editable=False)
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='+')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    sha256 = models.CharField(max_length=64, blank=True)
+    product_file = models.OneToOneField(
+        ProductFile, on_delete=models.SET_NULL, null=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
 
 
 class Order(models.Model):
@@ -53,13 +122,121 @@ class Order(models.Model):
         (CANCELED_ORDER, 'Canceled')
     ]
     placed_at = models.DateTimeField(auto_now_add=True)
+    # Indexed by (customer, order_status) below.
     customer = models.ForeignKey(
-        Customer, on_delete=models.PROTECT, related_name='orders')
+        Customer, on_delete=models.PROTECT, related_name='orders',
+        db_index=False)
     order_status = models.CharField(max_length=1, choices=ORDER_STATUS_CHOICES)
+    idempotency_key = models.CharField(max_length=64, null=True, blank=True)
+    # The SHA-256 of the checkout body sent with idempotency_key.
+    idempotency_hash = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['customer', 'idempotency_key'],
+                name='unique_order_idempotency_key')
+        ]
+        indexes = [
+            models.Index(fields=['placed_at', 'id']),
+            models.Index(fields=['order_status', 'placed_at']),
+            # A customer's orders, and their completed ones.
+            models.Index(fields=['customer', 'order_status'])
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets signal receivers see which status the row had.
+        instance.saved_status = instance.__dict__.get('order_status')
+        return instance
 
 
 class OrderItem(models.Model):
+    # Indexed by (order, product) below.
     order = models.ForeignKey(
-        Order, on_delete=models.CASCADE, related_name='items')
+        Order, on_delete=models.CASCADE, related_name='items', db_index=False)
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
     quantity = models.IntegerField()
+    # The product's price when the order was placed.
+    unit_price = models.DecimalField(max_digits=6, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['order', 'product'])
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.saved_product_id = instance.__dict__.get('product_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if self.unit_price is None:
+            self.unit_price = Product.objects.values_list(
+                'unit_price', flat=True).get(pk=self.product_id)
+        super().save(*args, **kwargs)
+
+
+class OwnedProduct(models.Model):
+    # Indexed by the unique (customer, product) constraint below.
+    customer = models.ForeignKey(
+        Customer, on_delete=models.CASCADE, related_name='owned_products',
+        db_index=False)
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['customer', 'product'], name='unique_owned_product')
+        ]
+
+
+class SalesSummary(models.Model):
+    day = models.DateField()
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.IntegerField(default=0)
+    orders = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailySales(SalesSummary):
+    class Meta:
+        verbose_name_plural = 'daily sales'
+        constraints = [
+            models.UniqueConstraint(fields=['day'], name='unique_daily_sales')
+        ]
+
+
+class ProductSales(SalesSummary):
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        verbose_name_plural = 'product sales'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'day'], name='unique_product_sales')
+        ]
+        indexes = [
+            models.Index(fields=['day'])
+        ]
+
+
+class CategorySales(SalesSummary):
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        verbose_name_plural = 'category sales'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['category', 'day'], name='unique_category_sales')
+        ]
+        indexes = [
+            models.Index(fields=['day'])
+        ]
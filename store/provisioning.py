@@ -0,0 +1,172 @@
+from itertools import islice
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from core.hashing import batch_executor, hash_passwords
+from core.models import User
+from .catalog import CSV, NDJSON, read_rows
+from .models import Customer
+from .serializers import ProvisionUserSerializer
+
+BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+UNIQUE_FIELDS = ['username', 'email']
+
+
+class ProvisioningError(Exception):
+    pass
+
+
+def unique_errors(field):
+    # Worded as the UniqueValidator of signing up words it.
+    model_field = User._meta.get_field(field)
+    return {field: [model_field.error_messages['unique'] % {
+        'model_name': User._meta.verbose_name,
+        'field_label': model_field.verbose_name
+    }]}
+
+
+class UserProvisioner:
+    """
+    Creates users and their customers from a CSV or NDJSON stream in
+    batches, with the same rows signing up one by one would create, but
+    with a few queries per batch instead of per user. With `workers`,
+    passwords are hashed in that many processes of its own, a batch at a
+    time, while the previous batch is saved. Without, they go through the
+    hashing pool one at a time, next to logins.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, workers=0):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.executor = None
+        self.seen = {field: set() for field in UNIQUE_FIELDS}
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+
+    def run(self, stream, file_format, max_rows=None):
+        """
+        Provisions the rows of `stream` and returns a report. With
+        `max_rows`, raises ProvisioningError before creating anyone when
+        there are more rows.
+        """
+        if file_format not in (CSV, NDJSON):
+            raise ProvisioningError(f'Unsupported format: {file_format}')
+
+        rows = read_rows(stream, file_format)
+        if max_rows is not None:
+            rows = list(islice(rows, max_rows + 1))
+            if len(rows) > max_rows:
+                raise ProvisioningError(
+                    f'Files can have at most {max_rows} rows.')
+        if self.workers:
+            self.executor = batch_executor(self.workers)
+        try:
+            self.provision(rows)
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+                self.executor = None
+
+        return {
+            'created': self.created,
+            'error_count': self.error_count,
+            'errors': sorted(self.errors, key=lambda error: error['line'])
+        }
+
+    def provision(self, rows):
+        pending = None
+        batch = []
+        for (line, row) in rows:
+            if row is None:
+                self.add_error(line, {'non_field_errors': ['Invalid line.']})
+                continue
+            serializer = ProvisionUserSerializer(data=row)
+            if not serializer.is_valid():
+                self.add_error(line, serializer.errors)
+                continue
+            data = serializer.validated_data
+            duplicate = next((
+                field for field in UNIQUE_FIELDS
+                if data[field] in self.seen[field]
+            ), None)
+            if duplicate is not None:
+                self.add_error(line, unique_errors(duplicate))
+                continue
+            for field in UNIQUE_FIELDS:
+                self.seen[field].add(data[field])
+            batch.append((line, data))
+            if len(batch) >= self.batch_size:
+                pending = self.hash_batch(batch, pending)
+                batch = []
+        if batch:
+            pending = self.hash_batch(batch, pending)
+        if pending is not None:
+            self.save_batch(*pending)
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def hash_batch(self, batch, pending):
+        """
+        Starts hashing the passwords of `batch`, then saves the `pending`
+        batch, while they hash when there are workers of its own. Returns
+        the batch to save next.
+        """
+        batch = self.drop_existing(batch)
+        hashes = hash_passwords(
+            [data['password'] for (line, data) in batch], self.executor)
+        if pending is not None:
+            self.save_batch(*pending)
+        return (batch, hashes)
+
+    def drop_existing(self, batch):
+        taken = {field: set() for field in UNIQUE_FIELDS}
+        for (username, email) in User.objects.filter(
+            Q(username__in=[data['username'] for (line, data) in batch])
+            | Q(email__in=[data['email'] for (line, data) in batch])
+        ).values_list('username', 'email'):
+            taken['username'].add(username)
+            taken['email'].add(email)
+
+        remaining = []
+        for (line, data) in batch:
+            duplicate = next((
+                field for field in UNIQUE_FIELDS
+                if data[field] in taken[field]
+            ), None)
+            if duplicate is None:
+                remaining.append((line, data))
+            else:
+                self.add_error(line, unique_errors(duplicate))
+        return remaining
+
+    def save_batch(self, batch, hashes):
+        users = [
+            User(**{**data, 'password': password})
+            for ((line, data), password) in zip(batch, hashes)
+        ]
+        try:
+            self.insert(users)
+        except IntegrityError:
+            # Someone else took a username or email since the batch was
+            # checked.
+            remaining = self.drop_existing(batch)
+            kept = {data['username'] for (line, data) in remaining}
+            users = [user for user in users if user.username in kept]
+            self.insert(users)
+        self.created += len(users)
+
+    def insert(self, users):
+        if not users:
+            return
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+            # Not every database returns the primary keys of a bulk insert.
+            user_ids = User.objects.filter(
+                username__in=[user.username for user in users]
+            ).values_list('id', flat=True)
+            Customer.objects.bulk_create(
+                [Customer(user_id=user_id) for user_id in user_ids])
@@ -0,0 +1,47 @@
+from django.db import connection
+
+# Tables that grow with the store; a query that reads one of them end to
+# end gets slower with every order placed.
+HOT_TABLES = {
+    'store_customer',
+    'store_order',
+    'store_orderitem',
+    'store_ownedproduct',
+    'store_product',
+    'store_productfile',
+}
+
+
+def explain(sql):
+    """
+    Runs `sql` (with its parameters already in place) under
+    EXPLAIN (ANALYZE, FORMAT JSON) and returns the plan.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}')
+        return cursor.fetchone()[0][0]
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from plan_nodes(child)
+
+
+def seq_scans(plan, tables=HOT_TABLES):
+    """
+    Returns the tables in `tables` that `plan` reads with a sequential scan.
+    """
+    return sorted({
+        node['Relation Name']
+        for node in plan_nodes(plan['Plan'])
+        if node['Node Type'] == 'Seq Scan' and node['Relation Name'] in tables
+    })
+
+
+def used_indexes(plan):
+    return sorted({
+        node['Index Name']
+        for node in plan_nodes(plan['Plan'])
+        if 'Index Name' in node
+    })
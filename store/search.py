@@ -0,0 +1,38 @@
+from functools import reduce
+from operator import and_
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Case, F, FloatField, IntegerField, Q, Value, When
+from django.db.models.functions import Cast
+
+SEARCH_CONFIG = 'english'
+
+
+def search_products(queryset, query):
+    """
+    Filters products matching `query` and annotates them with `rank`.
+    Postgres uses the GIN indexed `search_vector` column, other databases
+    fall back to case-insensitive substring matching. Every match is
+    ranked, so callers order by rank before slicing a page.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=SEARCH_CONFIG, search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            rank=Cast(SearchRank(F('search_vector'), search_query), FloatField()))
+
+    terms = query.split()
+    if not terms:
+        return queryset.none()
+    queryset = queryset.filter(reduce(and_, [
+        Q(title__icontains=term) | Q(description__icontains=term)
+        for term in terms
+    ]))
+    return queryset.annotate(rank=Cast(sum(
+        Case(
+            When(title__icontains=term, then=Value(2)),
+            default=Value(1),
+            output_field=IntegerField()
+        )
+        for term in terms
+    ), FloatField()))
@@ -1,5 +1,11 @@
-from rest_framework.serializers import ModelSerializer, SerializerMethodField
-from store.models import Category, Customer, Product, ProductFile
+from django.conf import settings
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
+from rest_framework.serializers import CharField, DateField, DecimalField, IntegerField, ModelSerializer, Serializer, SerializerMethodField, ValidationError
+from core.models import User
+from store.models import Category, Customer, FileUpload, Order, OrderItem, Product, ProductFile
+import hashlib
+import json
 import os
 
 
@@ -10,22 +16,10 @@ class UpdateCustomerSerializer(ModelSerializer):
 
 
 class CustomerSerializer(ModelSerializer):
-    username = SerializerMethodField('get_username')
-    first_name = SerializerMethodField('get_first_name')
-    last_name = SerializerMethodField('get_last_name')
-    email = SerializerMethodField('get_email')
-
-    def get_username(self, customer):
-        return customer.user.username
-
-    def get_first_name(self, customer):
-        return customer.user.first_name
-
-    def get_last_name(self, customer):
-        return customer.user.last_name
-
-    def get_email(self, customer):
-        return customer.user.email
+    username = CharField(source='user.username', read_only=True)
+    first_name = CharField(source='user.first_name', read_only=True)
+    last_name = CharField(source='user.last_name', read_only=True)
+    email = CharField(source='user.email', read_only=True)
 
     class Meta:
         model = Customer
@@ -45,9 +39,56 @@ class ProductSerializer(ModelSerializer):
         fields = ['id', 'category', 'title', 'description', 'unit_price']
 
 
-class ProductFileSerializer(ModelSerializer):
+class ProductFilterSerializer(Serializer):
+    search = CharField(required=False, max_length=255)
+    category = IntegerField(required=False)
+    min_price = DecimalField(required=False, max_digits=6, decimal_places=2)
+    max_price = DecimalField(required=False, max_digits=6, decimal_places=2)
+
+
+class SalesFilterSerializer(Serializer):
+    start = DateField(required=False)
+    end = DateField(required=False)
+    product = IntegerField(required=False)
+    category = IntegerField(required=False)
+    limit = IntegerField(required=False, min_value=1, max_value=1000, default=100)
+
+    def validate(self, data):
+        if 'start' in data and 'end' in data and data['start'] > data['end']:
+            raise ValidationError('start should not be after end.')
+        return data
+
+
+class SalesSerializer(Serializer):
+    id = IntegerField(required=False)
+    title = CharField(required=False)
+    day = DateField(required=False)
+    revenue = DecimalField(max_digits=14, decimal_places=2)
+    units = IntegerField()
+    orders = IntegerField()
+
 
-    filename = SerializerMethodField('get_filename')
+class CatalogRowSerializer(Serializer):
+    isbn = CharField(max_length=13)
+    title = CharField(max_length=255)
+    description = CharField()
+    unit_price = DecimalField(max_digits=6, decimal_places=2)
+    category = CharField(max_length=255)
+
+
+class ProvisionUserSerializer(ModelSerializer):
+    # The same fields as signing up, without the uniqueness queries;
+    # UserProvisioner checks a whole batch at once.
+    class Meta:
+        model = User
+        fields = ['username', 'password', 'first_name', 'last_name', 'email']
+        extra_kwargs = {
+            'username': {'validators': [UnicodeUsernameValidator()]},
+            'email': {'validators': []},
+        }
+
+
+class ProductFileSerializer(ModelSerializer):
 
     url = SerializerMethodField('get_url')
 
@@ -56,15 +97,125 @@ class ProductFileSerializer(ModelSerializer):
         ProductFile.objects.create(
             product_id=prodcut_id, **self.validated_data)
 
-    def get_filename(self, productfile):
-        return os.path.basename(productfile.file.name)
-
     def get_url(self, productfile):
         request = self.context['request']
         return request.build_absolute_uri(
-            f'/store/products/{productfile.product.id}/files/{productfile.id}/'
+            f'/store/products/{productfile.product_id}/files/{productfile.id}/'
         )
 
     class Meta:
         model = ProductFile
-        fields = ['id', 'filename', 'url']
+        fields = ['id', 'filename', 'size', 'sha256', 'page_count',
+                  'content_type', 'modified_at', 'url']
+
+
+class FileUploadSerializer(ModelSerializer):
+    class Meta:
+        model = FileUpload
+        fields = ['id', 'filename', 'size', 'offset', 'sha256', 'product_file']
+        read_only_fields = ['offset', 'sha256', 'product_file']
+
+    def validate_filename(self, filename):
+        filename = os.path.basename(filename)
+        if os.path.splitext(filename)[1].lower() != '.pdf':
+            raise ValidationError('Type of uploaded file should be PDF.')
+        return filename
+
+    def validate_size(self, size):
+        if not 0 < size <= settings.STORE_UPLOADS['MAX_SIZE']:
+            raise ValidationError(
+                f'Size should be between 1 and '
+                f'{settings.STORE_UPLOADS["MAX_SIZE"]} bytes.')
+        return size
+
+
+class OrderItemSerializer(ModelSerializer):
+    class Meta:
+        model = OrderItem
+        fields = ['id', 'product', 'quantity', 'unit_price']
+
+
+class OrderSerializer(ModelSerializer):
+    items = OrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = ['id', 'placed_at', 'order_status', 'items']
+
+
+class CheckoutItemSerializer(Serializer):
+    product = IntegerField()
+    quantity = IntegerField(min_value=1, max_value=1000)
+
+
+def hash_checkout(data):
+    """
+    Returns the SHA-256 of a checkout body, the same however its keys are
+    ordered, to tell whether a replayed Idempotency-Key came with the body
+    it was first used for.
+    """
+    body = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+class CheckoutSerializer(Serializer):
+    items = CheckoutItemSerializer(many=True, allow_empty=False)
+
+    def validate_items(self, items):
+        quantities = {}
+        for item in items:
+            quantities[item['product']] = \
+                quantities.get(item['product'], 0) + item['quantity']
+
+        prices = dict(
+            Product.objects
+            .filter(pk__in=quantities.keys())
+            .values_list('id', 'unit_price')
+        )
+        missing = sorted(quantities.keys() - prices.keys())
+        if missing:
+            raise ValidationError(
+                f'Products with ids {missing} do not exist.')
+
+        return [
+            {
+                'product': product_id,
+                'quantity': quantities[product_id],
+                'unit_price': prices[product_id]
+            }
+            for product_id in sorted(quantities)
+        ]
+
+    def save(self, **kwargs):
+        customer_id = self.context['customer_id']
+        idempotency_key = self.context.get('idempotency_key')
+        idempotency_hash = hash_checkout(self.initial_data) \
+            if idempotency_key is not None else ''
+        self.replayed = False
+        try:
+            with transaction.atomic():
+                order = Order.objects.create(
+                    customer_id=customer_id,
+                    order_status=Order.PENDING_ORDER,
+                    idempotency_key=idempotency_key,
+                    idempotency_hash=idempotency_hash
+                )
+                OrderItem.objects.bulk_create([
+                    OrderItem(
+                        order=order,
+                        product_id=item['product'],
+                        quantity=item['quantity'],
+                        unit_price=item['unit_price']
+                    )
+                    for item in self.validated_data['items']
+                ])
+        except IntegrityError:
+            # A concurrent request with the same key may have won the race.
+            order = Order.objects.filter(
+                customer_id=customer_id,
+                idempotency_key=idempotency_key
+            ).first() if idempotency_key is not None else None
+            if order is None:
+                raise
+            self.replayed = True
+        return order
@@ -1,10 +1,81 @@
 from django.conf import settings
 from django.dispatch import receiver
-from django.db.models.signals import post_save
-from .models import Customer
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from .analytics import apply_order, rebuild_sales
+from .cache import invalidate
+from .entitlements import sync_owned_products
+from .models import Category, Customer, Order, OrderItem, Product, ProductFile
 
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_customer_for_user(sender, **kwargs):
     if kwargs['created']:
         Customer.objects.create(user=kwargs['instance'])
+
+
+@receiver(post_save, sender=Order)
+def sync_owned_products_on_order_save(sender, instance, created, **kwargs):
+    if created and instance.order_status != Order.COMPLETED_ORDER:
+        return
+    sync_owned_products([instance.customer_id])
+
+
+@receiver(post_delete, sender=Order)
+def sync_owned_products_on_order_delete(sender, instance, **kwargs):
+    if instance.order_status == Order.COMPLETED_ORDER:
+        sync_owned_products([instance.customer_id])
+
+
+@receiver(post_save, sender=Order)
+def update_sales_on_order_save(sender, instance, created, **kwargs):
+    completed = instance.order_status == Order.COMPLETED_ORDER
+    if created:
+        was_completed = False
+    elif hasattr(instance, 'saved_status'):
+        was_completed = instance.saved_status == Order.COMPLETED_ORDER
+    else:
+        # Saved from an instance that was not loaded from the database.
+        was_completed = None
+    instance.saved_status = instance.order_status
+
+    if was_completed is None:
+        day = timezone.localdate(instance.placed_at)
+        rebuild_sales(day, day, OrderItem.objects.filter(
+            order_id=instance.pk).values_list('product_id', flat=True))
+    elif completed != was_completed:
+        apply_order(instance.pk, 1 if completed else -1)
+
+
+@receiver([post_save, post_delete], sender=OrderItem)
+def sync_order_on_item_change(sender, instance, **kwargs):
+    order = Order.objects.filter(
+        pk=instance.order_id,
+        order_status=Order.COMPLETED_ORDER
+    ).values_list('customer_id', 'placed_at').first()
+    if order is None:
+        return
+
+    (customer_id, placed_at) = order
+    sync_owned_products([customer_id])
+    day = timezone.localdate(placed_at)
+    product_ids = {instance.product_id}
+    if getattr(instance, 'saved_product_id', None) is not None:
+        product_ids.add(instance.saved_product_id)
+    rebuild_sales(day, day, product_ids)
+    instance.saved_product_id = instance.product_id
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_cached_category(sender, instance, **kwargs):
+    invalidate('categories', f'categories:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_cached_product(sender, instance, **kwargs):
+    invalidate('products', f'products:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=ProductFile)
+def invalidate_cached_product_files(sender, instance, **kwargs):
+    invalidate(f'products:{instance.product_id}')
@@ -0,0 +1,81 @@
+import hashlib
+import os
+import re
+import tempfile
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_PATTERN = re.compile(r'(^|/)[0-9a-f]{2}/([0-9a-f]{64})\.[a-z0-9]+$')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores each file once, under `<directory>/<ab>/<sha256>.<ext>`, so
+    rows with the same content share a blob and saving a file that is
+    already stored writes nothing. Blobs are never renamed or deleted on
+    save; `gc_product_files` removes the ones no row references.
+
+    A file that already knows its digest can say so with a `sha256`
+    attribute, and one with `temporary_file_path()` is moved into place.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def blob_name(self, name, digest):
+        (directory, filename) = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension)
+
+    def is_blob(self, name):
+        return bool(BLOB_PATTERN.search(name))
+
+    def digest(self, name):
+        match = BLOB_PATTERN.search(name)
+        return match.group(2) if match else None
+
+    def _save(self, name, content):
+        digest = getattr(content, 'sha256', None)
+        temporary_path = None
+        if digest is None:
+            (digest, temporary_path) = self.write_temporary(name, content)
+
+        blob = self.blob_name(name, digest)
+        full_path = self.path(blob)
+        if os.path.exists(full_path):
+            # Tells the collector the blob is in use again.
+            os.utime(full_path)
+            if temporary_path is not None:
+                os.remove(temporary_path)
+            return blob
+
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        if temporary_path is None and hasattr(content, 'temporary_file_path'):
+            temporary_path = content.temporary_file_path()
+        if temporary_path is None:
+            (_, temporary_path) = self.write_temporary(name, content)
+        file_move_safe(temporary_path, full_path, allow_overwrite=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return blob
+
+    def write_temporary(self, name, content):
+        """
+        Copies `content` next to where its blob will go, hashing it on the
+        way. Returns the digest and the temporary path.
+        """
+        directory = os.path.dirname(self.path(name))
+        os.makedirs(directory, exist_ok=True)
+        hasher = hashlib.sha256()
+        (handle, path) = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as temporary:
+                for chunk in content.chunks():
+                    hasher.update(chunk)
+                    temporary.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return (hasher.hexdigest(), path)
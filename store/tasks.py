@@ -0,0 +1,20 @@
+import os
+from core.jobs import task
+from .metadata import read_metadata
+from .models import ProductFile
+
+
+@task('store.fill_product_file_metadata')
+def fill_product_file_metadata(name):
+    """
+    Reads the stored file `name` and fills in the metadata of every product
+    file row sharing it. Returns how many rows were filled.
+    """
+    storage = ProductFile._meta.get_field('file').storage
+    if not storage.exists(name):
+        return 0
+    filled = ProductFile.objects.filter(file=name).update(
+        **read_metadata(storage, name))
+    ProductFile.objects.filter(file=name, filename='').update(
+        filename=os.path.basename(name))
+    return filled
@@ -0,0 +1,147 @@
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from model_bakery import baker
+from store.admin import EstimatedCountPaginator
+from store.models import Category, DailySales, Order, OrderItem, OwnedProduct, Product
+import pytest
+
+
+@pytest.fixture
+def make_orders():
+    def do(count, order_status=Order.COMPLETED_ORDER):
+        orders = []
+        for _ in range(count):
+            customer = baker.make(settings.AUTH_USER_MODEL).customer
+            order = baker.make(Order, customer=customer,
+                               order_status=Order.PENDING_ORDER)
+            baker.make(OrderItem, order=order, product=baker.make(Product),
+                       quantity=1, unit_price=10)
+            if order_status != Order.PENDING_ORDER:
+                order.order_status = order_status
+                order.save()
+            orders.append(order)
+        return orders
+    return do
+
+
+@pytest.mark.django_db
+class TestChangelistQueryBudget:
+    def test_orders(self, admin_client, make_orders, query_budget):
+        make_orders(2)
+
+        query_budget(
+            8,
+            lambda: admin_client.get('/admin/store/order/'),
+            lambda: make_orders(5)
+        )
+
+    def test_orders_filtered_by_status_and_day(self, admin_client, make_orders, query_budget):
+        make_orders(2)
+        today = timezone.localdate()
+
+        query_budget(
+            8,
+            lambda: admin_client.get('/admin/store/order/', {
+                'order_status__exact': Order.COMPLETED_ORDER,
+                'placed_at__year': today.year,
+                'placed_at__month': today.month
+            }),
+            lambda: make_orders(5)
+        )
+
+    def test_customers(self, admin_client, query_budget):
+        baker.make(settings.AUTH_USER_MODEL, 2)
+
+        query_budget(
+            7,
+            lambda: admin_client.get('/admin/store/customer/'),
+            lambda: baker.make(settings.AUTH_USER_MODEL, 5)
+        )
+
+    def test_products(self, admin_client, query_budget):
+        baker.make(Product, 2)
+
+        query_budget(
+            7,
+            lambda: admin_client.get('/admin/store/product/'),
+            lambda: baker.make(Product, 5)
+        )
+
+    def test_categories(self, admin_client, query_budget):
+        category = baker.make(Category)
+        baker.make(Product, 3, category=category)
+
+        response = admin_client.get('/admin/store/category/')
+
+        assert response.context['cl'].result_list[0].products_count == 3
+        query_budget(
+            7,
+            lambda: admin_client.get('/admin/store/category/'),
+            lambda: baker.make(Category, 5)
+        )
+
+
+@pytest.mark.django_db
+class TestEstimatedCount:
+    def test_counts_small_results_exactly(self):
+        baker.make(Category, 3)
+
+        paginator = EstimatedCountPaginator(Category.objects.order_by('id'), 10)
+
+        assert paginator.count == 3
+
+    @pytest.mark.skipif(connection.vendor != 'postgresql',
+                        reason='estimates come from Postgres statistics')
+    def test_estimates_large_results(self, monkeypatch):
+        baker.make(Category, 50)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE store_category')
+        monkeypatch.setattr(EstimatedCountPaginator, 'exact_count_threshold', 1)
+        paginator = EstimatedCountPaginator(Category.objects.order_by('id'), 10)
+
+        with CaptureQueriesContext(connection) as queries:
+            count = paginator.count
+
+        assert count > 0
+        assert not any('COUNT(' in query['sql'] for query in queries)
+
+
+@pytest.mark.django_db
+class TestOrderStatusActions:
+    def change_status(self, admin_client, action, orders):
+        return admin_client.post('/admin/store/order/', {
+            'action': action,
+            '_selected_action': [order.pk for order in orders]
+        })
+
+    def test_completes_orders_with_one_update(self, admin_client, make_orders):
+        orders = make_orders(3, Order.PENDING_ORDER)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.change_status(admin_client, 'mark_completed', orders)
+
+        updates = [
+            query for query in queries
+            if query['sql'].startswith('UPDATE "store_order"')
+        ]
+        assert len(updates) == 1
+        assert Order.objects.filter(order_status=Order.COMPLETED_ORDER).count() == 3
+        assert OwnedProduct.objects.count() == 3
+        assert DailySales.objects.get().orders == 3
+
+    def test_cancels_completed_orders(self, admin_client, make_orders):
+        orders = make_orders(3)
+
+        self.change_status(admin_client, 'mark_canceled', orders[:2])
+
+        assert OwnedProduct.objects.count() == 1
+        assert DailySales.objects.get().orders == 1
+
+    def test_skips_orders_already_in_status(self, admin_client, make_orders):
+        orders = make_orders(2)
+
+        self.change_status(admin_client, 'mark_completed', orders)
+
+        assert DailySales.objects.get().orders == 2
@@ -0,0 +1,241 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework import status
+from model_bakery import baker
+from store.models import Category, CategorySales, DailySales, Order, OrderItem, Product, ProductSales
+import pytest
+
+
+@pytest.fixture
+def customer():
+    return baker.make(settings.AUTH_USER_MODEL).customer
+
+
+@pytest.fixture
+def category():
+    return baker.make(Category)
+
+
+@pytest.fixture
+def products(category):
+    return [
+        baker.make(Product, category=category, unit_price=Decimal('10.00')),
+        baker.make(Product, category=category, unit_price=Decimal('2.50')),
+    ]
+
+
+@pytest.fixture
+def place_order(customer):
+    def do(items, order_status=Order.COMPLETED_ORDER):
+        order = baker.make(Order, customer=customer,
+                           order_status=Order.PENDING_ORDER)
+        for (product, quantity) in items:
+            OrderItem.objects.create(
+                order=order, product=product, quantity=quantity)
+        order.order_status = order_status
+        order.save()
+        return order
+    return do
+
+
+def summary(model, **key):
+    row = model.objects.get(day=timezone.localdate(), **key)
+    return (row.revenue, row.units, row.orders)
+
+
+@pytest.mark.django_db
+class TestSalesSummaries:
+    def test_captures_unit_price(self, place_order, products):
+        order = place_order([(products[0], 1)])
+        Product.objects.filter(pk=products[0].pk).update(unit_price=99)
+
+        assert order.items.get().unit_price == Decimal('10.00')
+
+    def test_adds_completed_orders(self, place_order, products, category):
+        place_order([(products[0], 2), (products[1], 1)])
+        place_order([(products[0], 1)])
+
+        assert summary(DailySales) == (Decimal('32.50'), 4, 2)
+        assert summary(ProductSales, product=products[0]) == (Decimal('30.00'), 3, 2)
+        assert summary(ProductSales, product=products[1]) == (Decimal('2.50'), 1, 1)
+        assert summary(CategorySales, category=category) == (Decimal('32.50'), 4, 2)
+
+    def test_ignores_pending_orders(self, place_order, products):
+        place_order([(products[0], 1)], Order.PENDING_ORDER)
+
+        assert not DailySales.objects.exists()
+
+    def test_removes_canceled_orders(self, place_order, products):
+        place_order([(products[0], 1)])
+        order = place_order([(products[0], 2)])
+        order.order_status = Order.CANCELED_ORDER
+        order.save()
+
+        assert summary(DailySales) == (Decimal('10.00'), 1, 1)
+
+    def test_keeps_price_paid_when_product_price_changes(self, place_order, products):
+        place_order([(products[0], 1)])
+        products[0].unit_price = Decimal('1.00')
+        products[0].save()
+        order = place_order([(products[0], 1)])
+        order.order_status = Order.CANCELED_ORDER
+        order.save()
+
+        assert summary(DailySales) == (Decimal('10.00'), 1, 1)
+
+    def test_follows_item_changes_on_completed_orders(self, place_order, products):
+        order = place_order([(products[0], 1)])
+        item = order.items.get()
+        item.product = products[1]
+        item.unit_price = products[1].unit_price
+        item.save()
+
+        assert summary(DailySales) == (Decimal('2.50'), 1, 1)
+        assert not ProductSales.objects.filter(product=products[0]).exists()
+        assert summary(ProductSales, product=products[1]) == (Decimal('2.50'), 1, 1)
+
+    def test_removes_deleted_orders(self, place_order, products):
+        place_order([(products[0], 1)])
+        place_order([(products[1], 1)]).delete()
+
+        assert summary(DailySales) == (Decimal('10.00'), 1, 1)
+
+    def test_rebuild_matches_incremental_updates(self, place_order, products, category):
+        place_order([(products[0], 2), (products[1], 1)])
+        order = place_order([(products[1], 4)])
+        order.order_status = Order.CANCELED_ORDER
+        order.save()
+        expected = [
+            summary(DailySales),
+            summary(ProductSales, product=products[0]),
+            summary(CategorySales, category=category)
+        ]
+        DailySales.objects.update(revenue=0)
+        ProductSales.objects.all().delete()
+
+        call_command('rebuild_sales_analytics')
+
+        assert [
+            summary(DailySales),
+            summary(ProductSales, product=products[0]),
+            summary(CategorySales, category=category)
+        ] == expected
+
+
+@pytest.mark.django_db
+class TestSalesEndpoints:
+    def test_returns_403_if_not_admin(self, api_client, authorize):
+        authorize()
+
+        response = api_client.get('/store/analytics/sales/')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_returns_daily_sales(self, api_client, authorize, place_order, products):
+        place_order([(products[0], 1)])
+        authorize(is_staff=True)
+
+        response = api_client.get('/store/analytics/sales/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == [{
+            'day': timezone.localdate().isoformat(),
+            'revenue': Decimal('10.00'),
+            'units': 1,
+            'orders': 1
+        }]
+
+    def test_filters_by_day(self, api_client, authorize, place_order, products):
+        place_order([(products[0], 1)])
+        authorize(is_staff=True)
+        tomorrow = timezone.localdate() + timedelta(days=1)
+
+        response = api_client.get(
+            '/store/analytics/sales/', {'start': tomorrow.isoformat()})
+
+        assert response.data == []
+
+    def test_ranks_products_by_revenue(self, api_client, authorize, place_order, products):
+        place_order([(products[0], 1), (products[1], 8)])
+        authorize(is_staff=True)
+
+        response = api_client.get('/store/analytics/products/')
+
+        assert [(row['id'], row['revenue']) for row in response.data] == [
+            (products[1].id, Decimal('20.00')),
+            (products[0].id, Decimal('10.00'))
+        ]
+        assert response.data[0]['title'] == products[1].title
+
+    def test_returns_daily_series_of_a_product(self, api_client, authorize, place_order, products):
+        place_order([(products[0], 3)])
+        authorize(is_staff=True)
+
+        response = api_client.get(
+            '/store/analytics/products/', {'product': products[0].id})
+
+        assert [(row['day'], row['units']) for row in response.data] == [
+            (timezone.localdate().isoformat(), 3)
+        ]
+
+    def test_returns_category_totals(self, api_client, authorize, place_order, products, category):
+        place_order([(products[0], 1), (products[1], 2)])
+        authorize(is_staff=True)
+
+        response = api_client.get('/store/analytics/categories/')
+
+        assert response.data == [{
+            'id': category.id,
+            'title': category.title,
+            'revenue': Decimal('15.00'),
+            'units': 3,
+            'orders': 1
+        }]
+
+    def test_returns_400_if_range_is_reversed(self, api_client, authorize):
+        authorize(is_staff=True)
+
+        response = api_client.get(
+            '/store/analytics/sales/', {'start': '2024-02-01', 'end': '2024-01-01'})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestSalesQueryBudget:
+    def test_daily_sales(self, api_client, authorize, place_order, products, query_budget):
+        place_order([(products[0], 1)])
+        authorize(is_staff=True)
+        today = timezone.localdate()
+
+        query_budget(
+            1,
+            lambda: api_client.get('/store/analytics/sales/'),
+            lambda: [
+                baker.make(DailySales, day=today - timedelta(days=days))
+                for days in range(1, 11)
+            ]
+        )
+
+    def test_products(self, api_client, authorize, place_order, products, query_budget):
+        place_order([(products[0], 1)])
+        authorize(is_staff=True)
+
+        query_budget(
+            1,
+            lambda: api_client.get('/store/analytics/products/'),
+            lambda: baker.make(ProductSales, 10, day=timezone.localdate())
+        )
+
+    def test_categories(self, api_client, authorize, place_order, products, query_budget):
+        place_order([(products[0], 1)])
+        authorize(is_staff=True)
+
+        query_budget(
+            1,
+            lambda: api_client.get('/store/analytics/categories/'),
+            lambda: baker.make(CategorySales, 10, day=timezone.localdate())
+        )
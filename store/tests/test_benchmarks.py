@@ -0,0 +1,31 @@
+from store.management.commands.benchmark_endpoints import compare_results
+
+
+def make_results(**endpoints):
+    return {'database': 'sqlite', 'results': {'1000': {
+        name: {'p50': p50, 'p95': p95, 'p99': p95, 'throughput': 1,
+               'queries': queries}
+        for (name, (p50, p95, queries)) in endpoints.items()
+    }}}
+
+
+class TestCompareResults:
+    def test_flags_slower_endpoints(self):
+        baseline = make_results(products=(10, 20, 1))
+        current = make_results(products=(15, 21, 1))
+
+        assert compare_results(baseline, current, 0.2) == [
+            'products at 1000: p50 10.00ms -> 15.00ms']
+
+    def test_flags_extra_queries(self):
+        baseline = make_results(products=(10, 20, 1))
+        current = make_results(products=(10, 20, 2))
+
+        assert compare_results(baseline, current, 0.2) == [
+            'products at 1000: queries 1 -> 2']
+
+    def test_ignores_small_changes_and_new_endpoints(self):
+        baseline = make_results(products=(0.5, 0.8, 1))
+        current = make_results(products=(0.9, 1.2, 1), token=(100, 200, 2))
+
+        assert compare_results(baseline, current, 0.2) == []
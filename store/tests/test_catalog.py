@@ -0,0 +1,179 @@
+import json
+from io import StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from rest_framework import status
+from model_bakery import baker
+from store.models import Category, Product
+import pytest
+
+CSV_CATALOG = (
+    'isbn,title,description,unit_price,category\r\n'
+    '9780000000001,First,A book,10.50,Fiction\r\n'
+    '9780000000002,Second,Another book,7,Fiction\r\n'
+    '9780000000003,Third,,abc,History\r\n'
+    '9780000000004,Fourth,More,3,History\r\n'
+)
+
+
+@pytest.fixture
+def import_catalog(api_client):
+    def do(body, content_type):
+        return api_client.generic(
+            'POST', '/store/products/import/', body, content_type=content_type)
+    return do
+
+
+@pytest.mark.django_db
+class TestImportCatalog:
+    def test_returns_403_if_not_admin(self, import_catalog, authorize):
+        authorize()
+
+        response = import_catalog(CSV_CATALOG, 'text/csv')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_returns_400_if_format_is_unknown(self, import_catalog, authorize):
+        authorize(True)
+
+        response = import_catalog('a', 'text/plain')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_imports_csv_and_reports_row_errors(self, import_catalog, authorize):
+        authorize(True)
+
+        response = import_catalog(CSV_CATALOG, 'text/csv')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['created'] == 3
+        assert response.data['updated'] == 0
+        assert response.data['error_count'] == 1
+        assert response.data['errors'][0]['line'] == 4
+        assert set(response.data['errors'][0]['errors']) == {
+            'description', 'unit_price'}
+        assert sorted(Category.objects.values_list('title', flat=True)) == [
+            'Fiction', 'History']
+        product = Product.objects.get(isbn='9780000000001')
+        assert (product.title, product.category.title) == ('First', 'Fiction')
+
+    def test_updates_existing_products_by_isbn(self, import_catalog, authorize):
+        authorize(True)
+        category = baker.make(Category, title='Fiction')
+        product = baker.make(Product, isbn='9780000000001', category=category)
+
+        response = import_catalog(
+            json.dumps({
+                'isbn': '9780000000001',
+                'title': 'Renamed',
+                'description': 'Updated',
+                'unit_price': '12.00',
+                'category': 'Fiction'
+            }) + '\n\nnot json\n',
+            'application/x-ndjson'
+        )
+        product.refresh_from_db()
+
+        assert response.data['created'] == 0
+        assert response.data['updated'] == 1
+        assert response.data['errors'] == [
+            {'line': 3, 'errors': {'non_field_errors': ['Invalid line.']}}]
+        assert product.title == 'Renamed'
+        assert Category.objects.count() == 1
+
+    def test_reports_undecodable_and_malformed_csv_lines(self, import_catalog, authorize):
+        authorize(True)
+        lines = CSV_CATALOG.encode().split(b'\r\n')
+        lines[1] = lines[1].replace(b'First', b'First\xff')
+        lines[2] = lines[2].replace(b'Another book', b'x' * 200_000)
+
+        response = import_catalog(b'\r\n'.join(lines), 'text/csv')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['created'] == 1
+        assert [error['line'] for error in response.data['errors']] == [
+            2, 3, 4]
+        assert response.data['errors'][0]['errors'] == {
+            'non_field_errors': ['Invalid line.']}
+        assert Product.objects.get().isbn == '9780000000004'
+
+    def test_reports_undecodable_ndjson_lines(self, import_catalog, authorize):
+        authorize(True)
+        row = json.dumps({
+            'isbn': '9780000000001',
+            'title': 'First',
+            'description': 'A book',
+            'unit_price': '12.00',
+            'category': 'Fiction'
+        }).encode()
+
+        response = import_catalog(
+            b'\xff\xfe' + row + b'\n' + row + b'\n', 'application/x-ndjson')
+
+        assert response.data['created'] == 1
+        assert response.data['errors'] == [
+            {'line': 1, 'errors': {'non_field_errors': ['Invalid line.']}}]
+
+    def test_accepts_multipart_file(self, api_client, authorize):
+        authorize(True)
+        upload = SimpleUploadedFile(
+            'catalog.csv', CSV_CATALOG.encode(), content_type='text/csv')
+
+        response = api_client.post(
+            '/store/products/import/', {'file': upload}, format='multipart')
+
+        assert response.data['created'] == 3
+
+    def test_invalidates_cached_product_list(self, api_client, import_catalog, authorize):
+        api_client.get('/store/products/')
+        authorize(True)
+
+        import_catalog(CSV_CATALOG, 'text/csv')
+        response = api_client.get('/store/products/')
+
+        assert len(response.data['results']) == 3
+
+
+@pytest.mark.django_db
+class TestExportCatalog:
+    def test_returns_403_if_not_admin(self, api_client, authorize):
+        authorize()
+
+        response = api_client.get('/store/products/export/')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_streams_csv(self, api_client, authorize):
+        authorize(True)
+        category = baker.make(Category, title='Fiction')
+        baker.make(Product, isbn='9780000000001', title='First',
+                   description='A book', unit_price=10, category=category)
+
+        response = api_client.get('/store/products/export/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'text/csv'
+        assert b''.join(response.streaming_content).decode() == (
+            'isbn,title,description,unit_price,category\r\n'
+            '9780000000001,First,A book,10.00,Fiction\r\n'
+        )
+
+    def test_round_trips_through_commands(self, tmp_path):
+        source = tmp_path / 'catalog.csv'
+        source.write_text(CSV_CATALOG)
+        call_command('import_catalog', str(source), stdout=StringIO(),
+                     stderr=StringIO())
+        output = StringIO()
+
+        call_command('export_catalog', '--format', 'ndjson', stdout=output)
+
+        rows = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert [row['isbn'] for row in rows] == [
+            '9780000000001', '9780000000002', '9780000000004']
+        assert rows[0] == {
+            'isbn': '9780000000001',
+            'title': 'First',
+            'description': 'A book',
+            'unit_price': '10.50',
+            'category': 'Fiction'
+        }
@@ -68,7 +68,7 @@ class TestListCategories:
         response = get_categories()
 
         assert response.status_code == status.HTTP_200_OK
-        assert response.data == [
+        assert response.data['results'] == [
             {
                 'id': category.id,
                 'title': category.title
@@ -206,3 +206,24 @@ class TestDeleteCategories:
 
         assert response.status_code == status.HTTP_204_NO_CONTENT
         assert count_in_db == 0
+
+
+@pytest.mark.django_db
+class TestCategoriesQueryBudget:
+    def test_list(self, get_categories, query_budget):
+        baker.make(Category, 2)
+
+        query_budget(
+            1,
+            lambda: get_categories(),
+            lambda: baker.make(Category, 10)
+        )
+
+    def test_retrieve(self, get_categories, query_budget):
+        category = baker.make(Category)
+
+        def grow():
+            baker.make(Category, 10)
+            category.save()
+
+        query_budget(1, lambda: get_categories(category.id), grow)
@@ -67,7 +67,7 @@ class TestListCustomers:
         response = get_customers()
 
         assert response.status_code == status.HTTP_200_OK
-        assert response.data == [
+        assert response.data['results'] == [
             {
                 'id': user.id,
                 'username': user.username,
@@ -85,7 +85,7 @@ class TestListCustomers:
         response = get_customers()
 
         assert response.status_code == status.HTTP_200_OK
-        assert response.data == [
+        assert response.data['results'] == [
             {
                 'id': user.id,
                 'username': user.username,
@@ -189,3 +189,26 @@ class TestDeleteCustomers:
         response = response = api_client.delete('/store/customers/1/')
 
         assert response.status_code == status.HTTP_405_METHOD_NOT_ALLOWED
+
+
+@pytest.mark.django_db
+class TestCustomersQueryBudget:
+    def test_list(self, api_client, query_budget):
+        user = baker.make(settings.AUTH_USER_MODEL, is_staff=True)
+        api_client.force_authenticate(user=user)
+
+        query_budget(
+            1,
+            lambda: api_client.get('/store/customers/'),
+            lambda: baker.make(settings.AUTH_USER_MODEL, 10)
+        )
+
+    def test_retrieve(self, api_client, query_budget):
+        user = baker.make(settings.AUTH_USER_MODEL)
+        api_client.force_authenticate(user=user)
+
+        query_budget(
+            1,
+            lambda: api_client.get(f'/store/customers/{user.customer.id}/'),
+            lambda: baker.make(settings.AUTH_USER_MODEL, 10)
+        )
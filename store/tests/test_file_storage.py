@@ -0,0 +1,207 @@
+import hashlib
+import os
+import time
+from io import StringIO
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from model_bakery import baker
+from core.models import Job
+from store import metadata
+from store.metadata import read_metadata
+from store.models import Product, ProductFile
+from store.serializers import ProductFileSerializer
+import pytest
+
+PDF = b'%PDF-1.4 content'
+PAGED_PDF = (
+    b'%PDF-1.4\n1 0 obj << /Type /Pages /Count 2 >> endobj\n'
+    b'2 0 obj << /Type /Page /Parent 1 0 R >> endobj\n'
+    b'3 0 obj << /Type/Page /Parent 1 0 R >> endobj\n%%EOF\n'
+)
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+
+
+@pytest.fixture
+def save_file():
+    def do(name='book.pdf', content=PDF):
+        product_file = ProductFile(product=baker.make(Product))
+        product_file.file.save(name, ContentFile(content))
+        return product_file
+    return do
+
+
+def stored_files(root):
+    return sorted(
+        os.path.relpath(os.path.join(directory, filename), root)
+        for (directory, _, filenames) in os.walk(root)
+        for filename in filenames
+    )
+
+
+def age(path, hours):
+    mtime = time.time() - hours * 60 * 60
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.mark.django_db
+class TestContentAddressedStorage:
+    def test_names_file_by_content(self, save_file):
+        product_file = save_file()
+
+        digest = hashlib.sha256(PDF).hexdigest()
+        assert product_file.file.name == \
+            f'store/products/files/{digest[:2]}/{digest}.pdf'
+        assert product_file.filename == 'book.pdf'
+
+    def test_stores_identical_files_once(self, save_file, tmp_path):
+        first = save_file('first.pdf')
+        second = save_file('second.pdf')
+
+        assert first.file.name == second.file.name
+        assert stored_files(tmp_path) == [first.file.name]
+        assert second.file.read() == PDF
+
+    def test_serializer_returns_uploaded_name(self, save_file, rf):
+        product_file = save_file('my.book.pdf')
+
+        data = ProductFileSerializer(
+            product_file, context={'request': rf.get('/')}).data
+
+        assert data['filename'] == 'my.book.pdf'
+
+
+@pytest.mark.django_db
+class TestDedupeProductFiles:
+    def test_moves_files_into_shared_blobs(self, tmp_path):
+        legacy = FileSystemStorage()
+        names = [
+            legacy.save('store/products/files/a.pdf', ContentFile(PDF)),
+            legacy.save('store/products/files/b.pdf', ContentFile(PDF)),
+            legacy.save('store/products/files/c.pdf', ContentFile(b'%PDF-1.7'))
+        ]
+        rows = [
+            ProductFile.objects.create(product=baker.make(Product), file=name)
+            for name in names
+        ]
+
+        call_command('dedupe_product_files')
+
+        (a, b, c) = [ProductFile.objects.get(pk=row.pk) for row in rows]
+        assert a.file.name == b.file.name != c.file.name
+        assert (a.filename, b.filename, c.filename) == ('a.pdf', 'b.pdf', 'c.pdf')
+        assert stored_files(tmp_path) == sorted([a.file.name, c.file.name])
+        assert b.file.read() == PDF
+
+    def test_skips_files_already_in_blobs(self, save_file, tmp_path):
+        product_file = save_file()
+
+        call_command('dedupe_product_files')
+
+        assert stored_files(tmp_path) == [product_file.file.name]
+
+
+@pytest.mark.django_db
+class TestCollectProductFiles:
+    def test_deletes_old_unreferenced_blobs(self, save_file, tmp_path):
+        kept = save_file()
+        orphan = save_file(content=b'%PDF-1.7 orphan')
+        ProductFile.objects.filter(pk=orphan.pk).delete()
+        age(orphan.file.path, 48)
+        age(kept.file.path, 48)
+
+        call_command('gc_product_files')
+
+        assert stored_files(tmp_path) == [kept.file.name]
+
+    def test_keeps_recent_blobs(self, save_file, tmp_path):
+        orphan = save_file()
+        ProductFile.objects.filter(pk=orphan.pk).delete()
+
+        call_command('gc_product_files')
+
+        assert stored_files(tmp_path) == [orphan.file.name]
+
+    def test_dry_run_deletes_nothing(self, save_file, tmp_path):
+        orphan = save_file()
+        ProductFile.objects.filter(pk=orphan.pk).delete()
+        age(orphan.file.path, 48)
+
+        call_command('gc_product_files', '--dry-run')
+
+        assert stored_files(tmp_path) == [orphan.file.name]
+
+
+@pytest.mark.django_db
+class TestProductFileMetadata:
+    def test_fills_metadata_when_stored(self, save_file):
+        product_file = save_file(content=PAGED_PDF)
+
+        product_file.refresh_from_db()
+        assert product_file.size == len(PAGED_PDF)
+        assert product_file.sha256 == hashlib.sha256(PAGED_PDF).hexdigest()
+        assert product_file.page_count == 2
+        assert product_file.content_type == 'application/pdf'
+        assert product_file.modified_at is not None
+
+    def test_counts_pages_split_across_chunks(self, save_file, monkeypatch):
+        product_file = save_file(content=PAGED_PDF)
+        monkeypatch.setattr(metadata, 'CHUNK_SIZE', 7)
+
+        data = read_metadata(product_file.file.storage, product_file.file.name)
+
+        assert data['page_count'] == 2
+        assert data['size'] == len(PAGED_PDF)
+
+    def test_refills_metadata_when_file_changes(self, save_file):
+        product_file = save_file()
+
+        product_file.file.save('new.pdf', ContentFile(PAGED_PDF))
+
+        assert ProductFile.objects.get(pk=product_file.pk).size == \
+            len(PAGED_PDF)
+
+    def test_serializer_returns_metadata(self, save_file, rf):
+        product_file = save_file(content=PAGED_PDF)
+
+        data = ProductFileSerializer(
+            product_file, context={'request': rf.get('/')}).data
+
+        assert data['size'] == len(PAGED_PDF)
+        assert data['page_count'] == 2
+        assert data['sha256'] == product_file.sha256
+
+    def test_backfill_fills_rows_without_metadata(self, save_file):
+        legacy = FileSystemStorage().save(
+            'store/products/files/legacy.pdf', ContentFile(PAGED_PDF))
+        old = ProductFile.objects.create(product=baker.make(Product), file=legacy)
+        blob = save_file()
+        ProductFile.objects.filter(pk=blob.pk).update(size=None, sha256='')
+        output = StringIO()
+
+        call_command('backfill_product_files', stdout=output)
+
+        (old, blob) = [ProductFile.objects.get(pk=row.pk) for row in (old, blob)]
+        assert (old.size, old.page_count, old.filename) == (
+            len(PAGED_PDF), 2, 'legacy.pdf')
+        assert old.sha256 == hashlib.sha256(PAGED_PDF).hexdigest()
+        assert (blob.size, blob.sha256) == (
+            len(PDF), hashlib.sha256(PDF).hexdigest())
+        assert 'Filled in 2 product files' in output.getvalue()
+
+    def test_backfill_queues_jobs(self, save_file):
+        blob = save_file()
+        ProductFile.objects.filter(pk=blob.pk).update(size=None, sha256='')
+
+        call_command('backfill_product_files', '--enqueue', stdout=StringIO())
+        call_command('backfill_product_files', '--enqueue', stdout=StringIO())
+        assert Job.objects.count() == 1
+        call_command('run_jobs', '--burst', stdout=StringIO())
+
+        blob.refresh_from_db()
+        assert blob.sha256 == hashlib.sha256(PDF).hexdigest()
+        assert not Job.objects.exists()
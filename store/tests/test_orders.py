@@ -0,0 +1,167 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import connection, connections
+from rest_framework import status
+from rest_framework.test import APIClient
+from model_bakery import baker
+from store.models import Order, OrderItem, Product
+import pytest
+
+
+@pytest.fixture
+def customer(api_client):
+    user = baker.make(settings.AUTH_USER_MODEL)
+    api_client.force_authenticate(user=user)
+    return user.customer
+
+
+@pytest.fixture
+def checkout(api_client):
+    def do(items, idempotency_key=None):
+        headers = {}
+        if idempotency_key is not None:
+            headers['HTTP_IDEMPOTENCY_KEY'] = idempotency_key
+        return api_client.post(
+            '/store/orders/', {'items': items}, format='json', **headers)
+    return do
+
+
+@pytest.mark.django_db
+class TestCheckout:
+    def test_returns_401_if_anonymous(self, checkout):
+        response = checkout([{'product': 1, 'quantity': 1}])
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_returns_400_if_empty(self, checkout, customer):
+        response = checkout([])
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_returns_400_if_product_does_not_exist(self, checkout, customer):
+        product = baker.make(Product)
+
+        response = checkout([
+            {'product': product.id, 'quantity': 1},
+            {'product': product.id + 1, 'quantity': 1}
+        ])
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert Order.objects.count() == 0
+
+    def test_returns_201_and_creates_pending_order(self, checkout, customer):
+        products = baker.make(Product, 2)
+
+        response = checkout([
+            {'product': products[1].id, 'quantity': 1},
+            {'product': products[0].id, 'quantity': 2},
+            {'product': products[1].id, 'quantity': 3}
+        ])
+        order = Order.objects.get(pk=response.data['id'])
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert order.customer_id == customer.id
+        assert order.order_status == Order.PENDING_ORDER
+        assert [
+            (item['product'], item['quantity'])
+            for item in response.data['items']
+        ] == [(products[0].id, 2), (products[1].id, 4)]
+
+    def test_replays_order_with_same_idempotency_key(self, checkout, customer):
+        product = baker.make(Product)
+
+        first = checkout([{'product': product.id, 'quantity': 1}], 'key-1')
+        second = checkout([{'product': product.id, 'quantity': 1}], 'key-1')
+
+        assert first.status_code == status.HTTP_201_CREATED
+        assert second.status_code == status.HTTP_200_OK
+        assert second['Idempotent-Replayed'] == 'true'
+        assert second.data == first.data
+        assert Order.objects.count() == 1
+
+    def test_returns_422_if_key_is_reused_with_another_body(self, checkout, customer):
+        product = baker.make(Product)
+        checkout([{'product': product.id, 'quantity': 1}], 'key-1')
+
+        response = checkout([{'product': product.id, 'quantity': 2}], 'key-1')
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+        assert 'message' in response.data
+        assert Order.objects.get().items.get().quantity == 1
+
+    def test_query_budget(self, checkout, customer, query_budget):
+        products = baker.make(Product, 2)
+
+        query_budget(
+            9,
+            lambda: checkout([
+                {'product': product.id, 'quantity': 1} for product in products
+            ], f'key-{len(products)}'),
+            lambda: products.extend(baker.make(Product, 20))
+        )
+
+
+@pytest.mark.django_db
+class TestListOrders:
+    def test_returns_only_own_orders(self, api_client, customer):
+        order = baker.make(Order, customer=customer,
+                           order_status=Order.PENDING_ORDER)
+        baker.make(OrderItem, order=order, quantity=1)
+        other_customer = baker.make(settings.AUTH_USER_MODEL).customer
+        baker.make(Order, customer=other_customer,
+                   order_status=Order.PENDING_ORDER)
+
+        response = api_client.get('/store/orders/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [item['id'] for item in response.data['results']] == [order.id]
+
+
+@pytest.mark.skipif(
+    connection.vendor != 'postgresql',
+    reason='Needs a database that allows concurrent writers.')
+@pytest.mark.django_db(transaction=True)
+class TestConcurrentCheckout:
+    def run_parallel(self, user, payloads):
+        def run(payload):
+            (items, idempotency_key) = payload
+            client = APIClient()
+            client.force_authenticate(user=user)
+            try:
+                return client.post(
+                    '/store/orders/',
+                    {'items': items},
+                    format='json',
+                    HTTP_IDEMPOTENCY_KEY=idempotency_key
+                )
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            return list(executor.map(run, payloads))
+
+    def test_parallel_checkouts_all_succeed(self):
+        user = baker.make(settings.AUTH_USER_MODEL)
+        products = baker.make(Product, 5)
+        items = [{'product': product.id, 'quantity': 1} for product in products]
+
+        responses = self.run_parallel(
+            user, [(items[i % 5:] + items[:i % 5], f'key-{i}') for i in range(64)])
+
+        assert [response.status_code for response in responses] == \
+            [status.HTTP_201_CREATED] * 64
+        assert Order.objects.filter(customer=user.customer).count() == 64
+        assert OrderItem.objects.count() == 64 * 5
+
+    def test_parallel_retries_create_one_order(self):
+        user = baker.make(settings.AUTH_USER_MODEL)
+        product = baker.make(Product)
+        items = [{'product': product.id, 'quantity': 1}]
+
+        responses = self.run_parallel(user, [(items, 'same-key')] * 32)
+
+        assert Order.objects.filter(customer=user.customer).count() == 1
+        assert {response.data['id'] for response in responses} == {
+            Order.objects.get().id}
+        assert sorted(response.status_code for response in responses) == \
+            [status.HTTP_200_OK] * 31 + [status.HTTP_201_CREATED]
@@ -0,0 +1,691 @@
+import asyncio
+import zlib
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core import signals, signing
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import close_old_connections, connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from model_bakery import baker
+from core.models import User
+from store import entitlements, watermark
+from store.asgi import DownloadApplication
+from store.delivery import CHUNK_SIZE
+from store.management.commands.benchmark_watermarks import build_pdf
+from store.models import Order, OrderItem, OwnedProduct, Product, ProductFile
+from store.watermark import build_template
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+
+
+@pytest.fixture
+def customer(api_client):
+    user = baker.make(settings.AUTH_USER_MODEL)
+    api_client.force_authenticate(user=user)
+    return user.customer
+
+
+@pytest.fixture
+def product_file():
+    product = baker.make(Product)
+    instance = ProductFile(product=product)
+    instance.file.save('book.pdf', ContentFile(b'%PDF-1.4 content'))
+    return instance
+
+
+@pytest.fixture
+def place_order():
+    def do(customer, product, order_status=Order.COMPLETED_ORDER):
+        order = baker.make(Order, customer=customer,
+                           order_status=Order.PENDING_ORDER)
+        baker.make(OrderItem, order=order, product=product, quantity=1)
+        order.order_status = order_status
+        order.save()
+        return order
+    return do
+
+
+@pytest.fixture
+def get_product_files(api_client):
+    def do(product_id, id=None):
+        if id is None:
+            return api_client.get(f'/store/products/{product_id}/files/')
+        return api_client.get(f'/store/products/{product_id}/files/{id}/')
+    return do
+
+
+@pytest.mark.django_db
+class TestListProductFiles:
+    def test_returns_401_if_anonymous(self, get_product_files, product_file):
+        response = get_product_files(product_file.product_id)
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_returns_404_if_product_does_not_exist(self, get_product_files, customer):
+        response = get_product_files(1)
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_returns_403_if_not_owned(self, get_product_files, customer, product_file, place_order):
+        place_order(customer, product_file.product, Order.PENDING_ORDER)
+
+        response = get_product_files(product_file.product_id)
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_returns_200_if_owned(self, get_product_files, customer, product_file, place_order):
+        place_order(customer, product_file.product)
+
+        response = get_product_files(product_file.product_id)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [item['id'] for item in response.data] == [product_file.id]
+
+    def test_returns_403_after_order_is_canceled(self, get_product_files, customer, product_file, place_order):
+        order = place_order(customer, product_file.product)
+        get_product_files(product_file.product_id)
+        order.order_status = Order.CANCELED_ORDER
+        order.save()
+
+        response = get_product_files(product_file.product_id)
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_returns_403_if_order_is_canceled_during_cache_fill(self, monkeypatch, get_product_files, customer, product_file, place_order):
+        order = place_order(customer, product_file.product)
+
+        class RacingCache:
+            canceled = False
+
+            def __getattr__(self, name):
+                return getattr(cache, name)
+
+            def set(self, key, value, timeout):
+                if not self.canceled:
+                    self.canceled = True
+                    order.order_status = Order.CANCELED_ORDER
+                    order.save()
+                cache.set(key, value, timeout)
+
+        monkeypatch.setattr(entitlements, 'cache', RacingCache())
+        get_product_files(product_file.product_id)
+
+        response = get_product_files(product_file.product_id)
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_query_count_does_not_depend_on_order_history(self, get_product_files, customer, product_file, place_order):
+        place_order(customer, product_file.product)
+        cache.clear()
+        with CaptureQueriesContext(connection) as few_orders:
+            get_product_files(product_file.product_id)
+
+        other_products = baker.make(Product, 50)
+        for product in other_products:
+            place_order(customer, product)
+        cache.clear()
+        with CaptureQueriesContext(connection) as many_orders:
+            get_product_files(product_file.product_id)
+
+        assert len(many_orders) == len(few_orders)
+
+    def test_uses_customer_id_from_token(self, customer, product_file, place_order):
+        place_order(customer, product_file.product)
+        token = AccessToken.for_user(customer.user)
+        token['customer_id'] = customer.id
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(f'/store/products/{product_file.product_id}/files/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert not any('store_customer' in query['sql'] for query in queries)
+
+
+@pytest.mark.django_db
+class TestRetrieveProductFile:
+    def test_returns_403_if_not_owned(self, get_product_files, customer, product_file):
+        response = get_product_files(product_file.product_id, product_file.id)
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_returns_200_and_file_if_owned(self, get_product_files, customer, product_file, place_order):
+        place_order(customer, product_file.product)
+
+        response = get_product_files(product_file.product_id, product_file.id)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert b''.join(response.streaming_content) == b'%PDF-1.4 content'
+
+
+@pytest.fixture
+def download(api_client, customer, product_file, place_order):
+    place_order(customer, product_file.product)
+
+    def do(**headers):
+        return api_client.get(
+            f'/store/products/{product_file.product_id}/files/{product_file.id}/',
+            **headers
+        )
+    return do
+
+
+@pytest.mark.django_db
+class TestRangeDownloads:
+    def test_returns_206_and_single_range(self, download):
+        response = download(HTTP_RANGE='bytes=0-4')
+
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response['Content-Range'] == 'bytes 0-4/16'
+        assert response['Content-Length'] == '5'
+        assert b''.join(response.streaming_content) == b'%PDF-'
+
+    def test_returns_suffix_range(self, download):
+        response = download(HTTP_RANGE='bytes=-7')
+
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response['Content-Range'] == 'bytes 9-15/16'
+        assert b''.join(response.streaming_content) == b'content'
+
+    def test_returns_multipart_for_multiple_ranges(self, download):
+        response = download(HTTP_RANGE='bytes=0-3,9-15')
+        body = b''.join(response.streaming_content)
+
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response['Content-Type'].startswith('multipart/byteranges')
+        assert int(response['Content-Length']) == len(body)
+        assert b'Content-Range: bytes 0-3/16\r\n\r\n%PDF\r\n' in body
+        assert b'Content-Range: bytes 9-15/16\r\n\r\ncontent\r\n' in body
+
+    def test_returns_416_if_unsatisfiable(self, download):
+        response = download(HTTP_RANGE='bytes=100-200')
+
+        assert response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        assert response['Content-Range'] == 'bytes */16'
+
+    def test_honors_if_range_when_etag_matches(self, download):
+        etag = download()['ETag']
+
+        response = download(HTTP_RANGE='bytes=0-4', HTTP_IF_RANGE=etag)
+
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+
+    def test_uses_digest_as_etag(self, download, product_file):
+        response = download()
+
+        assert response['ETag'] == f'"{product_file.sha256}"'
+        assert response['Content-Length'] == '16'
+
+    def test_returns_304_if_etag_matches(self, download, product_file):
+        response = download(HTTP_IF_NONE_MATCH=f'W/"{product_file.sha256}"')
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response['ETag'] == f'"{product_file.sha256}"'
+
+    def test_reads_metadata_without_storage_calls(self, download, product_file, monkeypatch):
+        storage = type(product_file.file.storage)
+        for name in ('open', 'size', 'exists', 'get_modified_time'):
+            monkeypatch.setattr(storage, name, None)
+
+        response = download(HTTP_RANGE='bytes=100-200')
+
+        assert response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        assert response['Content-Range'] == 'bytes */16'
+
+    def test_returns_whole_file_if_range_is_stale(self, download):
+        response = download(HTTP_RANGE='bytes=0-4', HTTP_IF_RANGE='"stale"')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert b''.join(response.streaming_content) == b'%PDF-1.4 content'
+
+
+@pytest.mark.django_db
+class TestProxyDownloads:
+    def test_returns_x_accel_redirect(self, download, product_file, settings):
+        settings.STORE_FILE_DELIVERY = {
+            'BACKEND': 'store.delivery.XAccelRedirectDelivery',
+            'OPTIONS': {'LOCATION': '/protected/'}
+        }
+
+        response = download(HTTP_RANGE='bytes=0-4')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['X-Accel-Redirect'] == f'/protected/{product_file.file.name}'
+        assert response['Content-Type'] == 'application/pdf'
+        assert response['Content-Disposition'].startswith('attachment;')
+        assert response.content == b''
+
+    def test_returns_x_sendfile(self, download, product_file, settings):
+        settings.STORE_FILE_DELIVERY = {
+            'BACKEND': 'store.delivery.XSendfileDelivery'
+        }
+
+        response = download()
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['X-Sendfile'] == product_file.file.path
+        assert response.content == b''
+
+
+@pytest.fixture
+def call_asgi():
+    """
+    Calls the download application the way an ASGI server would and
+    returns (status, headers, body). Requests that are not downloads get
+    a 204 from the wrapped application.
+    """
+    async def django_application(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 204,
+                    'headers': []})
+        await send({'type': 'http.response.body'})
+
+    signals.request_started.disconnect(close_old_connections)
+    signals.request_finished.disconnect(close_old_connections)
+
+    def do(path, headers=None, disconnect_after=None):
+        messages = []
+        received = []
+        sent_body = asyncio.Event()
+
+        async def receive():
+            if not received:
+                received.append(True)
+                return {'type': 'http.request', 'body': b''}
+            if disconnect_after is None:
+                await asyncio.Event().wait()
+            await sent_body.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            messages.append(message)
+            body = messages[1:]
+            if disconnect_after is not None and len(body) >= disconnect_after:
+                sent_body.set()
+                await asyncio.sleep(0)
+
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': path,
+            'query_string': b'',
+            'headers': [
+                (name.lower().encode(), value.encode())
+                for (name, value) in (headers or {}).items()
+            ]
+        }
+        async_to_sync(DownloadApplication(django_application))(
+            scope, receive, send)
+
+        (start, *body) = messages
+        return (
+            start['status'],
+            {name.decode(): value.decode() for (name, value) in start['headers']},
+            b''.join(message.get('body', b'') for message in body)
+        )
+
+    yield do
+    signals.request_started.connect(close_old_connections)
+    signals.request_finished.connect(close_old_connections)
+
+
+@pytest.fixture
+def token(customer):
+    token = AccessToken.for_user(customer.user)
+    token['customer_id'] = customer.id
+    return f'Bearer {token}'
+
+
+@pytest.mark.django_db
+class TestAsyncDownloads:
+    def test_passes_other_requests_through(self, call_asgi, product_file):
+        (status_code, _, _) = call_asgi(
+            f'/store/products/{product_file.product_id}/files/')
+
+        assert status_code == status.HTTP_204_NO_CONTENT
+
+    def test_returns_401_if_anonymous(self, call_asgi, product_file):
+        (status_code, headers, body) = call_asgi(
+            f'/store/products/{product_file.product_id}/files/{product_file.id}/')
+
+        assert status_code == status.HTTP_401_UNAUTHORIZED
+        assert 'WWW-Authenticate' in headers
+        assert b'detail' in body
+
+    def test_returns_404_if_product_does_not_exist(self, call_asgi, token):
+        (status_code, _, _) = call_asgi(
+            '/store/products/1/files/1/', {'Authorization': token})
+
+        assert status_code == status.HTTP_404_NOT_FOUND
+
+    def test_returns_403_if_not_owned(self, call_asgi, token, product_file):
+        (status_code, _, body) = call_asgi(
+            f'/store/products/{product_file.product_id}/files/{product_file.id}/',
+            {'Authorization': token}
+        )
+
+        assert status_code == status.HTTP_403_FORBIDDEN
+        assert b'owned products' in body
+
+    def test_streams_file_if_owned(self, call_asgi, token, customer, product_file, place_order):
+        place_order(customer, product_file.product)
+
+        (status_code, headers, body) = call_asgi(
+            f'/store/products/{product_file.product_id}/files/{product_file.id}/',
+            {'Authorization': token}
+        )
+
+        assert status_code == status.HTTP_200_OK
+        assert headers['Content-Length'] == '16'
+        assert headers['Content-Disposition'].startswith('attachment;')
+        assert body == b'%PDF-1.4 content'
+
+    def test_records_metrics(self, call_asgi, token, customer, product_file, place_order, metrics):
+        place_order(customer, product_file.product)
+
+        call_asgi(
+            f'/store/products/{product_file.product_id}/files/{product_file.id}/',
+            {'Authorization': token}
+        )
+
+        assert metrics('http_requests_total',
+                       'product-files-detail', 'GET', '200') == 1
+        assert metrics('http_response_size_bytes', 'product-files-detail')[-1] == 16
+        assert metrics('http_db_queries', 'product-files-detail')[-1] > 0
+
+    def test_returns_range(self, call_asgi, token, customer, product_file, place_order):
+        place_order(customer, product_file.product)
+
+        (status_code, headers, body) = call_asgi(
+            f'/store/products/{product_file.product_id}/files/{product_file.id}/',
+            {'Authorization': token, 'Range': 'bytes=9-'}
+        )
+
+        assert status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert headers['Content-Range'] == 'bytes 9-15/16'
+        assert body == b'content'
+
+    def test_stops_reading_when_client_disconnects(self, call_asgi, token, customer, place_order):
+        product = baker.make(Product)
+        product_file = ProductFile(product=product)
+        product_file.file.save('big.pdf', ContentFile(b'x' * CHUNK_SIZE * 4))
+        place_order(customer, product)
+
+        (status_code, _, body) = call_asgi(
+            f'/store/products/{product.id}/files/{product_file.id}/',
+            {'Authorization': token},
+            disconnect_after=1
+        )
+
+        assert status_code == status.HTTP_200_OK
+        assert len(body) < CHUNK_SIZE * 4
+
+    def test_passes_through_to_proxy_backends(self, call_asgi, token, product_file, settings):
+        settings.STORE_FILE_DELIVERY = {
+            'BACKEND': 'store.delivery.XSendfileDelivery'
+        }
+
+        (status_code, _, _) = call_asgi(
+            f'/store/products/{product_file.product_id}/files/{product_file.id}/',
+            {'Authorization': token}
+        )
+
+        assert status_code == status.HTTP_204_NO_CONTENT
+
+    def test_returns_429_past_the_customers_rate(self, call_asgi, token, customer, product_file, place_order, settings):
+        settings.THROTTLES = {
+            **settings.THROTTLES,
+            'RATES': {'product-files-detail': {'customer': '1/min'}}
+        }
+        place_order(customer, product_file.product)
+        path = f'/store/products/{product_file.product_id}/files/{product_file.id}/'
+
+        (first, _, _) = call_asgi(path, {'Authorization': token})
+        (second, headers, _) = call_asgi(path, {'Authorization': token})
+
+        assert first == status.HTTP_200_OK
+        assert second == status.HTTP_429_TOO_MANY_REQUESTS
+        assert 'Retry-After' in headers
+
+
+@pytest.fixture
+def get_link(api_client, customer, product_file):
+    def do():
+        response = api_client.post(
+            f'/store/products/{product_file.product_id}/files/{product_file.id}/link/')
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        return response.data['url'].removeprefix('http://testserver')
+    return do
+
+
+@pytest.mark.django_db
+class TestSignedDownloads:
+    def test_returns_403_if_not_owned(self, get_link):
+        response = get_link()
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_downloads_without_queries(self, get_link, customer, product_file, place_order, django_assert_num_queries):
+        place_order(customer, product_file.product)
+        url = get_link()
+
+        with django_assert_num_queries(0):
+            response = APIClient().get(url, HTTP_RANGE='bytes=9-')
+
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response['ETag'] == f'"{product_file.sha256}"'
+        assert b''.join(response.streaming_content) == b'content'
+
+    def test_rejects_tampered_links(self, get_link, customer, product_file, place_order):
+        place_order(customer, product_file.product)
+        url = get_link()
+        (prefix, signature) = url.rstrip('/').rsplit(':', 1)
+
+        response = APIClient().get(f'{prefix}:{signature[::-1]}/')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_rejects_expired_links(self, get_link, customer, product_file, place_order, settings):
+        settings.STORE_DOWNLOAD_LINKS = {
+            **settings.STORE_DOWNLOAD_LINKS, 'MAX_AGE': 0}
+        place_order(customer, product_file.product)
+
+        response = APIClient().get(get_link())
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert response.data['detail'] == 'Download link has expired.'
+
+    def test_accepts_old_keys_until_they_are_removed(self, get_link, customer, product_file, place_order, settings):
+        settings.STORE_DOWNLOAD_LINKS = {
+            **settings.STORE_DOWNLOAD_LINKS,
+            'KEYS': {'a': 'first key'}, 'CURRENT_KEY': 'a'}
+        place_order(customer, product_file.product)
+        url = get_link()
+        settings.STORE_DOWNLOAD_LINKS = {
+            **settings.STORE_DOWNLOAD_LINKS,
+            'KEYS': {'a': 'first key', 'b': 'second key'}, 'CURRENT_KEY': 'b'}
+
+        assert get_link().startswith('/store/downloads/b:')
+        assert APIClient().get(url).status_code == status.HTTP_200_OK
+
+        settings.STORE_DOWNLOAD_LINKS = {
+            **settings.STORE_DOWNLOAD_LINKS,
+            'KEYS': {'b': 'second key'}}
+        assert APIClient().get(url).status_code == status.HTTP_403_FORBIDDEN
+
+    def test_rejects_links_of_revoked_customers(self, get_link, customer, product_file, place_order):
+        order = place_order(customer, product_file.product)
+        url = get_link()
+
+        order.order_status = Order.CANCELED_ORDER
+        order.save()
+        response = APIClient().get(url)
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        assert response.data['detail'] == 'Download link has been revoked.'
+
+    def test_streams_through_asgi(self, get_link, call_asgi, customer, product_file, place_order, metrics):
+        place_order(customer, product_file.product)
+
+        (status_code, headers, body) = call_asgi(get_link())
+
+        assert status_code == status.HTTP_200_OK
+        assert body == b'%PDF-1.4 content'
+        assert metrics('http_requests_total',
+                       'signed-download', 'GET', '200') == 1
+        assert metrics('http_db_queries', 'signed-download')[0] == 1
+
+
+@pytest.fixture
+def pdf_file(product_file):
+    product_file.file.save('book.pdf', ContentFile(build_pdf(3, 256)))
+    return product_file
+
+
+@pytest.fixture
+def named_customer(customer):
+    User.objects.filter(pk=customer.user_id).update(
+        first_name='Ada', last_name='Reader', email='ada@example.com')
+    return customer
+
+
+@pytest.mark.django_db
+class TestWatermarks:
+    def test_appends_the_buyers_stamp(self, get_product_files, named_customer, pdf_file, place_order):
+        place_order(named_customer, pdf_file.product)
+        original = pdf_file.file.read()
+
+        response = get_product_files(pdf_file.product_id, pdf_file.id)
+        body = b''.join(response.streaming_content)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert body.startswith(original)
+        assert b'(Licensed to Ada Reader <ada@example.com>) Tj' in body
+        assert body.endswith(b'%%EOF\n')
+        assert int(response['Content-Length']) == len(body)
+        assert response['ETag'].startswith(f'"{pdf_file.sha256}-')
+
+    def test_serves_ranges_across_the_stamp(self, api_client, get_product_files, named_customer, pdf_file, place_order):
+        place_order(named_customer, pdf_file.product)
+        url = f'/store/products/{pdf_file.product_id}/files/{pdf_file.id}/'
+        body = b''.join(api_client.get(url).streaming_content)
+        start = pdf_file.size - 4
+
+        response = api_client.get(url, HTTP_RANGE=f'bytes={start}-{start + 99}')
+
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert b''.join(response.streaming_content) == body[start:start + 100]
+
+    def test_parses_each_file_once(self, api_client, get_product_files, customer, pdf_file, place_order, monkeypatch):
+        calls = []
+        monkeypatch.setattr(watermark, 'build_template', lambda *args: calls.append(
+            args) or build_template(*args))
+        other = baker.make(settings.AUTH_USER_MODEL).customer
+        bodies = []
+        for buyer in (customer, other):
+            place_order(buyer, pdf_file.product)
+            api_client.force_authenticate(user=buyer.user)
+            for _ in range(2):
+                bodies.append(b''.join(get_product_files(
+                    pdf_file.product_id, pdf_file.id).streaming_content))
+
+        assert len(calls) == 1
+        assert bodies[0] == bodies[1]
+        assert bodies[1] != bodies[2]
+
+    def test_sends_files_as_stored_when_disabled(self, get_product_files, customer, pdf_file, place_order, settings):
+        settings.STORE_WATERMARKS = {**settings.STORE_WATERMARKS, 'ENABLED': False}
+        place_order(customer, pdf_file.product)
+
+        response = get_product_files(pdf_file.product_id, pdf_file.id)
+
+        assert b''.join(response.streaming_content) == pdf_file.file.read()
+
+    def test_signed_links_look_the_stamp_up_once(self, get_link, named_customer, pdf_file, place_order, django_assert_num_queries):
+        place_order(named_customer, pdf_file.product)
+        url = get_link()
+        payload = url.split('/')[-2].partition(':')[2].rsplit(':', 1)[0]
+
+        with django_assert_num_queries(1):
+            first = APIClient().get(url)
+        with django_assert_num_queries(0):
+            second = APIClient().get(url)
+
+        assert b'ada@example.com' not in zlib.decompress(
+            signing.b64_decode(payload[1:].encode()))
+        for response in (first, second):
+            assert b'<ada@example.com>) Tj' in b''.join(
+                response.streaming_content)
+
+    def test_streams_through_asgi(self, call_asgi, token, named_customer, pdf_file, place_order):
+        place_order(named_customer, pdf_file.product)
+
+        (status_code, headers, body) = call_asgi(
+            f'/store/products/{pdf_file.product_id}/files/{pdf_file.id}/',
+            {'Authorization': token})
+
+        assert status_code == status.HTTP_200_OK
+        assert body.startswith(pdf_file.file.read())
+        assert b'<ada@example.com>) Tj' in body
+        assert int(headers['Content-Length']) == len(body)
+
+
+@pytest.mark.django_db
+class TestBackfillOwnedProducts:
+    def test_rebuilds_owned_products_from_completed_orders(self, customer, product_file, place_order):
+        place_order(customer, product_file.product)
+        canceled = baker.make(Product)
+        place_order(customer, canceled, Order.CANCELED_ORDER)
+        OwnedProduct.objects.all().delete()
+        baker.make(OwnedProduct, customer=customer, product=canceled)
+
+        call_command('backfill_owned_products')
+
+        assert list(
+            OwnedProduct.objects.values_list('customer_id', 'product_id')
+        ) == [(customer.id, product_file.product_id)]
+
+
+@pytest.mark.django_db
+class TestProductFilesQueryBudget:
+    def test_list(self, get_product_files, customer, product_file, place_order, query_budget):
+        place_order(customer, product_file.product)
+
+        def add_files_and_orders():
+            for _ in range(5):
+                ProductFile.objects.create(
+                    product=product_file.product, file=product_file.file.name)
+                place_order(customer, product_file.product)
+            cache.clear()
+
+        cache.clear()
+        query_budget(
+            4,
+            lambda: get_product_files(product_file.product_id),
+            add_files_and_orders
+        )
+
+    def test_retrieve(self, get_product_files, customer, product_file, place_order, query_budget):
+        place_order(customer, product_file.product)
+
+        def add_orders():
+            for product in baker.make(Product, 5):
+                place_order(customer, product)
+            cache.clear()
+
+        cache.clear()
+        query_budget(
+            4,
+            lambda: get_product_files(product_file.product_id, product_file.id),
+            add_orders
+        )
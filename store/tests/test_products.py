@@ -73,7 +73,7 @@ class TestListProducts:
         response = get_products()
 
         assert response.status_code == status.HTTP_200_OK
-        assert response.data == [
+        assert response.data['results'] == [
             {
                 'id': product.id,
                 'title': product.title,
@@ -231,4 +231,140 @@ class TestDeleteProducts:
         count_in_db = Product.objects.filter(pk=product.id).count()
 
         assert response.status_code == status.HTTP_204_NO_CONTENT
-        assert count_in_db == 0
\ No newline at end of file
+        assert count_in_db == 0
+
+
+@pytest.mark.django_db
+class TestPaginateProducts:
+    def test_walks_all_pages_forward_and_back(self, api_client):
+        category = baker.make(Category)
+        products = baker.make(Product, 8, category=category)
+
+        pages = []
+        url = '/store/products/?page_size=3'
+        while url is not None:
+            response = api_client.get(url)
+            pages.append([product['id'] for product in response.data['results']])
+            url = response.data['next']
+
+        assert pages == [
+            [product.id for product in products[0:3]],
+            [product.id for product in products[3:6]],
+            [product.id for product in products[6:8]],
+        ]
+
+        response = api_client.get(response.data['previous'])
+
+        assert [product['id'] for product in response.data['results']] == [
+            product.id for product in products[3:6]
+        ]
+
+    def test_caps_page_size(self, api_client, settings):
+        settings.PAGINATION_MAX_PAGE_SIZE = 2
+        category = baker.make(Category)
+        baker.make(Product, 3, category=category)
+
+        response = api_client.get('/store/products/?page_size=50')
+
+        assert len(response.data['results']) == 2
+        assert response.data['next'] is not None
+        assert response.data['previous'] is None
+
+    def test_returns_404_if_cursor_is_invalid(self, api_client):
+        response = api_client.get('/store/products/?cursor=abc')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestSearchProducts:
+    def test_returns_matching_products_ranked_by_relevance(self, get_products, api_client):
+        category = baker.make(Category)
+        in_description = baker.make(
+            Product, category=category, title='Travel guide',
+            description='A journey with a dragon')
+        in_title = baker.make(
+            Product, category=category, title='Dragon tales',
+            description='Stories')
+        baker.make(Product, category=category,
+                   title='Cooking', description='Recipes')
+
+        response = api_client.get('/store/products/?search=dragon')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [product['id'] for product in response.data['results']] == [
+            in_title.id, in_description.id
+        ]
+
+    def test_filters_by_category_and_price(self, api_client):
+        category = baker.make(Category)
+        other_category = baker.make(Category)
+        product = baker.make(Product, category=category, unit_price=10)
+        baker.make(Product, category=category, unit_price=50)
+        baker.make(Product, category=other_category, unit_price=10)
+
+        response = api_client.get(
+            f'/store/products/?category={category.id}&min_price=5&max_price=20')
+
+        assert [item['id'] for item in response.data['results']] == [product.id]
+
+    def test_paginates_search_results(self, api_client):
+        category = baker.make(Category)
+        products = baker.make(Product, 5, category=category,
+                              title='Dragon', description='Dragon')
+
+        response = api_client.get('/store/products/?search=dragon&page_size=3')
+        next_response = api_client.get(response.data['next'])
+
+        assert [item['id'] for item in response.data['results']] + \
+            [item['id'] for item in next_response.data['results']] == \
+            [product.id for product in products]
+
+    def test_ranks_every_match(self, api_client):
+        category = baker.make(Category)
+        best = baker.make(Product, category=category,
+                          title='Dragon', description='Dragon')
+        baker.make(Product, 5, category=category,
+                   title='Travel guide', description='A dragon')
+
+        response = api_client.get('/store/products/?search=dragon&page_size=1')
+
+        assert [item['id'] for item in response.data['results']] == [best.id]
+
+    def test_returns_400_if_price_is_invalid(self, api_client):
+        response = api_client.get('/store/products/?min_price=abc')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestProductsQueryBudget:
+    def test_list(self, get_products, query_budget):
+        category = baker.make(Category)
+        baker.make(Product, 2, category=category)
+
+        query_budget(
+            1,
+            lambda: get_products(),
+            lambda: baker.make(Product, 10, category=category)
+        )
+
+    def test_search(self, api_client, query_budget):
+        category = baker.make(Category)
+        baker.make(Product, 2, category=category, title='Dragon')
+
+        query_budget(
+            1,
+            lambda: api_client.get('/store/products/?search=dragon'),
+            lambda: baker.make(Product, 10, category=category, title='Dragon')
+        )
+
+    def test_retrieve(self, get_products, query_budget):
+        category = baker.make(Category)
+        product = baker.make(Product, category=category)
+
+        def grow():
+            baker.make(Product, 10, category=category)
+            product.save()
+
+        query_budget(1, lambda: get_products(product.id), grow)
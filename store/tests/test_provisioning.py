@@ -0,0 +1,193 @@
+import json
+from io import BytesIO, StringIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from model_bakery import baker
+from core.models import User
+from store.models import Customer
+from store.provisioning import UserProvisioner
+import pytest
+
+CSV_USERS = (
+    'username,password,first_name,last_name,email\r\n'
+    'alice,AbCdEfGhI123456789,Alice,Smith,alice@example.com\r\n'
+    'bob,AbCdEfGhI123456789,Bob,,bob@example.com\r\n'
+    'not valid,AbCdEfGhI123456789,,,carol@example.com\r\n'
+    'dave,AbCdEfGhI123456789,,,alice@example.com\r\n'
+)
+
+
+def make_rows(count, start=0):
+    return ''.join(
+        json.dumps({
+            'username': f'user{i}',
+            'password': f'password{i}',
+            'email': f'user{i}@example.com'
+        }) + '\n'
+        for i in range(start, start + count)
+    )
+
+
+def provision(body, file_format='ndjson', batch_size=1000, workers=0):
+    return UserProvisioner(batch_size, workers).run(
+        BytesIO(body.encode()), file_format)
+
+
+@pytest.fixture(autouse=True)
+def hash_in_process(settings):
+    settings.PASSWORD_HASHING = {**settings.PASSWORD_HASHING, 'WORKERS': 0}
+
+
+@pytest.fixture
+def provision_users(api_client):
+    def do(body, content_type):
+        return api_client.generic(
+            'POST', '/store/customers/provision/', body,
+            content_type=content_type)
+    return do
+
+
+@pytest.mark.django_db
+class TestUserProvisioner:
+    def test_creates_the_rows_signing_up_creates(self, api_client):
+        row = {
+            'username': 'alice',
+            'password': 'AbCdEfGhI123456789',
+            'first_name': 'Alice',
+            'last_name': 'Smith',
+            'email': 'alice@example.com'
+        }
+        api_client.post('/auth/users/', row)
+        signed_up = User.objects.get(username='alice')
+
+        report = provision(json.dumps({**row, 'username': 'bob',
+                                       'email': 'bob@example.com'}))
+
+        provisioned = User.objects.get(username='bob')
+        assert report == {'created': 1, 'error_count': 0, 'errors': []}
+        assert provisioned.check_password('AbCdEfGhI123456789')
+        fields = [field.attname for field in User._meta.concrete_fields
+                  if field.attname not in (
+                      'id', 'username', 'email', 'password', 'date_joined')]
+        assert [getattr(provisioned, name) for name in fields] == \
+            [getattr(signed_up, name) for name in fields]
+        assert Customer.objects.filter(user=provisioned).values_list(
+            'phone', flat=True).get() == Customer.objects.filter(
+            user=signed_up).values_list('phone', flat=True).get()
+
+    def test_reports_invalid_and_duplicate_rows(self):
+        baker.make(User, username='bob')
+
+        report = provision(CSV_USERS, 'csv')
+
+        assert report['created'] == 1
+        assert report['error_count'] == 3
+        assert [error['line'] for error in report['errors']] == [3, 4, 5]
+        assert report['errors'][0]['errors'] == {
+            'username': ['A user with that username already exists.']}
+        assert set(report['errors'][1]['errors']) == {'username'}
+        assert report['errors'][2]['errors'] == {
+            'email': ['user with this email already exists.']}
+        assert Customer.objects.get(user__username='alice').phone == ''
+
+    def test_runs_a_fixed_number_of_queries_per_batch(self):
+        with CaptureQueriesContext(connection) as small:
+            provision(make_rows(2), batch_size=2)
+        with CaptureQueriesContext(connection) as large:
+            provision(make_rows(10, start=2), batch_size=10)
+
+        assert len(large) == len(small)
+        assert Customer.objects.count() == User.objects.count() == 12
+
+    def test_saves_every_batch(self):
+        report = provision(make_rows(5), batch_size=2)
+
+        assert report['created'] == 5
+        assert Customer.objects.filter(
+            user__username__startswith='user').count() == 5
+
+    def test_hashes_in_worker_processes_of_its_own(self, settings):
+        report = provision(make_rows(4), batch_size=3, workers=2)
+
+        assert report['created'] == 4
+        assert User.objects.get(username='user3').check_password('password3')
+
+    def test_hashes_in_the_hashing_pool_without_workers(self, settings, metrics):
+        settings.PASSWORD_HASHING = {**settings.PASSWORD_HASHING, 'WORKERS': 1}
+
+        report = provision(make_rows(3), batch_size=2)
+
+        assert report['created'] == 3
+        assert User.objects.get(username='user2').check_password('password2')
+        assert sum(metrics('password_hash_seconds', 'hash')[:-1]) == 3
+
+
+@pytest.mark.django_db
+class TestProvisionUsers:
+    def test_returns_403_if_not_admin(self, provision_users, authorize):
+        authorize()
+
+        response = provision_users(CSV_USERS, 'text/csv')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_returns_400_if_format_is_unknown(self, provision_users, authorize):
+        authorize(True)
+
+        response = provision_users('a', 'text/plain')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_provisions_csv(self, provision_users, authorize):
+        authorize(True)
+
+        response = provision_users(CSV_USERS, 'text/csv')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['created'] == 2
+        assert response.data['error_count'] == 2
+
+    def test_accepts_multipart_file(self, api_client, authorize):
+        authorize(True)
+        upload = SimpleUploadedFile(
+            'users.ndjson', make_rows(3).encode(),
+            content_type='application/x-ndjson')
+
+        response = api_client.post(
+            '/store/customers/provision/', {'file': upload},
+            format='multipart')
+
+        assert response.data['created'] == 3
+
+    def test_returns_400_past_the_row_limit(self, provision_users, authorize, settings):
+        settings.STORE_PROVISIONING = {'MAX_ROWS': 2}
+        authorize(True)
+
+        response = provision_users(make_rows(3), 'application/x-ndjson')
+        within = provision_users(make_rows(2, start=3), 'application/x-ndjson')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert 'message' in response.data
+        assert within.data['created'] == 2
+        assert not User.objects.filter(username='user0').exists()
+
+    def test_customer_list_still_rejects_post(self, api_client, authorize):
+        authorize(True)
+
+        response = api_client.post('/store/customers/', {})
+
+        assert response.status_code == status.HTTP_405_METHOD_NOT_ALLOWED
+
+    def test_command_reports_errors(self, tmp_path):
+        source = tmp_path / 'users.csv'
+        source.write_text(CSV_USERS)
+        (output, errors) = (StringIO(), StringIO())
+
+        call_command('provision_users', str(source), stdout=output,
+                     stderr=errors)
+
+        assert 'Created 2 users, 2 rows with errors.' in output.getvalue()
+        assert errors.getvalue().startswith('line 4:')
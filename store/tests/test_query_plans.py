@@ -0,0 +1,51 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from model_bakery import baker
+from store.models import Product
+from store.query_plans import explain, seq_scans, used_indexes
+import pytest
+
+
+def make_plan(node_type, relation, plans=(), **extra):
+    return {'Node Type': node_type, 'Relation Name': relation,
+            'Plans': list(plans), **extra}
+
+
+class TestSeqScans:
+    def test_finds_nested_seq_scans_of_hot_tables(self):
+        plan = {'Plan': {
+            'Node Type': 'Nested Loop',
+            'Plans': [
+                make_plan('Seq Scan', 'store_order'),
+                make_plan('Index Scan', 'store_orderitem',
+                          **{'Index Name': 'store_orderitem_pkey'})
+            ]
+        }}
+
+        assert seq_scans(plan) == ['store_order']
+        assert used_indexes(plan) == ['store_orderitem_pkey']
+
+    def test_ignores_seq_scans_of_small_tables(self):
+        plan = {'Plan': make_plan('Seq Scan', 'store_category')}
+
+        assert seq_scans(plan) == []
+
+
+@pytest.mark.django_db
+@pytest.mark.skipif(connection.vendor != 'postgresql',
+                    reason='plans come from Postgres EXPLAIN')
+class TestExplain:
+    def test_explains_captured_queries(self):
+        product = baker.make(Product)
+        with CaptureQueriesContext(connection) as queries:
+            Product.objects.get(pk=product.id)
+
+        plan = explain(queries[0]['sql'])
+
+        assert 'Execution Time' in plan
+        assert plan['Plan']['Actual Rows'] == 1
+
+    def test_reports_a_full_table_read(self):
+        plan = explain('SELECT * FROM store_order')
+
+        assert seq_scans(plan) == ['store_order']
@@ -0,0 +1,105 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from model_bakery import baker
+from store.models import Category, Product, ProductFile
+import pytest
+
+
+@pytest.fixture
+def category():
+    return baker.make(Category)
+
+
+@pytest.fixture
+def product(category):
+    return baker.make(Product, category=category)
+
+
+@pytest.mark.django_db
+class TestResponseCache:
+    def test_serves_repeated_list_without_queries(self, api_client, product):
+        first = api_client.get('/store/products/')
+        with CaptureQueriesContext(connection) as queries:
+            second = api_client.get('/store/products/')
+
+        assert len(queries) == 0
+        assert second.status_code == status.HTTP_200_OK
+        assert second.data == first.data
+
+    def test_keys_on_query_string(self, api_client, category):
+        baker.make(Product, category=category, unit_price=10)
+        other = baker.make(Product, category=category, unit_price=500)
+        api_client.get('/store/products/')
+
+        response = api_client.get('/store/products/?min_price=400')
+
+        assert [item['id'] for item in response.data['results']] == [other.id]
+
+    def test_product_save_invalidates_list_and_detail(self, api_client, product):
+        api_client.get('/store/products/')
+        api_client.get(f'/store/products/{product.id}/')
+        product.title = 'Changed'
+        product.save()
+
+        list_response = api_client.get('/store/products/')
+        detail_response = api_client.get(f'/store/products/{product.id}/')
+
+        assert list_response.data['results'][0]['title'] == 'Changed'
+        assert detail_response.data['title'] == 'Changed'
+
+    def test_product_save_keeps_other_details_cached(self, api_client, category, product):
+        other = baker.make(Product, category=category)
+        api_client.get(f'/store/products/{other.id}/')
+        product.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            api_client.get(f'/store/products/{other.id}/')
+
+        assert len(queries) == 0
+
+    def test_category_delete_invalidates_detail(self, api_client, category):
+        api_client.get(f'/store/categories/{category.id}/')
+        category.delete()
+
+        response = api_client.get(f'/store/categories/{category.id}/')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_product_file_save_invalidates_product_detail(self, api_client, product):
+        api_client.get(f'/store/products/{product.id}/')
+        ProductFile.objects.create(product=product, file='book.pdf')
+
+        with CaptureQueriesContext(connection) as queries:
+            api_client.get(f'/store/products/{product.id}/')
+
+        assert len(queries) == 1
+
+    def test_does_not_cache_errors(self, api_client, category):
+        api_client.get('/store/products/1/')
+        product = baker.make(Product, category=category, id=1)
+
+        response = api_client.get(f'/store/products/{product.id}/')
+
+        assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+class TestResponseCacheStats:
+    def test_returns_403_if_not_admin(self, api_client, authorize):
+        authorize()
+
+        response = api_client.get('/store/cache-stats/')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_returns_hits_and_misses(self, api_client, authorize, product):
+        api_client.get('/store/products/')
+        api_client.get('/store/products/')
+        api_client.get('/store/categories/')
+        authorize(True)
+
+        response = api_client.get('/store/cache-stats/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {'hits': 1, 'misses': 2, 'hit_ratio': 1 / 3}
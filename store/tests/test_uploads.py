@@ -0,0 +1,293 @@
+import base64
+import hashlib
+import os
+from io import BytesIO
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import connection
+from rest_framework import status
+from model_bakery import baker
+from store import uploads
+from store.models import FileUpload, Product, ProductFile
+from store.validators import validate_file_type
+import pytest
+
+PDF = (
+    b'%PDF-1.4\n'
+    b'1 0 obj\n<< /Type /Catalog >>\nendobj\n'
+    + b'x' * 200_000 +
+    b'\nxref\n0 2\n0000000000 65535 f \n0000000009 00000 n \n'
+    b'trailer\n<< /Size 2 /Root 1 0 R >>\n'
+)
+PDF += b'startxref\n' + str(PDF.index(b'xref\n0 2')).encode() + b'\n%%EOF\n'
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path
+
+
+@pytest.fixture
+def product():
+    return baker.make(Product)
+
+
+@pytest.fixture
+def create_upload(api_client, authorize, product):
+    def do(filename='book.v2.final.pdf', size=len(PDF)):
+        authorize(is_staff=True)
+        return api_client.post(
+            f'/store/products/{product.id}/uploads/',
+            {'filename': filename, 'size': size}
+        )
+    return do
+
+
+@pytest.fixture
+def send_chunk(api_client, product):
+    def do(upload_id, offset, data, **headers):
+        return api_client.patch(
+            f'/store/products/{product.id}/uploads/{upload_id}/',
+            data,
+            content_type='application/offset+octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset),
+            **headers
+        )
+    return do
+
+
+@pytest.mark.django_db
+class TestCreateUpload:
+    def test_returns_403_if_not_admin(self, api_client, authorize, product):
+        authorize()
+
+        response = api_client.post(
+            f'/store/products/{product.id}/uploads/',
+            {'filename': 'book.pdf', 'size': 10}
+        )
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_returns_201_with_location(self, create_upload):
+        response = create_upload()
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response['Upload-Offset'] == '0'
+        assert response['Location'].endswith(f'/uploads/{response.data["id"]}/')
+
+    def test_returns_400_if_not_pdf(self, create_upload):
+        response = create_upload(filename='book.pdf.exe')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_returns_400_if_too_large(self, create_upload, settings):
+        response = create_upload(size=settings.STORE_UPLOADS['MAX_SIZE'] + 1)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestAppendChunks:
+    def test_completes_upload_from_chunks(self, create_upload, send_chunk):
+        upload_id = create_upload().data['id']
+
+        first = send_chunk(upload_id, 0, PDF[:100_000])
+        second = send_chunk(upload_id, 100_000, PDF[100_000:])
+
+        assert first.status_code == status.HTTP_204_NO_CONTENT
+        assert first['Upload-Offset'] == '100000'
+        assert second.status_code == status.HTTP_201_CREATED
+        product_file = ProductFile.objects.get(pk=second.data['id'])
+        assert product_file.file.read() == PDF
+        upload = FileUpload.objects.get(pk=upload_id)
+        assert upload.sha256 == hashlib.sha256(PDF).hexdigest()
+        assert (product_file.size, product_file.sha256) == (
+            len(PDF), upload.sha256)
+        assert second.data['size'] == len(PDF)
+
+    def test_head_returns_offset_to_resume_from(self, api_client, create_upload, send_chunk, product):
+        upload_id = create_upload().data['id']
+        send_chunk(upload_id, 0, PDF[:1000])
+
+        response = api_client.head(
+            f'/store/products/{product.id}/uploads/{upload_id}/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Upload-Offset'] == '1000'
+        assert response['Upload-Length'] == str(len(PDF))
+
+    def test_returns_409_if_offset_does_not_match(self, create_upload, send_chunk):
+        upload_id = create_upload().data['id']
+        send_chunk(upload_id, 0, PDF[:1000])
+
+        response = send_chunk(upload_id, 500, PDF[500:2000])
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+
+    def test_returns_400_if_not_a_pdf(self, create_upload, send_chunk):
+        upload_id = create_upload().data['id']
+
+        response = send_chunk(upload_id, 0, b'MZ\x90\x00')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert FileUpload.objects.get(pk=upload_id).offset == 0
+
+    def test_returns_400_if_structure_is_broken(self, create_upload, send_chunk):
+        data = PDF.replace(b'%%EOF', b'%%EOX')
+        upload_id = create_upload().data['id']
+
+        response = send_chunk(upload_id, 0, data)
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not ProductFile.objects.exists()
+
+    def test_drops_chunk_if_checksum_does_not_match(self, create_upload, send_chunk):
+        upload_id = create_upload().data['id']
+        digest = base64.b64encode(hashlib.sha256(b'other').digest()).decode()
+
+        response = send_chunk(
+            upload_id, 0, PDF[:1000], HTTP_UPLOAD_CHECKSUM=f'sha256 {digest}')
+        retry = send_chunk(upload_id, 0, PDF[:1000])
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert retry.status_code == status.HTTP_204_NO_CONTENT
+        assert retry['Upload-Offset'] == '1000'
+
+    def test_keeps_the_chunk_that_lands_first(self, create_upload, send_chunk):
+        upload = FileUpload.objects.get(pk=create_upload().data['id'])
+
+        class SlowStream(BytesIO):
+            def read(self, size):
+                if self.tell() == 0:
+                    # Another request for the same offset finishes while
+                    # this one is still reading.
+                    send_chunk(upload.id, 0, PDF[:1000])
+                return super().read(size)
+
+        with pytest.raises(uploads.OffsetMismatch):
+            uploads.append_chunk(upload, SlowStream(b'%PDF-' + b'y' * 995), 0, 1000)
+
+        path = uploads.partial_path(upload)
+        with open(path, 'rb') as file_handle:
+            assert file_handle.read() == PDF[:1000]
+        assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
+        assert FileUpload.objects.get(pk=upload.id).offset == 1000
+
+    def test_hashes_the_whole_file_once(self, create_upload, send_chunk, monkeypatch):
+        calls = []
+        hash_file = uploads.hash_file
+
+        def count_calls(file_handle):
+            calls.append(file_handle.name)
+            return hash_file(file_handle)
+
+        monkeypatch.setattr(uploads, 'hash_file', count_calls)
+        upload_id = create_upload().data['id']
+
+        for offset in range(0, len(PDF), 50_000):
+            send_chunk(upload_id, offset, PDF[offset:offset + 50_000])
+
+        upload = FileUpload.objects.get(pk=upload_id)
+        assert upload.sha256 == hashlib.sha256(PDF).hexdigest()
+        assert len(calls) == 1
+
+    def test_stores_the_file_after_the_last_chunk_commits(self, create_upload, send_chunk, monkeypatch):
+        upload_id = create_upload().data['id']
+        send_chunk(upload_id, 0, PDF[:100_000])
+        depth = len(connection.savepoint_ids)
+        depths = []
+        fill_metadata = ProductFile.fill_metadata
+
+        def record_depth(product_file):
+            depths.append(len(connection.savepoint_ids))
+            fill_metadata(product_file)
+
+        monkeypatch.setattr(ProductFile, 'fill_metadata', record_depth)
+
+        response = send_chunk(upload_id, 100_000, PDF[100_000:])
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert depths == [depth]
+
+    def test_retries_storing_with_an_empty_chunk(self, create_upload, send_chunk, monkeypatch):
+        upload = FileUpload.objects.get(pk=create_upload().data['id'])
+        hash_file = uploads.hash_file
+        monkeypatch.setattr(uploads, 'hash_file', lambda file_handle: 1 / 0)
+
+        with pytest.raises(ZeroDivisionError):
+            uploads.append_chunk(upload, BytesIO(PDF), 0, len(PDF))
+        monkeypatch.setattr(uploads, 'hash_file', hash_file)
+        response = send_chunk(upload.id, len(PDF), b'')
+
+        assert response.status_code == status.HTTP_201_CREATED
+        upload.refresh_from_db()
+        assert upload.offset == len(PDF)
+        assert upload.product_file.file.read() == PDF
+
+    def test_reuses_stored_file_with_same_content(self, create_upload, send_chunk):
+        first = send_chunk(create_upload().data['id'], 0, PDF)
+        upload_id = create_upload().data['id']
+        path = uploads.partial_path(FileUpload.objects.get(pk=upload_id))
+
+        second = send_chunk(upload_id, 0, PDF)
+
+        (first_file, second_file) = ProductFile.objects.filter(
+            pk__in=[first.data['id'], second.data['id']])
+        assert first_file.file.name == second_file.file.name
+        assert not os.path.exists(path)
+
+    def test_delete_removes_partial_file(self, api_client, create_upload, send_chunk, product):
+        upload_id = create_upload().data['id']
+        send_chunk(upload_id, 0, PDF[:1000])
+        path = uploads.partial_path(FileUpload.objects.get(pk=upload_id))
+
+        response = api_client.delete(
+            f'/store/products/{product.id}/uploads/{upload_id}/')
+
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert not FileUpload.objects.exists()
+        assert not os.path.exists(path)
+
+
+class TestValidateFileType:
+    def test_accepts_names_with_several_dots(self):
+        validate_file_type(ContentFile(b'', name='book.v2.PDF'))
+
+    def test_rejects_other_types(self):
+        with pytest.raises(ValidationError):
+            validate_file_type(ContentFile(b'', name='book.pdf.zip'))
+
+
+@pytest.mark.django_db
+class TestUploadsQueryBudget:
+    def test_create(self, create_upload, product, query_budget):
+        query_budget(
+            2,
+            create_upload,
+            lambda: baker.make(FileUpload, 10, product=product, size=10)
+        )
+
+    def test_retrieve(self, api_client, create_upload, product, query_budget):
+        upload_id = create_upload().data['id']
+
+        query_budget(
+            1,
+            lambda: api_client.head(
+                f'/store/products/{product.id}/uploads/{upload_id}/'),
+            lambda: baker.make(FileUpload, 10, product=product, size=10)
+        )
+
+    def test_append_chunk(self, create_upload, send_chunk, product, query_budget):
+        upload_id = create_upload().data['id']
+        offsets = iter(range(0, len(PDF), 1000))
+
+        def append():
+            offset = next(offsets)
+            send_chunk(upload_id, offset, PDF[offset:offset + 1000])
+
+        # Two reads, and the offset update in a savepoint.
+        query_budget(
+            5,
+            append,
+            lambda: baker.make(FileUpload, 10, product=product, size=10)
+        )
@@ -0,0 +1,129 @@
+from io import BytesIO
+from store.management.commands.benchmark_watermarks import build_pdf
+from store.watermark import (
+    LRUCache, PDFReader, Ref, UnsupportedPDF, build_template, pdf_string,
+    render)
+import pytest
+
+TEXT = 'Licensed to Ada Reader <ada@example.com>'
+
+
+def write_pdf(objects, trailer=b''):
+    """
+    Returns a PDF of `objects`, a {number: body} dict, indexed by an xref
+    table, with object 1 as its catalog.
+    """
+    output = bytearray(b'%PDF-1.4\n')
+    offsets = {}
+    for (num, body) in sorted(objects.items()):
+        offsets[num] = len(output)
+        output += b'%d 0 obj\n%s\nendobj\n' % (num, body)
+    size = max(objects) + 1
+    xref_offset = len(output)
+    output += b'xref\n0 %d\n0000000000 65535 f\r\n' % size
+    for num in range(1, size):
+        output += b'%010d 00000 n\r\n' % offsets.get(num, 0)
+    output += b'trailer\n<< /Size %d /Root 1 0 R %s>>\nstartxref\n%d\n%%%%EOF' % (
+        size, trailer, xref_offset)
+    return bytes(output)
+
+
+def stamp(pdf, text=TEXT):
+    stamped = pdf + render(build_template(BytesIO(pdf), len(pdf)), text)
+    return PDFReader(BytesIO(stamped), len(stamped))
+
+
+def get_annotations(reader, page):
+    return [reader.resolve(annotation)
+            for annotation in reader.resolve(page.get('Annots', []))]
+
+
+class TestStamping:
+    @pytest.mark.parametrize('xref_stream', [False, True])
+    def test_adds_a_watermark_to_every_page(self, xref_stream):
+        pdf = build_pdf(3, 128, xref_stream=xref_stream)
+
+        reader = stamp(pdf)
+
+        pages = reader.pages()
+        assert len(pages) == 3
+        assert reader.xref_stream == xref_stream
+        appearances = set()
+        for (_, page, _) in pages:
+            [annotation] = get_annotations(reader, page)
+            assert annotation['Subtype'] == 'Watermark'
+            appearances.add(annotation['AP']['N'])
+        [appearance] = appearances
+        assert reader.resolve(appearance)['Subtype'] == 'Form'
+        assert b'(Licensed to Ada Reader <ada@example.com>) Tj' in \
+            reader.file.getvalue()
+
+    def test_keeps_the_pages_annotations(self):
+        pdf = write_pdf({
+            1: b'<< /Type /Catalog /Pages 2 0 R >>',
+            2: b'<< /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 '
+               b'/MediaBox [0 0 300 400] >>',
+            3: b'<< /Type /Page /Parent 2 0 R /Annots [<< /Subtype /Link '
+               b'/Rect [0 0 10 10] >>] >>',
+            4: b'<< /Type /Page /Parent 2 0 R /Annots 5 0 R '
+               b'/CropBox [50 60 250 360] >>',
+            5: b'[6 0 R]',
+            6: b'<< /Subtype /Text /Rect [0 0 10 10] /Contents (a \\) b) >>',
+        })
+
+        reader = stamp(pdf)
+
+        (first, second) = [page for (_, page, _) in reader.pages()]
+        assert [annotation['Subtype'] for annotation in get_annotations(
+            reader, first)] == ['Link', 'Watermark']
+        assert second['Annots'] == Ref(5, 0)
+        (text, watermark) = get_annotations(reader, second)
+        assert text['Contents'] == b'(a \\) b)'
+        assert [float(number) for number in watermark['Rect'][:2]] == [68, 78]
+
+    def test_chains_to_the_previous_xref(self):
+        pdf = build_pdf(2, 64)
+        previous = PDFReader(BytesIO(pdf), len(pdf)).startxref
+
+        reader = stamp(pdf)
+
+        assert int(reader.trailer['Prev']) == previous
+        assert reader.trailer['Root'] == Ref(1, 0)
+
+    def test_rejects_encrypted_files(self):
+        pdf = write_pdf({
+            1: b'<< /Type /Catalog /Pages 2 0 R >>',
+            2: b'<< /Type /Pages /Kids [] /Count 0 >>',
+            3: b'<< /Filter /Standard >>',
+        }, trailer=b'/Encrypt 3 0 R ')
+
+        with pytest.raises(UnsupportedPDF):
+            build_template(BytesIO(pdf), len(pdf))
+
+    def test_escapes_and_shortens_text(self):
+        assert pdf_string('a (b) \\ c') == b'(a \\(b\\) \\\\ c)'
+        assert pdf_string('Zoë') == b'(Zo\xeb)'
+        shortened = pdf_string('x' * 500)
+        assert shortened.endswith(b'...)')
+        assert len(shortened) < 120
+
+
+class TestLRUCache:
+    def test_drops_least_recently_used_values_past_max_size(self):
+        cache = LRUCache(10)
+        cache.set('a', 1, 4)
+        cache.set('b', 2, 4)
+        cache.get('a')
+
+        cache.set('c', 3, 4)
+
+        assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+        assert cache.size == 8
+
+    def test_skips_values_larger_than_max_size(self):
+        cache = LRUCache(10)
+        cache.set('a', 1, 4)
+
+        cache.set('b', 2, 11)
+
+        assert (cache.get('a'), cache.get('b')) == (1, None)
@@ -0,0 +1,211 @@
+import base64
+import hashlib
+import os
+import re
+import shutil
+from uuid import uuid4
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from .models import FileUpload, ProductFile
+
+CHUNK_SIZE = 64 * 1024
+PDF_HEADER = b'%PDF-'
+TRAILER_SIZE = 1024
+XREF_PATTERN = re.compile(rb'\s*(xref|\d+\s+\d+\s+obj)')
+
+
+class UploadError(Exception):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    pass
+
+
+class _PartialFile(File):
+    # Lets the storage move the partial file into place, not copy it.
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def partial_path(upload):
+    return default_storage.path(
+        f'{settings.STORE_UPLOADS["DIRECTORY"]}/{upload.id}.part')
+
+
+def parse_checksum(header):
+    """
+    Parses an `Upload-Checksum: sha256 <base64 digest>` header.
+    """
+    if not header:
+        return None
+    (algorithm, _, digest) = header.partition(' ')
+    if algorithm != 'sha256':
+        raise UploadError('Only sha256 checksums are supported.')
+    try:
+        return base64.b64decode(digest, validate=True)
+    except ValueError:
+        raise UploadError('Invalid checksum.')
+
+
+def check_header(offset, chunk):
+    if offset >= len(PDF_HEADER):
+        return
+    expected = PDF_HEADER[offset:offset + len(chunk)]
+    if chunk[:len(expected)] != expected:
+        raise UploadError('File is not a PDF.')
+
+
+def check_trailer(file_handle, size):
+    """
+    Checks that the file ends with %%EOF and that its last startxref
+    points at a cross-reference table or stream.
+    """
+    file_handle.seek(max(size - TRAILER_SIZE, 0))
+    trailer = file_handle.read(TRAILER_SIZE)
+    if b'%%EOF' not in trailer[-32:]:
+        raise UploadError('PDF has no %%EOF marker.')
+
+    position = trailer.rfind(b'startxref')
+    match = re.match(rb'startxref\s+(\d+)', trailer[position:]) \
+        if position != -1 else None
+    if match is None:
+        raise UploadError('PDF has no startxref.')
+    xref = int(match.group(1))
+    if not 0 < xref < size:
+        raise UploadError('PDF startxref is out of range.')
+
+    file_handle.seek(xref)
+    if not XREF_PATTERN.match(file_handle.read(32)):
+        raise UploadError('PDF startxref does not point at a xref.')
+
+
+def hash_file(file_handle):
+    """
+    Returns the sha256 hex digest of an open file, read in small chunks.
+    """
+    file_handle.seek(0)
+    hasher = hashlib.sha256()
+    for chunk in iter(lambda: file_handle.read(CHUNK_SIZE), b''):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def check_offset(upload, offset, length):
+    if upload.product_file_id is not None or offset != upload.offset:
+        raise OffsetMismatch(f'Upload is at offset {upload.offset}.')
+    if upload.offset + length > upload.size:
+        raise UploadError('Chunk goes past the upload length.')
+
+
+def receive_chunk(stream, path, offset, length):
+    """
+    Reads up to `length` bytes of `stream` into the file at `path` in
+    small chunks. Returns how many bytes arrived and their sha256 digest.
+    """
+    chunk_hasher = hashlib.sha256()
+    written = 0
+    with open(path, 'wb') as file_handle:
+        while written < length:
+            try:
+                data = stream.read(min(CHUNK_SIZE, length - written))
+            except OSError:
+                data = b''
+            if not data:
+                # The client went away; what arrived is kept so the
+                # upload resumes from there.
+                break
+            check_header(offset + written, data)
+            file_handle.write(data)
+            chunk_hasher.update(data)
+            written += len(data)
+    return (written, chunk_hasher.digest())
+
+
+def append_chunk(upload, stream, offset, length, checksum=None):
+    """
+    Appends `length` bytes read from `stream` to the upload at `offset`,
+    reading them in small chunks. Returns the updated upload, whose
+    `product_file` is set once the last byte has arrived. Chunks are only
+    hashed on their own, for Upload-Checksum; the whole file is hashed
+    once, when it is complete, so chunks landing on different workers
+    cost nothing extra.
+
+    The bytes are read into a file of their own outside any transaction,
+    so a slow client holds no row lock or database connection. Only moving
+    them onto the partial file (and checking the trailer after the last
+    one) runs in one, after an UPDATE of the offset conditional on the
+    offset they were sent for. The complete file is stored once that has
+    committed; if storing fails, sending an empty chunk at the final
+    offset tries again.
+    """
+    upload = FileUpload.objects.get(pk=upload.pk)
+    check_offset(upload, offset, length)
+    path = partial_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    chunk_path = f'{path}.{uuid4().hex}'
+    try:
+        (written, digest) = receive_chunk(stream, chunk_path, offset, length)
+        if checksum is not None and (written < length or digest != checksum):
+            raise UploadError('Checksum mismatch.')
+
+        with transaction.atomic():
+            # Also locks the row until the chunk is in place, so requests
+            # sent for the same offset cannot both append theirs.
+            if not FileUpload.objects.filter(
+                    pk=upload.pk, offset=offset, product_file=None
+            ).update(offset=offset + written):
+                upload.refresh_from_db(fields=['offset', 'product_file'])
+                raise OffsetMismatch(f'Upload is at offset {upload.offset}.')
+            with open(path, 'ab') as file_handle, \
+                    open(chunk_path, 'rb') as chunk:
+                file_handle.truncate(offset)
+                shutil.copyfileobj(chunk, file_handle, CHUNK_SIZE)
+            upload.offset = offset + written
+            if upload.offset < upload.size:
+                return upload
+            with open(path, 'rb') as file_handle:
+                check_trailer(file_handle, upload.size)
+    finally:
+        if os.path.exists(chunk_path):
+            os.remove(chunk_path)
+
+    return finish_upload(upload, path)
+
+
+def finish_upload(upload, path):
+    """
+    Hashes and stores the complete partial file of `upload` as its
+    ProductFile, outside the transaction that took its last chunk, so the
+    full-file reads hold no row lock. Linking the ProductFile is an UPDATE
+    guarded on the upload still having none; if a retry of the last chunk
+    got there first, this one's is dropped.
+    """
+    with open(path, 'rb') as file_handle:
+        upload.sha256 = hash_file(file_handle)
+        product_file = ProductFile(
+            product_id=upload.product_id, filename=upload.filename)
+        content = _PartialFile(file_handle)
+        content.sha256 = upload.sha256
+        product_file.file.save(upload.filename, content)
+    if os.path.exists(path):
+        # The same file was stored already.
+        os.remove(path)
+
+    if not FileUpload.objects.filter(
+            pk=upload.pk, product_file=None
+    ).update(sha256=upload.sha256, product_file=product_file):
+        product_file.delete()
+        upload.refresh_from_db(fields=['sha256', 'product_file'])
+        return upload
+    upload.product_file = product_file
+    return upload
+
+
+def delete_upload(upload):
+    path = partial_path(upload)
+    if os.path.exists(path):
+        os.remove(path)
+    upload.delete()
@@ -1,3 +1,4 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 from rest_framework_nested import routers
 from . import views
@@ -6,12 +7,28 @@ router = DefaultRouter()
 router.register('categories', views.CategoryViewSet, basename='categories')
 router.register('products', views.ProductViewSet, basename='products')
 router.register('customers', views.CustomerViewSet, basename='customers')
+router.register('orders', views.OrderViewSet, basename='orders')
 
 
 product_router = routers.NestedDefaultRouter(
     router, 'products', lookup='product')
 product_router.register(
     'files', views.ProductFileViewSet, basename='product-files')
+product_router.register(
+    'uploads', views.FileUploadViewSet, basename='product-uploads')
+
 
+urlpatterns = [
+    path('downloads/<str:token>/', views.SignedDownloadView.as_view(),
+         name='signed-download'),
+    path('cache-stats/', views.ResponseCacheStatsView.as_view(),
+         name='cache-stats'),
+    path('analytics/sales/', views.SalesView.as_view(),
+         name='sales-analytics'),
+    path('analytics/products/', views.ProductSalesView.as_view(),
+         name='product-sales-analytics'),
+    path('analytics/categories/', views.CategorySalesView.as_view(),
+         name='category-sales-analytics'),
+]
 
-urlpatterns = router.urls + product_router.urls
+urlpatterns += router.urls + product_router.urls
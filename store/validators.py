@@ -3,6 +3,6 @@ import os
 
 
 def validate_file_type(file):
-    file_name, extension = os.path.basename(file.name).split('.')
-    if extension != 'pdf':
+    extension = os.path.splitext(os.path.basename(file.name))[1]
+    if extension.lower() != '.pdf':
         raise ValidationError('Type of uploaded file should be PDF.')
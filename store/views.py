@@ -1,19 +1,36 @@
-from uuid import uuid4
+from io import BytesIO
+from django.conf import settings
+from django.db.models import F, Sum
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.http import FileResponse
+from django.urls import reverse
+from django.utils.functional import cached_property
 from rest_framework import viewsets
 from rest_framework import permissions
 from rest_framework import mixins
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework import status
-from store.models import Category, Customer, Order, Product, ProductFile
+from rest_framework.decorators import action
+from core.db.routing import ReplicaReadMixin
+from store.cache import CachedResponseMixin, get_stats
+from store.catalog import CSV, NDJSON, CatalogImporter, export_catalog, get_format
+from store.delivery import get_delivery_backend
+from store.download_links import sign_download_link, verify_download_link
+from store.entitlements import owns_product
+from store.models import Category, CategorySales, Customer, DailySales, FileUpload, Order, Product, ProductFile, ProductSales
 from store.permissions import IsAdminOrReadOnly
-from store.serializers import CategorySerializer, CustomerSerializer, ProductFileSerializer, ProductSerializer, UpdateCustomerSerializer
+from store.provisioning import ProvisioningError, UserProvisioner
+from store.search import search_products
+from store.serializers import CategorySerializer, CheckoutSerializer, CustomerSerializer, FileUploadSerializer, OrderSerializer, ProductFileSerializer, ProductFilterSerializer, ProductSerializer, SalesFilterSerializer, SalesSerializer, UpdateCustomerSerializer, hash_checkout
+from store.uploads import OffsetMismatch, UploadError, append_chunk, delete_upload, parse_checksum
+from store.watermark import Stamp
 
 
 class CustomerViewSet(viewsets.ModelViewSet):
     http_method_names = ['get', 'patch', 'options', 'head']
     serializer_class = CustomerSerializer
+    ordering = ('id',)
 
     def get_permissions(self):
         if self.request.method in permissions.SAFE_METHODS:
@@ -26,22 +43,103 @@ class CustomerViewSet(viewsets.ModelViewSet):
         return CustomerSerializer
 
     def get_queryset(self):
+        queryset = Customer.objects.select_related('user')
         if self.request.user.is_staff:
-            return Customer.objects.all()
-        return Customer.objects.filter(user_id=self.request.user.id)
+            return queryset
+        return queryset.filter(user_id=self.request.user.id)
 
+    @action(detail=False, methods=['post'], url_path='provision',
+            http_method_names=['post', 'options'],
+            permission_classes=[permissions.IsAdminUser])
+    def provision(self, request):
+        (stream, file_format) = get_import_stream(request)
+        if stream is None or file_format is None:
+            return import_format_error()
 
-class CategoryViewSet(viewsets.ModelViewSet):
+        try:
+            report = UserProvisioner().run(
+                stream, file_format,
+                max_rows=settings.STORE_PROVISIONING['MAX_ROWS'])
+        except ProvisioningError as error:
+            return Response(
+                {
+                    'message': str(error)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(report)
+
+
+class CategoryViewSet(ReplicaReadMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    cache_namespace = 'categories'
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsAdminOrReadOnly]
+    ordering = ('added_at', 'id')
 
 
-class ProductViewSet(viewsets.ModelViewSet):
-    queryset = Product.objects.all()
+class ProductViewSet(ReplicaReadMixin, CachedResponseMixin, viewsets.ModelViewSet):
+    cache_namespace = 'products'
     serializer_class = ProductSerializer
     permission_classes = [IsAdminOrReadOnly]
 
+    @property
+    def ordering(self):
+        if self.filters.get('search'):
+            return ('-rank', 'id')
+        return ('added_at', 'id')
+
+    def get_queryset(self):
+        queryset = Product.objects.defer('search_vector')
+        if self.action != 'list':
+            return queryset
+
+        filters = self.filters
+        if 'category' in filters:
+            queryset = queryset.filter(category_id=filters['category'])
+        if 'min_price' in filters:
+            queryset = queryset.filter(unit_price__gte=filters['min_price'])
+        if 'max_price' in filters:
+            queryset = queryset.filter(unit_price__lte=filters['max_price'])
+        if filters.get('search'):
+            queryset = search_products(queryset, filters['search'])
+        return queryset
+
+    @action(detail=False, methods=['post'], url_path='import',
+            permission_classes=[permissions.IsAdminUser])
+    def import_catalog(self, request):
+        (stream, file_format) = get_import_stream(request)
+        if stream is None or file_format is None:
+            return import_format_error()
+
+        return Response(CatalogImporter().run(stream, file_format))
+
+    @action(detail=False, methods=['get'], url_path='export',
+            permission_classes=[permissions.IsAdminUser])
+    def export_catalog(self, request):
+        file_format = request.query_params.get('type', CSV)
+        if file_format not in (CSV, NDJSON):
+            return Response(
+                {
+                    'message': 'type should be csv or ndjson.'
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        content_type = 'text/csv' if file_format == CSV else 'application/x-ndjson'
+        response = StreamingHttpResponse(
+            export_catalog(file_format), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="catalog.{file_format}"'
+        return response
+
+    @cached_property
+    def filters(self):
+        if self.action != 'list':
+            return {}
+        serializer = ProductFilterSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
 
 class ProductFileViewSet(
     mixins.ListModelMixin,
@@ -51,6 +149,7 @@ class ProductFileViewSet(
 
     http_method_names = ['get']
     serializer_class = ProductFileSerializer
+    pagination_class = None
 
     def get_serializer_context(self):
         return {'request': self.request}
@@ -60,11 +159,8 @@ class ProductFileViewSet(
         return ProductFile.objects.filter(product_id=product_id)
 
     def list(self, request, *args, **kwargs):
-        (orders, product_id) = prepere_files(self)
-
-        for order in orders:
-            if order.items.filter(product_id=product_id).count() > 0:
-                return super().list(request)
+        if prepere_files(self):
+            return super().list(request)
 
         return Response(
             {
@@ -74,18 +170,10 @@ class ProductFileViewSet(
         )
 
     def retrieve(self, request, *args, **kwargs):
-        (orders, product_id) = prepere_files(self)
-
-        for order in orders:
-            if order.items.filter(product_id=product_id).count() > 0:
-                instance = self.get_object()
-                file_handle = instance.file.open()
-
-                response = FileResponse(
-                    file_handle, content_type='application/pdf')
-                response['Content-Length'] = instance.file.size
-                response['Content-Disposition'] = f'attachment; filename="{uuid4()}.pdf"'
-                return response
+        if prepere_files(self):
+            return get_delivery_backend().serve(
+                request, self.get_object(),
+                Stamp(get_customer_id(request), None))
 
         return Response(
             {
@@ -94,10 +182,291 @@ class ProductFileViewSet(
             status=status.HTTP_403_FORBIDDEN
         )
 
+    @action(detail=True, methods=['post'], url_path='link',
+            http_method_names=['post', 'options'])
+    def link(self, request, *args, **kwargs):
+        if not prepere_files(self):
+            return Response(
+                {
+                    'message': "You don't have this product in your owned products."
+                },
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        (token, expires_at) = sign_download_link(
+            self.get_object(), get_customer_id(request))
+        return Response({
+            'url': request.build_absolute_uri(
+                reverse('signed-download', args=[token])),
+            'expires_at': expires_at
+        })
+
+
+class SignedDownloadView(APIView):
+    """
+    Sends the file a link from ProductFileViewSet.link names. Only the
+    signature of the link is checked, without the database, so this view
+    can run on its own servers or behind a CDN. Stamping a PDF looks the
+    buyer up once per process, as links do not carry their details.
+    """
+
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def get(self, request, token):
+        (productfile, stamp) = verify_download_link(token)
+        return get_delivery_backend().serve(request, productfile, stamp)
+
+
+class FileUploadViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet
+):
+    """
+    Resumable uploads of product files. POST creates an upload with the
+    file name and size, PATCH appends the bytes at `Upload-Offset` and
+    HEAD tells where to resume after a dropped connection.
+    """
+
+    http_method_names = ['get', 'head', 'post', 'patch', 'delete', 'options']
+    permission_classes = [permissions.IsAdminUser]
+    serializer_class = FileUploadSerializer
+    pagination_class = None
+
+    def get_queryset(self):
+        return FileUpload.objects.filter(product_id=self.kwargs['product_pk'])
+
+    def perform_create(self, serializer):
+        product = get_object_or_404(
+            Product.objects.only('id'), pk=self.kwargs['product_pk'])
+        serializer.save(product=product)
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response['Location'] = request.build_absolute_uri(
+            f'{request.path}{response.data["id"]}/')
+        return self.set_offset(response, response.data)
+
+    def retrieve(self, request, *args, **kwargs):
+        response = super().retrieve(request, *args, **kwargs)
+        response['Cache-Control'] = 'no-store'
+        return self.set_offset(response, response.data)
+
+    def partial_update(self, request, *args, **kwargs):
+        upload = self.get_object()
+        if request.content_type != 'application/offset+octet-stream':
+            return Response(
+                {
+                    'message': 'Content-Type should be application/offset+octet-stream.'
+                },
+                status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+            )
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers.get('Content-Length') or 0)
+        except (KeyError, ValueError):
+            return Response(
+                {
+                    'message': 'Upload-Offset header is required.'
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            upload = append_chunk(
+                upload,
+                request.stream or BytesIO(),
+                offset,
+                length,
+                parse_checksum(request.headers.get('Upload-Checksum'))
+            )
+        except OffsetMismatch as error:
+            return Response(
+                {'message': str(error)}, status=status.HTTP_409_CONFLICT)
+        except UploadError as error:
+            return Response(
+                {'message': str(error)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if upload.product_file is None:
+            response = Response(status=status.HTTP_204_NO_CONTENT)
+        else:
+            response = Response(
+                ProductFileSerializer(
+                    upload.product_file, context={'request': request}).data,
+                status=status.HTTP_201_CREATED
+            )
+        response['Upload-Offset'] = upload.offset
+        return response
+
+    def perform_destroy(self, instance):
+        delete_upload(instance)
+
+    def set_offset(self, response, data):
+        response['Upload-Offset'] = data['offset']
+        response['Upload-Length'] = data['size']
+        return response
+
+
+class OrderViewSet(
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet
+):
+    permission_classes = [permissions.IsAuthenticated]
+    ordering = ('-placed_at', '-id')
+
+    def get_serializer_class(self):
+        if self.request.method == 'POST':
+            return CheckoutSerializer
+        return OrderSerializer
+
+    def get_queryset(self):
+        return Order.objects.filter(
+            customer_id=get_customer_id(self.request)
+        ).prefetch_related('items')
+
+    def create(self, request, *args, **kwargs):
+        customer_id = get_customer_id(request)
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if idempotency_key is not None and not 0 < len(idempotency_key) <= 64:
+            return Response(
+                {
+                    'message': 'Idempotency-Key should be 1 to 64 characters.'
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        order = None
+        if idempotency_key is not None:
+            order = Order.objects.filter(
+                customer_id=customer_id, idempotency_key=idempotency_key).first()
+        if order is None:
+            serializer = CheckoutSerializer(
+                data=request.data,
+                context={
+                    'customer_id': customer_id,
+                    'idempotency_key': idempotency_key
+                }
+            )
+            serializer.is_valid(raise_exception=True)
+            order = serializer.save()
+            replayed = serializer.replayed
+        else:
+            replayed = True
+        if replayed and order.idempotency_hash and \
+                order.idempotency_hash != hash_checkout(request.data):
+            return Response(
+                {
+                    'message': 'Idempotency-Key was used with a different body.'
+                },
+                status=status.HTTP_422_UNPROCESSABLE_ENTITY
+            )
+
+        order = Order.objects.prefetch_related('items').get(pk=order.pk)
+        response = Response(
+            OrderSerializer(order).data,
+            status=status.HTTP_200_OK if replayed else status.HTTP_201_CREATED
+        )
+        if replayed:
+            response['Idempotent-Replayed'] = 'true'
+        return response
+
+
+class SalesView(ReplicaReadMixin, APIView):
+    """
+    Daily sales totals, read from the summary tables kept up to date as
+    orders complete or get canceled.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    model = DailySales
+    dimension = None
+
+    def get(self, request):
+        serializer = SalesFilterSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        filters = serializer.validated_data
+
+        queryset = self.model.objects.all()
+        if 'start' in filters:
+            queryset = queryset.filter(day__gte=filters['start'])
+        if 'end' in filters:
+            queryset = queryset.filter(day__lte=filters['end'])
+
+        if self.dimension is None:
+            rows = queryset.order_by('day').values(
+                'day', 'revenue', 'units', 'orders')
+        elif self.dimension in filters:
+            # One row per day for a single product or category.
+            rows = queryset.filter(**{
+                f'{self.dimension}_id': filters[self.dimension]
+            }).order_by('day').values('day', 'revenue', 'units', 'orders')
+        else:
+            key = f'{self.dimension}_id'
+            rows = [
+                {'id': row.pop(key), **row}
+                for row in
+                queryset
+                .values(key, title=F(f'{self.dimension}__title'))
+                .annotate(
+                    revenue=Sum('revenue'),
+                    units=Sum('units'),
+                    orders=Sum('orders')
+                )
+                .order_by('-revenue', key)[:filters['limit']]
+            ]
+        return Response(SalesSerializer(rows, many=True).data)
+
+
+class ProductSalesView(SalesView):
+    model = ProductSales
+    dimension = 'product'
+
+
+class CategorySalesView(SalesView):
+    model = CategorySales
+    dimension = 'category'
+
+
+class ResponseCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(get_stats())
+
+
+def get_import_stream(request):
+    upload = request.FILES.get('file') if request.content_type.startswith(
+        'multipart/form-data') else None
+    if upload is not None:
+        return (upload, get_format(upload.content_type, upload.name))
+    return (request.stream, get_format(request.content_type))
+
+
+def import_format_error():
+    return Response(
+        {
+            'message': 'Send a CSV or NDJSON body, or a multipart "file".'
+        },
+        status=status.HTTP_400_BAD_REQUEST
+    )
+
+
+def get_customer_id(request):
+    customer_id = getattr(request.user, 'customer_id', None)
+    if customer_id is not None:
+        return customer_id
+    # Tokens carry the id; other logins look it up once per request.
+    if not hasattr(request, '_customer_id'):
+        request._customer_id = Customer.objects.values_list(
+            'id', flat=True).get(user_id=request.user.id)
+    return request._customer_id
+
 
 def prepere_files(self):
     product_id = self.kwargs['product_pk']
-    get_object_or_404(Product, pk=product_id)
-    user = self.request.user
-    customer = Customer.objects.get(user=user)
-    return (Order.objects.filter(customer_id=customer.id, order_status='C'), product_id)
+    get_object_or_404(Product.objects.only('id'), pk=product_id)
+    return owns_product(get_customer_id(self.request), product_id)
@@ -0,0 +1,705 @@
+import re
+import threading
+import zlib
+from collections import OrderedDict, namedtuple
+from django.conf import settings
+from .metadata import PDF_CONTENT_TYPE, PDF_HEADER
+from .models import Customer
+
+FONT_SIZE = 7
+STAMP_WIDTH = 432
+STAMP_HEIGHT = 10
+MARGIN = 18
+# Helvetica is about this wide per point of font size on average.
+CHARACTER_WIDTH = 0.55
+DEFAULT_BOX = (0.0, 0.0, 612.0, 792.0)
+WINDOW = 4096
+MISSING = object()
+# Printed (4), and not movable or deletable in viewers (128).
+ANNOTATION = (b'<</Type /Annot /Subtype /Watermark /Rect [%.2f %.2f %.2f %.2f] '
+              b'/F 132 /P %d %d R /AP <</N %d 0 R>>>>')
+
+SPACE = re.compile(rb'(?:[\x00\t\n\x0c\r ]+|%[^\r\n]*)*')
+REGULAR = rb'[^\x00\t\n\x0c\r ()<>\[\]{}/%]'
+NAME = re.compile(rb'/(' + REGULAR + rb'*)')
+NAME_ESCAPE = re.compile(rb'#([0-9A-Fa-f]{2})')
+SAFE_NAME = re.compile(r'[!"$&\'*-.0-;=?-Z\\^-z|~]*')
+REF = re.compile(rb'(\d+)\s+(\d+)\s+R(?!' + REGULAR + rb')')
+NUMBER = re.compile(rb'[+-]?(?:\d+(?:\.\d*)?|\.\d+)')
+KEYWORD = re.compile(REGULAR + rb'+')
+KEYWORDS = {b'true': True, b'false': False, b'null': None}
+STRING_PART = re.compile(rb'[()\\]')
+OBJECT_HEADER = re.compile(rb'(\d+)\s+(\d+)\s+obj')
+STARTXREF = re.compile(rb'startxref\s+(\d+)')
+XREF_SUBSECTION = re.compile(rb'(\d+)\s+(\d+)[ \t]*[\r\n]+')
+XREF_ENTRY = re.compile(rb'(\d{10})\s(\d{5})\s([nf])[\x00\t\n\x0c\r ]*')
+
+Stamp = namedtuple('Stamp', ['customer_id', 'text'])
+Ref = namedtuple('Ref', ['num', 'gen'])
+Template = namedtuple('Template', [
+    'body', 'offsets', 'appearance', 'xref_num', 'size', 'trailer',
+    'startxref', 'xref_stream', 'file_size'])
+
+
+class UnsupportedPDF(Exception):
+    pass
+
+
+class Truncated(UnsupportedPDF):
+    pass
+
+
+class Name(str):
+    pass
+
+
+class Token(bytes):
+    """
+    A number or string, kept as written.
+    """
+
+
+def parse(data, pos):
+    """
+    Returns the object at `data[pos:]` and where it ends. Dictionaries
+    become dicts keyed by Name and arrays lists.
+    """
+    pos = SPACE.match(data, pos).end()
+    if pos >= len(data):
+        raise Truncated()
+    char = data[pos:pos + 1]
+    if char == b'/':
+        match = NAME.match(data, pos)
+        return (Name(NAME_ESCAPE.sub(
+            lambda escape: bytes([int(escape.group(1), 16)]),
+            match.group(1)).decode('latin-1')), match.end())
+    if char == b'<':
+        if data.startswith(b'<<', pos):
+            return parse_dict(data, pos + 2)
+        end = data.find(b'>', pos)
+        if end < 0:
+            raise Truncated()
+        return (Token(data[pos:end + 1]), end + 1)
+    if char == b'[':
+        items = []
+        pos += 1
+        while True:
+            pos = SPACE.match(data, pos).end()
+            if pos >= len(data):
+                raise Truncated()
+            if data[pos:pos + 1] == b']':
+                return (items, pos + 1)
+            (item, pos) = parse(data, pos)
+            items.append(item)
+    if char == b'(':
+        return parse_string(data, pos)
+    match = REF.match(data, pos)
+    if match:
+        return (Ref(int(match.group(1)), int(match.group(2))), match.end())
+    match = NUMBER.match(data, pos)
+    if match:
+        return (Token(match.group()), match.end())
+    match = KEYWORD.match(data, pos)
+    if match and match.group() in KEYWORDS:
+        return (KEYWORDS[match.group()], match.end())
+    raise UnsupportedPDF(f'Unexpected {data[pos:pos + 16]!r}.')
+
+
+def parse_dict(data, pos):
+    result = {}
+    while True:
+        pos = SPACE.match(data, pos).end()
+        if data.startswith(b'>>', pos):
+            return (result, pos + 2)
+        (key, pos) = parse(data, pos)
+        if not isinstance(key, Name):
+            raise UnsupportedPDF('Dictionary key is not a name.')
+        (result[key], pos) = parse(data, pos)
+
+
+def parse_string(data, start):
+    depth = 0
+    pos = start
+    while True:
+        match = STRING_PART.search(data, pos)
+        if match is None:
+            raise Truncated()
+        pos = match.end()
+        if match.group() == b'\\':
+            pos += 1
+        elif match.group() == b'(':
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return (Token(data[start:pos]), pos)
+
+
+def serialize_name(name):
+    if SAFE_NAME.fullmatch(name):
+        return b'/' + name.encode('ascii')
+    return b'/' + b''.join(
+        bytes([char]) if 0x21 <= char <= 0x7e and char not in b'#()<>[]{}/%'
+        else b'#%02X' % char
+        for char in name.encode('latin-1'))
+
+
+def serialize(value):
+    if isinstance(value, Token):
+        return bytes(value)
+    if isinstance(value, Name):
+        return serialize_name(value)
+    if isinstance(value, Ref):
+        return b'%d %d R' % value
+    if isinstance(value, dict):
+        return b'<<' + b' '.join(
+            serialize_name(key) + b' ' + serialize(item)
+            for (key, item) in value.items()) + b'>>'
+    if isinstance(value, list):
+        return b'[' + b' '.join(serialize(item) for item in value) + b']'
+    if isinstance(value, bool):
+        return b'true' if value else b'false'
+    if value is None:
+        return b'null'
+    if isinstance(value, int):
+        return b'%d' % value
+    return b'%.2f' % value
+
+
+def decode(stream_dict, data):
+    filters = stream_dict.get('Filter')
+    params = stream_dict.get('DecodeParms')
+    if filters is None:
+        return data
+    if isinstance(filters, list):
+        if len(filters) != 1:
+            raise UnsupportedPDF('Chained stream filters.')
+        (filters, params) = (filters[0], params[0] if params else None)
+    if filters != 'FlateDecode':
+        raise UnsupportedPDF(f'Stream filter {filters}.')
+    try:
+        data = zlib.decompressobj().decompress(data)
+    except zlib.error:
+        raise UnsupportedPDF('Broken stream.')
+    predictor = int(params.get('Predictor', 1)) if params else 1
+    if predictor >= 10:
+        return unpredict(data, int(params.get('Columns', 1)))
+    if predictor != 1:
+        raise UnsupportedPDF(f'Predictor {predictor}.')
+    return data
+
+
+def unpredict(data, columns):
+    """
+    Undoes the PNG predictors of a stream of `columns` bytes wide rows.
+    """
+    rows = []
+    previous = bytes(columns)
+    for pos in range(0, len(data) - columns, columns + 1):
+        kind = data[pos]
+        row = bytearray(data[pos + 1:pos + 1 + columns])
+        for index in range(len(row)):
+            left = row[index - 1] if index else 0
+            up = previous[index]
+            if kind == 1:
+                row[index] = (row[index] + left) & 0xff
+            elif kind == 2:
+                row[index] = (row[index] + up) & 0xff
+            elif kind == 3:
+                row[index] = (row[index] + (left + up) // 2) & 0xff
+            elif kind == 4:
+                up_left = previous[index - 1] if index else 0
+                estimate = left + up - up_left
+                (a, b, c) = (abs(estimate - left), abs(estimate - up),
+                             abs(estimate - up_left))
+                nearest = left if a <= b and a <= c else up if b <= c else up_left
+                row[index] = (row[index] + nearest) & 0xff
+        rows.append(bytes(row))
+        previous = row
+    return b''.join(rows)
+
+
+class PDFReader:
+    """
+    Finds objects of a PDF by its cross-reference sections, reading only
+    the parts of the file it needs. Supports xref tables and streams and
+    objects in object streams, but not encrypted files.
+    """
+
+    def __init__(self, file_handle, size):
+        self.file = file_handle
+        self.size = size
+        self.entries = {}
+        self.objects = {}
+        self.object_streams = {}
+        self.load_xref()
+
+    def read(self, offset, length):
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def read_parsed(self, offset, parser):
+        """
+        Returns `parser(data)` on the bytes from `offset`, reading more of
+        the file while it raises Truncated.
+        """
+        window = WINDOW
+        while True:
+            data = self.read(offset, window)
+            try:
+                return parser(data)
+            except Truncated:
+                if len(data) < window:
+                    raise UnsupportedPDF('Unexpected end of file.')
+                window *= 4
+
+    def parse_indirect(self, data):
+        """
+        Returns the number and value of the object at the start of `data`
+        and where its stream data starts, if it has any.
+        """
+        match = OBJECT_HEADER.match(data, SPACE.match(data).end())
+        if match is None:
+            raise UnsupportedPDF('No object at offset.')
+        (value, pos) = parse(data, match.end())
+        pos = SPACE.match(data, pos).end()
+        if data.startswith(b'stream', pos):
+            pos += len(b'stream')
+            if data.startswith(b'\r\n', pos):
+                pos += 2
+            elif data[pos:pos + 1] in (b'\n', b'\r'):
+                pos += 1
+            return (int(match.group(1)), value, pos)
+        if not data.startswith(b'endobj', pos) and len(data) - pos < 6:
+            raise Truncated()
+        return (int(match.group(1)), value, None)
+
+    def load_xref(self):
+        tail = self.read(max(self.size - 1024, 0), 1024)
+        matches = list(STARTXREF.finditer(tail))
+        if not matches:
+            raise UnsupportedPDF('No startxref.')
+        self.startxref = int(matches[-1].group(1))
+        self.trailer = None
+        offset = self.startxref
+        seen = set()
+        while offset is not None:
+            if offset in seen or offset >= self.size:
+                raise UnsupportedPDF('Broken xref chain.')
+            seen.add(offset)
+            is_table = self.read(offset, 32).lstrip().startswith(b'xref')
+            if is_table:
+                trailer = self.load_xref_table(offset)
+                if trailer.get('XRefStm') is not None:
+                    self.load_xref_stream(int(trailer['XRefStm']))
+            else:
+                trailer = self.load_xref_stream(offset)
+            if self.trailer is None:
+                (self.trailer, self.xref_stream) = (trailer, not is_table)
+            offset = trailer.get('Prev')
+            offset = None if offset is None else int(offset)
+        if 'Encrypt' in self.trailer:
+            raise UnsupportedPDF('Encrypted.')
+
+    def add_entries(self, entries):
+        # Sections are read newest first, so the first entry for an object
+        # is its current one.
+        for (num, entry) in entries.items():
+            self.entries.setdefault(num, entry)
+
+    def load_xref_table(self, offset):
+        def parse_table(data):
+            entries = {}
+            pos = SPACE.match(data, data.index(b'xref') + 4).end()
+            while not data.startswith(b'trailer', pos):
+                match = XREF_SUBSECTION.match(data, pos)
+                if match is None:
+                    raise Truncated() if len(data) - pos < 64 else \
+                        UnsupportedPDF('Broken xref table.')
+                pos = match.end()
+                (first, count) = (int(match.group(1)), int(match.group(2)))
+                for num in range(first, first + count):
+                    entry = XREF_ENTRY.match(data, pos)
+                    if entry is None:
+                        raise Truncated() if len(data) - pos < 64 else \
+                            UnsupportedPDF('Broken xref table.')
+                    pos = entry.end()
+                    entries[num] = (1, int(entry.group(1)), int(
+                        entry.group(2))) if entry.group(3) == b'n' else None
+            (trailer, _) = parse(data, pos + len(b'trailer'))
+            return (entries, trailer)
+
+        (entries, trailer) = self.read_parsed(offset, parse_table)
+        self.add_entries(entries)
+        return trailer
+
+    def load_xref_stream(self, offset):
+        (_, stream_dict, start) = self.read_parsed(offset, self.parse_indirect)
+        if stream_dict.get('Type') != 'XRef' or start is None:
+            raise UnsupportedPDF('No xref at offset.')
+        data = self.stream_data(stream_dict, offset + start)
+        widths = [int(width) for width in stream_dict['W']]
+        index = [int(number) for number in
+                 stream_dict.get('Index', [0, stream_dict['Size']])]
+        row_size = sum(widths)
+        entries = {}
+        pos = 0
+        for (first, count) in zip(index[::2], index[1::2]):
+            for num in range(first, first + count):
+                row = data[pos:pos + row_size]
+                if len(row) < row_size:
+                    raise UnsupportedPDF('Broken xref stream.')
+                pos += row_size
+                fields = []
+                start = 0
+                for width in widths:
+                    fields.append(int.from_bytes(row[start:start + width], 'big'))
+                    start += width
+                kind = fields[0] if widths[0] else 1
+                entries[num] = (kind, fields[1], fields[2]) \
+                    if kind in (1, 2) else None
+        self.add_entries(entries)
+        return stream_dict
+
+    def stream_data(self, stream_dict, start):
+        length = self.resolve(stream_dict.get('Length'))
+        return decode(stream_dict, self.read(start, int(length)))
+
+    def object_stream(self, num):
+        if num not in self.object_streams:
+            entry = self.entries.get(num)
+            if entry is None or entry[0] != 1:
+                raise UnsupportedPDF('Missing object stream.')
+            (_, stream_dict, start) = self.read_parsed(
+                entry[1], self.parse_indirect)
+            data = self.stream_data(stream_dict, entry[1] + start)
+            first = int(stream_dict['First'])
+            header = data[:first].split()
+            self.object_streams[num] = (
+                data,
+                [first + int(offset) for offset in
+                 header[1::2][:int(stream_dict['N'])]]
+            )
+        return self.object_streams[num]
+
+    def get(self, num):
+        if num not in self.objects:
+            entry = self.entries.get(num)
+            if entry is None:
+                value = None
+            elif entry[0] == 1:
+                (found, value, _) = self.read_parsed(
+                    entry[1], self.parse_indirect)
+                if found != num:
+                    raise UnsupportedPDF(f'Object {num} is not at its offset.')
+            else:
+                (data, offsets) = self.object_stream(entry[1])
+                if entry[2] >= len(offsets):
+                    raise UnsupportedPDF(f'Object {num} is missing.')
+                (value, _) = parse(data, offsets[entry[2]])
+            self.objects[num] = value
+        return self.objects[num]
+
+    def get_generation(self, num):
+        entry = self.entries.get(num)
+        return entry[2] if entry is not None and entry[0] == 1 else 0
+
+    def resolve(self, value):
+        for _ in range(32):
+            if not isinstance(value, Ref):
+                return value
+            value = self.get(value.num)
+        raise UnsupportedPDF('Reference loop.')
+
+    def get_box(self, value):
+        value = self.resolve(value)
+        if not isinstance(value, list) or len(value) != 4:
+            return DEFAULT_BOX
+        (x1, y1, x2, y2) = [float(self.resolve(number)) for number in value]
+        return (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+
+    def pages(self):
+        """
+        Returns the reference, dictionary and visible box of every page,
+        in order.
+        """
+        catalog = self.resolve(self.trailer.get('Root'))
+        root = catalog.get('Pages') if isinstance(catalog, dict) else None
+        pages = []
+        seen = set()
+        stack = [(root, None, None)]
+        while stack:
+            (ref, media_box, crop_box) = stack.pop()
+            if not isinstance(ref, Ref) or ref.num in seen:
+                raise UnsupportedPDF('Broken page tree.')
+            seen.add(ref.num)
+            node = self.get(ref.num)
+            if not isinstance(node, dict):
+                raise UnsupportedPDF('Broken page tree.')
+            media_box = node.get('MediaBox', media_box)
+            crop_box = node.get('CropBox', crop_box)
+            if node.get('Type') == 'Page' or 'Kids' not in node:
+                pages.append((ref, node, self.get_box(crop_box or media_box)))
+                continue
+            kids = self.resolve(node['Kids'])
+            stack.extend((kid, media_box, crop_box) for kid in reversed(kids))
+        return pages
+
+
+def build_template(file_handle, file_size):
+    """
+    Returns the parts of the incremental update stamping every page of a
+    PDF that do not depend on the text: a watermark annotation per page,
+    the pages (or their /Annots arrays) updated to list it, and where the
+    shared appearance stream with the text goes.
+    """
+    reader = PDFReader(file_handle, file_size)
+    pages = reader.pages()
+    next_num = max(int(reader.trailer.get('Size', 0)),
+                   max(reader.entries, default=0) + 1)
+    (appearance, xref_num) = (next_num, next_num + 1)
+    next_num += 2
+
+    body = [] if reader.read(file_size - 1, 1) in (b'\n', b'\r') else [b'\n']
+    offsets = []
+    length = len(b''.join(body))
+
+    def add(num, gen, value):
+        nonlocal length
+        offsets.append((num, gen, length))
+        if not isinstance(value, bytes):
+            value = serialize(value)
+        body.append(b'%d %d obj\n%s\nendobj\n' % (num, gen, value))
+        length += len(body[-1])
+
+    arrays = {}
+    for (ref, page, box) in pages:
+        annotation = Ref(next_num, 0)
+        next_num += 1
+        (left, bottom) = (box[0] + MARGIN, box[1] + MARGIN)
+        add(annotation.num, 0, ANNOTATION % (
+            left, bottom, left + STAMP_WIDTH, bottom + STAMP_HEIGHT,
+            ref.num, ref.gen, appearance))
+        annotations = page.get('Annots')
+        if isinstance(annotations, Ref):
+            if annotations.num not in arrays:
+                existing = reader.get(annotations.num)
+                arrays[annotations.num] = (
+                    reader.get_generation(annotations.num),
+                    list(existing) if isinstance(existing, list) else [])
+            arrays[annotations.num][1].append(annotation)
+        else:
+            add(ref.num, ref.gen, {**page, Name('Annots'): (
+                annotations if isinstance(annotations, list) else []
+            ) + [annotation]})
+    for (num, (gen, items)) in arrays.items():
+        add(num, gen, items)
+
+    return Template(
+        body=b''.join(body),
+        offsets=offsets,
+        appearance=appearance,
+        xref_num=xref_num,
+        size=next_num,
+        trailer={key: reader.trailer[key] for key in ('Root', 'Info', 'ID')
+                 if key in reader.trailer},
+        startxref=reader.startxref,
+        xref_stream=reader.xref_stream,
+        file_size=file_size
+    )
+
+
+def pdf_string(text):
+    max_length = int(STAMP_WIDTH / (FONT_SIZE * CHARACTER_WIDTH))
+    if len(text) > max_length:
+        text = text[:max_length - 3] + '...'
+    encoded = text.encode('cp1252', errors='replace')
+    return b'(' + encoded.replace(b'\\', b'\\\\').replace(
+        b'(', b'\\(').replace(b')', b'\\)').replace(b'\r', b'\\r') + b')'
+
+
+def appearance_object(num, text):
+    content = b'q 0.5 g BT /F1 %d Tf 2 2 Td %s Tj ET Q' % (
+        FONT_SIZE, pdf_string(text))
+    stream_dict = {
+        Name('Type'): Name('XObject'),
+        Name('Subtype'): Name('Form'),
+        Name('BBox'): [0, 0, STAMP_WIDTH, STAMP_HEIGHT],
+        Name('Resources'): {Name('Font'): {Name('F1'): {
+            Name('Type'): Name('Font'),
+            Name('Subtype'): Name('Type1'),
+            Name('BaseFont'): Name('Helvetica'),
+            Name('Encoding'): Name('WinAnsiEncoding'),
+        }}},
+        Name('Length'): len(content),
+    }
+    return b'%d 0 obj\n%s\nstream\n%s\nendstream\nendobj\n' % (
+        num, serialize(stream_dict), content)
+
+
+def subsections(offsets):
+    groups = []
+    for entry in offsets:
+        if groups and entry[0] == groups[-1][-1][0] + 1:
+            groups[-1].append(entry)
+        else:
+            groups.append([entry])
+    return groups
+
+
+def xref_section(template, offsets, xref_offset):
+    trailer = {**template.trailer, Name('Size'): template.size,
+               Name('Prev'): template.startxref}
+    if not template.xref_stream:
+        # Object 0 heads the free list; some readers expect each table to
+        # list it.
+        lines = [b'xref\n0 1\n0000000000 65535 f\r\n']
+        for group in subsections(sorted(offsets)):
+            lines.append(b'%d %d\n' % (group[0][0], len(group)))
+            lines.extend(b'%010d %05d n\r\n' % (offset, gen)
+                         for (_, gen, offset) in group)
+        return b''.join(lines) + b'trailer\n' + serialize(trailer) + b'\n'
+
+    # Files indexed by an xref stream are updated with one, which lists
+    # itself.
+    offsets = sorted(offsets + [(template.xref_num, 0, xref_offset)])
+    width = max(4, (xref_offset.bit_length() + 7) // 8)
+    rows = b''.join(
+        b'\x01' + offset.to_bytes(width, 'big') + gen.to_bytes(2, 'big')
+        for (_, gen, offset) in offsets)
+    index = []
+    for group in subsections(offsets):
+        index.extend([group[0][0], len(group)])
+    stream_dict = {
+        **trailer,
+        Name('Type'): Name('XRef'),
+        Name('W'): [1, width, 2],
+        Name('Index'): index,
+        Name('Length'): len(rows),
+    }
+    return b'%d 0 obj\n%s\nstream\n%s\nendstream\nendobj\n' % (
+        template.xref_num, serialize(stream_dict), rows)
+
+
+def render(template, text):
+    """
+    Returns the incremental update that stamps `text` on every page of the
+    file `template` was built from, to be appended to it.
+    """
+    base = template.file_size
+    appearance = appearance_object(template.appearance, text)
+    offsets = [(num, gen, base + offset)
+               for (num, gen, offset) in template.offsets]
+    offsets.append((template.appearance, 0, base + len(template.body)))
+    xref_offset = base + len(template.body) + len(appearance)
+    return b''.join([
+        template.body,
+        appearance,
+        xref_section(template, offsets, xref_offset),
+        b'startxref\n%d\n%%%%EOF\n' % xref_offset
+    ])
+
+
+class LRUCache:
+    """
+    Keeps values until their sizes add up to more than `max_size` bytes,
+    then drops the least recently used ones.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def set(self, key, value, size):
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            if size > self.max_size:
+                return
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_size:
+                (_, (_, dropped)) = self.entries.popitem(last=False)
+                self.size -= dropped
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+cache = LRUCache(settings.STORE_WATERMARKS['CACHE_SIZE'])
+
+
+def get_stamp_text(customer_id):
+    user = Customer.objects.filter(pk=customer_id).values(
+        'user__username', 'user__first_name', 'user__last_name',
+        'user__email').first() or {}
+    name = ' '.join(filter(None, [
+        user.get('user__first_name'), user.get('user__last_name')]))
+    return settings.STORE_WATERMARKS['TEXT'].format(
+        name=name or user.get('user__username', ''),
+        email=user.get('user__email', ''))
+
+
+def load_template(productfile):
+    storage = productfile.file.storage
+    name = productfile.file.name
+    size = productfile.size
+    if size is None:
+        size = storage.size(name)
+    try:
+        with storage.open(name, 'rb') as file_handle:
+            if file_handle.read(len(PDF_HEADER)) != PDF_HEADER:
+                return None
+            return build_template(file_handle, size)
+    except (UnsupportedPDF, ValueError, TypeError, KeyError,
+            AttributeError, IndexError):
+        return None
+
+
+def is_stampable(productfile):
+    return settings.STORE_WATERMARKS['ENABLED'] and (
+        productfile.content_type or PDF_CONTENT_TYPE) == PDF_CONTENT_TYPE
+
+
+def get_watermark(productfile, stamp):
+    """
+    Returns the bytes to append to `productfile` to stamp it with the text
+    of `stamp` (looked up from its customer when None), or b'' when it is
+    not a PDF that can be stamped. Those are sent as stored.
+
+    The page layout of each file and the result for each customer and file
+    are cached, so a file is only parsed on its first download.
+    """
+    if not is_stampable(productfile):
+        return b''
+    key = productfile.sha256 or productfile.file.name
+    watermark = cache.get(('stamped', stamp.customer_id, key))
+    if watermark is not None:
+        return watermark
+
+    template = cache.get(('template', key), MISSING)
+    if template is MISSING:
+        template = load_template(productfile)
+        cache.set(('template', key), template, 64 if template is None else
+                  len(template.body) + 64 * len(template.offsets))
+    if template is None:
+        watermark = b''
+    else:
+        text = stamp.text
+        if text is None:
+            text = get_stamp_text(stamp.customer_id)
+        watermark = render(template, text)
+    cache.set(('stamped', stamp.customer_id, key), watermark,
+              len(watermark) + 64)
+    return watermark